@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+""" generate_corpus.py
+
+    Generates synthetic ical and vcard files for benchmarking the scripts"""
+#
+#    Copyright (C) 2014-2020 Georg Lutz <georg AT NOSPAM georglutz DOT de>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import base64
+import datetime
+import logging
+import random
+import sys
+
+# Flavours of the generated files:
+#  egw: egroupware exports, vcard 2.1 with quoted printable notes using the
+#       "=0D=0A=" soft line breaks, "TEL;CELL;WORK", empty "ORG:;;", ...
+#  jpilot: jpilot exports, vcard 3.0 with email addresses as "TEL;TYPE=email"
+#          and the birthday in the note, whole day events without DTEND,
+#          SUMMARY repeated in DESCRIPTION, ...
+FLAVOURS = ("egw", "jpilot")
+
+GIVEN_NAMES = ["Hans", "Paul", "Anna", "Maria", "Peter", "Klaus", "Sabine",
+               "Jürgen", "Petra", "Thomas", "Monika", "Stefan", "Ute"]
+FAMILY_NAMES = ["Mueller", "Meier", "Schmidt", "Schneider", "Fischer",
+                "Weber", "Müller", "Wagner", "Becker", "Hoffmann"]
+COMPANIES = ["ACME Corp", "Example GmbH", "Foo & Bar AG", ""]
+WORDS = ["meeting", "project", "review", "lunch", "call", "birthday",
+         "dentist", "soccer", "holiday", "release", "planning", "ärger"]
+FREQUENCIES = ["DAILY", "WEEKLY", "MONTHLY", "YEARLY"]
+
+
+def fold(line, limit=75):
+    '''Folds a line at limit characters (RFC5545 3.1) and returns the list
+       of physical lines'''
+    result = [line[:limit]]
+    line = line[limit:]
+    while line:
+        result.append(" " + line[:limit - 1])
+        line = line[limit - 1:]
+    return result
+
+
+def ascii_name(name):
+    '''Returns the name in lower case with umlauts replaced'''
+    return name.lower().replace("ä", "ae").replace("ö", "oe").replace("ü", "ue")
+
+
+def quoted_printable_note(rand):
+    '''Returns a multiline note encoded the way egroupware does it: each
+       line break is encoded as "=0D=0A" and followed by a soft line break'''
+    lines = [" ".join(rand.choice(WORDS) for _ in range(rand.randint(3, 12)))
+             for _ in range(rand.randint(1, 4))]
+    encoded = []
+    for line in lines:
+        encoded.append("".join(
+            "=%02X" % byte if byte > 126 or byte == 61 else chr(byte)
+            for byte in line.encode("utf-8")))
+    result = [line + "=0D=0A=" for line in encoded[:-1]] + encoded[-1:]
+    result[0] = "NOTE;ENCODING=QUOTED-PRINTABLE:" + result[0]
+    return result
+
+
+def photo(rand, size):
+    '''Returns the folded lines of a base64 encoded PHOTO property'''
+    data = bytes(rand.getrandbits(8) for _ in range(size))
+    return fold("PHOTO;ENCODING=BASE64;TYPE=JPEG:" +
+                base64.b64encode(data).decode("ascii"))
+
+
+def generate_vcard(rand, index, flavour, photo_rate, photo_size):
+    '''Returns the lines of one vcard entry including BEGIN and END'''
+    given = rand.choice(GIVEN_NAMES)
+    family = rand.choice(FAMILY_NAMES)
+    company = rand.choice(COMPANIES)
+    mail = "%s.%s%d@example.com" % (ascii_name(given), ascii_name(family),
+                                     index)
+    lines = ["BEGIN:VCARD"]
+    if flavour == "egw":
+        lines.append("VERSION:2.1")
+        lines.append("UID:egw-contact-%d" % (index))
+        lines.append("N:%s;%s;;;" % (family, given))
+        lines.append("FN:%s %s" % (given, family))
+        lines.append("ORG:%s;;" % (company))
+        lines.append("TEL;CELL;WORK:+49 (171) %07d" % (rand.randint(0, 9999999)))
+        lines.append("TEL;HOME:089/%06d" % (rand.randint(0, 999999)))
+        for _ in range(rand.randint(0, 3)):
+            lines.append("TEL;WORK:+49 89 %d-%d" % (
+                rand.randint(100, 999), rand.randint(0, 99)))
+        lines.append("EMAIL;WORK:" + mail)
+        if rand.random() < 0.5:
+            lines.append("EMAIL;HOME:%s@home.example.org" % (ascii_name(given)))
+        lines.append("URL;WORK:http://www.example.com/%d" % (index))
+        if rand.random() < 0.3:
+            lines.append("BDAY:19%02d-%02d-%02d" % (
+                rand.randint(40, 99), rand.randint(1, 12), rand.randint(1, 28)))
+        lines.extend(quoted_printable_note(rand))
+    else:
+        lines.append("VERSION:3.0")
+        lines.append("N:%s;%s" % (family, given))
+        lines.append("FN:%s %s" % (given, family))
+        lines.append("TEL;TYPE=cell,pref:+49 171 / %07d" % (
+            rand.randint(0, 9999999)))
+        lines.append("TEL;TYPE=home:089 %06d" % (rand.randint(0, 999999)))
+        lines.append("TEL;TYPE=email:" + mail)
+        text = " ".join(rand.choice(WORDS) for _ in range(rand.randint(5, 40)))
+        if rand.random() < 0.5:
+            # jpilot appends user defined fields like the birthday to the note
+            lines.append("NOTE:Geburtstag:\\n")
+            lines.append(" 19%02d-%02d-%02d\\n" % (
+                rand.randint(40, 99), rand.randint(1, 12), rand.randint(1, 28)))
+            lines.extend(fold(" " + text))
+        else:
+            lines.extend(fold("NOTE:" + text))
+    if rand.random() < photo_rate:
+        lines.extend(photo(rand, photo_size))
+    lines.append("END:VCARD")
+    return lines
+
+
+def generate_vevent(rand, index, flavour, recurrence_rate):
+    '''Returns the lines of one VEVENT entry including BEGIN and END'''
+    start = datetime.datetime(2010, 1, 1) + datetime.timedelta(
+        days=rand.randint(0, 3650), hours=rand.randint(7, 19))
+    summary = " ".join(rand.choice(WORDS) for _ in range(rand.randint(1, 4)))
+    lines = ["BEGIN:VEVENT", "UID:%s-event-%d" % (flavour, index)]
+    lines.extend(fold("SUMMARY:" + summary.capitalize()))
+    whole_day = rand.random() < 0.3
+    if flavour == "jpilot":
+        lines.append("DESCRIPTION:" + summary.capitalize())
+        if whole_day:
+            lines.append("DTSTART;VALUE=DATE:" + start.strftime("%Y%m%d"))
+        else:
+            lines.append("DTSTART:" + start.strftime("%Y%m%dT%H%M%S"))
+            lines.append("DTEND:" + (start + datetime.timedelta(
+                hours=1)).strftime("%Y%m%dT%H%M%S"))
+    else:
+        text = " ".join(rand.choice(WORDS) for _ in range(rand.randint(5, 60)))
+        lines.extend(fold("DESCRIPTION:" + text))
+        lines.append("DTSTART;TZID=Europe/Berlin:" + start.strftime("%Y%m%dT%H%M%S"))
+        lines.append("DTEND;TZID=Europe/Berlin:" + (start + datetime.timedelta(
+            hours=1)).strftime("%Y%m%dT%H%M%S"))
+        modified = start - datetime.timedelta(minutes=rand.randint(0, 100000))
+        lines.append("LAST-MODIFIED:" + modified.strftime("%Y%m%dT%H%M%SZ"))
+        lines.append("SEQUENCE:%d" % (rand.randint(0, 3)))
+    if rand.random() < recurrence_rate:
+        until = start + datetime.timedelta(days=rand.randint(30, 1000))
+        lines.append("RRULE:FREQ=%s;UNTIL=%s" % (
+            rand.choice(FREQUENCIES), until.strftime("%Y%m%d")))
+    if flavour == "egw" and rand.random() < 0.2:
+        lines.extend(["BEGIN:VALARM", "ACTION:DISPLAY",
+                      "TRIGGER:-PT15M", "END:VALARM"])
+    lines.append("END:VEVENT")
+    return lines
+
+
+VTIMEZONE = [
+    "BEGIN:VTIMEZONE", "TZID:Europe/Berlin",
+    "BEGIN:DAYLIGHT", "TZOFFSETFROM:+0100", "TZOFFSETTO:+0200",
+    "DTSTART:19700329T020000", "RRULE:FREQ=YEARLY;BYDAY=-1SU;BYMONTH=3",
+    "END:DAYLIGHT",
+    "BEGIN:STANDARD", "TZOFFSETFROM:+0200", "TZOFFSETTO:+0100",
+    "DTSTART:19701025T030000", "RRULE:FREQ=YEARLY;BYDAY=-1SU;BYMONTH=10",
+    "END:STANDARD",
+    "END:VTIMEZONE"]
+
+
+def duplicate(rand, lines, index, flavour):
+    '''Returns a copy of an entry with a new UID, simulating a synchronization
+       gone wild'''
+    result = []
+    for line in lines:
+        if line.startswith("UID:"):
+            line = "UID:%s-duplicate-%d" % (flavour, index)
+        elif line.startswith("SEQUENCE:"):
+            line = "SEQUENCE:%d" % (rand.randint(0, 5))
+        result.append(line)
+    return result
+
+
+def generate(output, kind, count, flavour="egw", seed=0, duplicate_rate=0.0,
+             recurrence_rate=0.2, photo_rate=0.0, photo_size=4096,
+             lineending="\r\n"):
+    '''Writes count entries to the (text mode) file object output.
+
+       kind: "ics" or "vcf"
+       duplicate_rate: Fraction of entries which are copies of a previous
+                       entry with another UID'''
+    rand = random.Random(seed)
+    # Previous entries which can be duplicated. Only a window is kept so
+    # memory usage does not depend on count.
+    recent = []
+    if kind == "ics":
+        header = ["BEGIN:VCALENDAR", "VERSION:2.0",
+                  "PRODID:-//pimtools//generate_corpus//EN"]
+        if flavour == "egw":
+            header.extend(VTIMEZONE)
+        output.write(lineending.join(header) + lineending)
+    for index in range(count):
+        if recent and rand.random() < duplicate_rate:
+            lines = duplicate(rand, rand.choice(recent), index, flavour)
+        elif kind == "ics":
+            lines = generate_vevent(rand, index, flavour, recurrence_rate)
+        else:
+            lines = generate_vcard(rand, index, flavour, photo_rate,
+                                   photo_size)
+        if duplicate_rate > 0:
+            if len(recent) < 1000:
+                recent.append(lines)
+            else:
+                recent[rand.randrange(len(recent))] = lines
+        output.write(lineending.join(lines) + lineending)
+        if kind == "vcf" and flavour == "egw":
+            output.write(lineending)
+    if kind == "ics":
+        output.write("END:VCALENDAR" + lineending)
+
+
+def get_args():
+    '''Configures command line parser and returns parsed parameters'''
+    parser = argparse.ArgumentParser(
+        description="Generates synthetic ical or vcard files for benchmarks")
+    parser.add_argument(
+        "-d", "--debuglevel", dest="debuglevel", type=int, default=logging.WARNING,
+        help="""Sets numerical debug level, see library logging module.
+        Default is 30 (WARNING). Possible values are CRITICAL 50, ERROR 40
+        WARNING 30, INFO 20, DEBUG 10, NOTSET 0. All log messages with debuglevel
+        or above are printed. So to disable all output set debuglevel e.g. to 100.""")
+    parser.add_argument(
+        "-o", "--output_file", dest="output_file",
+        help="The output file. Default output is sent to STDOUT")
+    parser.add_argument(
+        "-f", "--flavour", dest="flavour", choices=FLAVOURS, default="egw",
+        help="The application whose export is simulated. Default is egw")
+    parser.add_argument(
+        "-s", "--seed", dest="seed", type=int, default=0,
+        help="Seed of the random generator. Default is 0")
+    parser.add_argument(
+        "--duplicates", dest="duplicate_rate", type=float, default=0.0,
+        help="Fraction of duplicated entries, e.g. 0.05. Default is 0")
+    parser.add_argument(
+        "--recurrences", dest="recurrence_rate", type=float, default=0.2,
+        help="Fraction of events with a recurrence rule. Default is 0.2")
+    parser.add_argument(
+        "--photos", dest="photo_rate", type=float, default=0.0,
+        help="Fraction of contacts with a base64 encoded photo. Default is 0")
+    parser.add_argument(
+        "--photo-size", dest="photo_size", type=int, default=4096,
+        help="Size of the photos in bytes. Default is 4096")
+    parser.add_argument(
+        "--lf", dest="lineending", action="store_const", const="\n",
+        default="\r\n",
+        help="Use \\n as line ending instead of \\r\\n")
+    parser.add_argument(
+        "kind", choices=("ics", "vcf"),
+        help="The kind of file to generate")
+    parser.add_argument(
+        "count", type=int,
+        help="Number of events or contacts")
+    return parser.parse_args()
+
+
+def main():
+    '''main function, called when script file is executed directly'''
+
+    args = get_args()
+
+    logging.basicConfig(format="%(message)s", level=args.debuglevel)
+
+    if not args.output_file:
+        output_file = sys.stdout
+    else:
+        try:
+            output_file = open(args.output_file, "w", encoding="utf-8",
+                               newline="")
+        except IOError:
+            logging.error("Cannot open output file for writing")
+            sys.exit(2)
+
+    generate(output_file, args.kind, args.count, args.flavour, args.seed,
+             args.duplicate_rate, args.recurrence_rate, args.photo_rate,
+             args.photo_size, args.lineending)
+    output_file.close()
+
+
+if __name__ == "__main__":
+    main()
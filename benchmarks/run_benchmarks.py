@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+""" run_benchmarks.py
+
+    Times the scripts on synthetic ical and vcard files of different sizes"""
+#
+#    Copyright (C) 2014-2020 Georg Lutz <georg AT NOSPAM georglutz DOT de>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import generate_corpus
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The synthetic input files: name -> parameters of generate_corpus.generate()
+CORPORA = {
+    "ics_egw": {"kind": "ics", "flavour": "egw", "duplicate_rate": 0.05},
+    "ics_jpilot": {"kind": "ics", "flavour": "jpilot"},
+    "vcf_egw": {"kind": "vcf", "flavour": "egw", "photo_rate": 0.05},
+    "vcf_jpilot": {"kind": "vcf", "flavour": "jpilot"},
+}
+
+# Benchmarks: (name, script, corpus, arguments). "{input}", "{outdir}" and
+# "{output}" in the arguments are replaced by the input file, an empty
+# directory and a file to throw away.
+BENCHMARKS = [
+    ("ical_split", "ical_split.py", "ics_egw",
+     ["{input}", "{outdir}"]),
+    ("ical_split --mmap", "ical_split.py", "ics_egw",
+     ["--mmap", "{input}", "{outdir}"]),
+    ("ical_split --archive", "ical_split.py", "ics_egw",
+     ["--archive", "{input}", "{outdir}/entries.tar"]),
+    ("vcf_split", "vcf_split.py", "vcf_egw",
+     ["{input}", "{outdir}"]),
+    ("vcf_split --mmap", "vcf_split.py", "vcf_egw",
+     ["--mmap", "{input}", "{outdir}"]),
+    ("ical_find_duplicates", "ical_find_duplicates.py", "ics_egw",
+     ["{input}"]),
+    ("ical_find_duplicates --mmap", "ical_find_duplicates.py", "ics_egw",
+     ["--mmap", "{input}"]),
+    ("ical_jpilot_to_egw", "ical_jpilot_to_egw.py", "ics_jpilot",
+     ["-o", "{output}", "{input}"]),
+    ("vcf_egw_to_gammu_nokia_2730", "vcf_egw_to_gammu_nokia_2730.py",
+     "vcf_egw", ["-o", "{output}", "{input}"]),
+    ("vcf_egw_to_muttalias", "vcf_egw_to_muttalias.py", "vcf_egw",
+     ["-o", "{output}", "{input}"]),
+    ("vcf_egw_to_owncloud", "vcf_egw_to_owncloud.py", "vcf_egw",
+     ["-o", "{output}", "{input}"]),
+    ("vcf_jpilot_to_android", "vcf_jpilot_to_android.py", "vcf_jpilot",
+     ["-o", "{output}", "{input}"]),
+    ("vcf_jpilot_to_gammu_nokia_2730", "vcf_jpilot_to_gammu_nokia_2730.py",
+     "vcf_jpilot", ["-b", "Geburtstag", "{input}"]),
+    ("vcf_find_duplicates", "vcf_find_duplicates.py", "vcf_egw",
+     ["{input}"]),
+]
+
+# Runs a benchmark command (argv[2:]) and writes its run time and peak RSS
+# to the file descriptor argv[1]. Linux keeps the peak RSS of a process
+# across exec, including the memory of the process it was forked from. So
+# the command is forked from this small process instead of the harness,
+# which holds the results and possibly large corpora in memory.
+RSS_WRAPPER = """import os, sys, time
+fd = int(sys.argv[1])
+start = time.perf_counter()
+pid = os.fork()
+if pid == 0:
+    try:
+        os.close(fd)
+        os.execv(sys.argv[2], sys.argv[2:])
+    finally:
+        os._exit(127)
+(_, status, rusage) = os.wait4(pid, 0)
+os.write(fd, ("%f %d" % (time.perf_counter() - start,
+                         rusage.ru_maxrss)).encode("ascii"))
+sys.exit(os.waitstatus_to_exitcode(status))
+"""
+
+
+def get_corpus(workdir, corpus, count):
+    '''Returns the path of the given corpus with count entries. The file is
+       generated if it does not exist yet.'''
+    params = CORPORA[corpus]
+    path = os.path.join(workdir, "%s_%d.%s" % (corpus, count, params["kind"]))
+    if not os.path.exists(path):
+        logging.info("Generating %s", path)
+        with open(path + ".tmp", "w", encoding="utf-8", newline="") as file_:
+            generate_corpus.generate(file_, count=count, **params)
+        os.rename(path + ".tmp", path)
+    return path
+
+
+def get_interpreter(script, args):
+    '''Returns the python interpreter for a script based on its shebang'''
+    with open(os.path.join(REPO_DIR, script)) as file_:
+        shebang = file_.readline()
+    if "python3" in shebang:
+        return args.python3
+    return args.python2
+
+
+def run_benchmark(benchmark, count, args):
+    '''Runs a single benchmark and returns the result as dictionary'''
+    (name, script, corpus, arguments) = benchmark
+    input_path = get_corpus(args.workdir, corpus, count)
+    outdir = tempfile.mkdtemp(dir=args.workdir)
+    output = os.path.join(outdir, "output")
+    command = [get_interpreter(script, args), os.path.join(REPO_DIR, script)]
+    for argument in arguments:
+        command.append(argument.format(
+            input=input_path, outdir=outdir, output=output))
+
+    best = None
+    for _ in range(args.repeat):
+        for file_name in os.listdir(outdir):
+            os.remove(os.path.join(outdir, file_name))
+        (read_fd, write_fd) = os.pipe()
+        with open(os.devnull, "w") as devnull:
+            process = subprocess.Popen(
+                [sys.executable, "-S", "-c", RSS_WRAPPER, str(write_fd)] +
+                command, stdout=devnull, pass_fds=(write_fd,),
+                stderr=None if args.debuglevel <= logging.DEBUG else devnull)
+            os.close(write_fd)
+            process.wait()
+        with os.fdopen(read_fd, "rb") as result_file:
+            (seconds, peak_rss_kb) = result_file.read().split()
+        seconds = float(seconds)
+        if best is None or seconds < best[0]:
+            best = (seconds, int(peak_rss_kb), process.returncode)
+    shutil.rmtree(outdir)
+
+    (seconds, peak_rss_kb, returncode) = best
+    size = os.path.getsize(input_path)
+    return {
+        "benchmark": name,
+        "entries": count,
+        "bytes": size,
+        "seconds": seconds,
+        "entries_per_second": count / seconds,
+        "mb_per_second": size / seconds / 1024 / 1024,
+        "peak_rss_kb": peak_rss_kb,
+        "returncode": returncode,
+    }
+
+
+def compare(results, baseline_file_name, tolerance):
+    '''Compares results with a previous run. Logs and returns the number of
+       benchmarks which got slower or use more memory than tolerance.'''
+    with open(baseline_file_name) as file_:
+        baseline = {}
+        for result in json.load(file_):
+            baseline[(result["benchmark"], result["entries"])] = result
+    regressions = 0
+    for result in results:
+        old = baseline.get((result["benchmark"], result["entries"]))
+        if old is None:
+            continue
+        time_ratio = result["seconds"] / old["seconds"]
+        rss_ratio = result["peak_rss_kb"] / old["peak_rss_kb"]
+        if time_ratio > 1 + tolerance or rss_ratio > 1 + tolerance:
+            regressions += 1
+            logging.warning(
+                "Regression %s (%d entries): time x%.2f, peak RSS x%.2f",
+                result["benchmark"], result["entries"], time_ratio, rss_ratio)
+    return regressions
+
+
+def get_args():
+    '''Configures command line parser and returns parsed parameters'''
+    parser = argparse.ArgumentParser(
+        description="Times the scripts on synthetic ical and vcard files")
+    parser.add_argument(
+        "-d", "--debuglevel", dest="debuglevel", type=int, default=logging.INFO,
+        help="""Sets numerical debug level, see library logging module.
+        Default is 20 (INFO). Possible values are CRITICAL 50, ERROR 40
+        WARNING 30, INFO 20, DEBUG 10, NOTSET 0. All log messages with debuglevel
+        or above are printed. With DEBUG the output of the scripts is shown.""")
+    parser.add_argument(
+        "-s", "--sizes", dest="sizes", default="1000,100000,1000000",
+        help="""Comma separated list of the number of entries of the input
+        files. Default is 1000,100000,1000000""")
+    parser.add_argument(
+        "-b", "--benchmark", dest="benchmarks", action="append",
+        help="""Only run benchmarks whose name starts with the given string.
+        Can be given multiple times""")
+    parser.add_argument(
+        "-w", "--workdir", dest="workdir",
+        help="""Directory for the generated input files, which are reused on
+        the next run. Default is a temporary directory""")
+    parser.add_argument(
+        "-r", "--repeat", dest="repeat", type=int, default=1,
+        help="Run each benchmark multiple times and take the fastest run")
+    parser.add_argument(
+        "-o", "--output_file", dest="output_file",
+        help="Write the results as JSON to the given file")
+    parser.add_argument(
+        "-c", "--compare", dest="compare",
+        help="""Compare the results with a JSON file written by a previous run
+        and exit with 1 if a benchmark got slower or uses more memory""")
+    parser.add_argument(
+        "-t", "--tolerance", dest="tolerance", type=float, default=0.1,
+        help="Accepted slow down for --compare, default is 0.1 (10 percent)")
+    parser.add_argument(
+        "--python2", dest="python2", default="python2",
+        help="Interpreter for the python 2 scripts, default is python2")
+    parser.add_argument(
+        "--python3", dest="python3", default=sys.executable,
+        help="Interpreter for the python 3 scripts, default is this one")
+    return parser.parse_args()
+
+
+def main():
+    '''main function, called when script file is executed directly'''
+
+    args = get_args()
+
+    logging.basicConfig(format="%(message)s", level=args.debuglevel)
+
+    temp_workdir = None
+    if not args.workdir:
+        temp_workdir = tempfile.mkdtemp(prefix="pimtools_benchmarks_")
+        args.workdir = temp_workdir
+    elif not os.path.isdir(args.workdir):
+        logging.error("workdir not found")
+        sys.exit(1)
+
+    benchmarks = BENCHMARKS
+    if args.benchmarks:
+        benchmarks = [benchmark for benchmark in BENCHMARKS
+                      if benchmark[0].startswith(tuple(args.benchmarks))]
+
+    results = []
+    logging.info("Peak RSS is measured in a small wrapper process forking the "
+                 "scripts, not in this one")
+    logging.info("%-32s %9s %9s %12s %8s %11s", "benchmark", "entries",
+                 "seconds", "entries/s", "MB/s", "peak RSS MB")
+    for count in [int(size) for size in args.sizes.split(",")]:
+        for benchmark in benchmarks:
+            result = run_benchmark(benchmark, count, args)
+            results.append(result)
+            logging.info("%-32s %9d %9.2f %12.0f %8.2f %11.1f%s",
+                         result["benchmark"], count, result["seconds"],
+                         result["entries_per_second"], result["mb_per_second"],
+                         result["peak_rss_kb"] / 1024.0,
+                         "" if result["returncode"] == 0 else
+                         "  (exit code %d)" % (result["returncode"]))
+
+    if temp_workdir:
+        shutil.rmtree(temp_workdir)
+
+    if args.output_file:
+        with open(args.output_file, "w") as output_file:
+            json.dump(results, output_file, indent=1)
+
+    if args.compare and compare(results, args.compare, args.tolerance) > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -18,24 +18,60 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import json
 import logging
 import optparse
 import os
 import sys
 
+import pimtools.stats
+from pimtools.api import KEEP_POLICIES, dedupe_ical, find_duplicates
+from pimtools.compress import is_compressed, open_input, open_output
+from pimtools.reader import ParseError
 
-def get_field(list_, field):
-    '''Returns the contents of the first occurence of a given ICAL field.
-       Returns None if field is not found''' 
-    result = None
-    for line in list_:
-        if line.find(field + ":") == 0 or line.find(field + ";") == 0 :
-            # split returns an empty string if nothing comes after
-            # so its safe to access [1]
-            result = line.split(":")[1]
-            break
-    return result
 
+def dedupe(ical_file, ical_file_name, options, stats):
+    '''Writes ical_file without duplicates and the report, see --dedupe'''
+    if len(options.outputfile) == 0:
+        logging.error("--dedupe needs --outputfile")
+        sys.exit(1)
+    if options.mmap:
+        logging.error("--mmap is not supported with --dedupe")
+        sys.exit(1)
+
+    try:
+        output_file = open_output(options.outputfile, "w", newline="")
+    except:
+        logging.error("Cannot open output file for writing")
+        sys.exit(2)
+
+    try:
+        dropped = dedupe_ical(ical_file, stats.wrap_output(output_file),
+                options.keep, stats)
+        output_file.close()
+    except ParseError as exc:
+        logging.error("Parse error: %s" % (exc))
+        sys.exit(1)
+    except (IOError, OSError) as exc:
+        logging.error("Cannot write file: %s" % (exc))
+        sys.exit(2)
+    logging.info("%d duplicates dropped" % (len(dropped)))
+
+    report = {"input": ical_file_name, "output": options.outputfile,
+            "keep": options.keep, "dropped": dropped}
+    try:
+        if len(options.report) == 0:
+            json.dump(report, sys.stdout, indent=1, sort_keys=True,
+                    separators=(",", ": "))
+            sys.stdout.write("\n")
+        else:
+            report_file = open_output(options.report, "w")
+            json.dump(report, report_file, indent=1, sort_keys=True,
+                    separators=(",", ": "))
+            report_file.close()
+    except (IOError, OSError) as exc:
+        logging.error("Cannot write report: %s" % (exc))
+        sys.exit(2)
 
 
 def main():
@@ -54,6 +90,36 @@ Default is 30 (WARNING). Possible values are CRITICAL 50, ERROR 40, WARNING 30,
 INFO 20, DEBUG 10, NOTSET 0. All log messages with debuglevel or above are
 printed. So to disable all output set debuglevel e.g. to 100.""")
 
+    parser.add_option("-m", "--mmap", dest="mmap",
+            default=False, action="store_true",
+            help="""Map ical_file into memory and scan it for entries instead
+of reading it line by line. Faster for large files. Byte offsets instead of
+line numbers are reported.""")
+
+    parser.add_option("--dedupe", dest="dedupe",
+            default=False, action="store_true",
+            help="""Instead of listing the duplicates write ical_file
+without them to the file given with --outputfile. VTIMEZONE and all other
+components and properties are kept. A JSON report of the dropped entries is
+written to STDOUT or the file given with --report.""")
+
+    parser.add_option("-o", "--outputfile", dest="outputfile",
+            type="string", default="",
+            help="The output file of --dedupe")
+
+    parser.add_option("-k", "--keep", dest="keep",
+            type="choice", choices=KEEP_POLICIES, default="first",
+            help="""Which entry of the duplicates --dedupe keeps: "first" or
+"newest" by LAST-MODIFIED and SEQUENCE, which reads ical_file twice. Default is
+first.""")
+
+    parser.add_option("-r", "--report", dest="report",
+            type="string", default="",
+            help="""Write the JSON report of --dedupe to this file instead of
+STDOUT""")
+
+    pimtools.stats.add_options(parser)
+
     (options, args) = parser.parse_args()
 
     logging.basicConfig(format="%(message)s", level=options.debuglevel)
@@ -68,45 +134,46 @@ printed. So to disable all output set debuglevel e.g. to 100.""")
         sys.exit(1)
 
     try:
-        ical_file = open(ical_file_name, "r")
+        # Keep CRLF line endings with python 3, see --dedupe
+        ical_file = open_input(ical_file_name, "r", newline="")
     except:
         logging.error("Cannot open ical file")
         sys.exit(2)
 
-    # An entry is an array reflecting one VEVENT entry, without BEGIN and
-    # END tags.
-    # Usually on each line reflects another field (execpt for multiline field)
-    entry = []
+    if options.mmap and is_compressed(ical_file):
+        logging.info("ical_file is compressed, reading it line by line")
+        options.mmap = False
 
-    in_entry = False # flag if we are inside one VEVENT
+    stats = pimtools.stats.Stats.from_options(options)
 
-    # Data to match duplicates
-    # Array of dictionaries consisting of "SUMMARY" and "DTSTART")
-    duplicate_match = []
-    for line in ical_file:
-        line = line.replace("\n","").replace("\r","")
+    if options.dedupe:
+        dedupe(ical_file, ical_file_name, options, stats)
+        ical_file.close()
+        stats.report()
+        return
+    output_file = stats.wrap_output(sys.stdout)
 
-        if line.find("BEGIN:VEVENT") == 0:
-            in_entry = True
-        else:
-            if line.find("END:VEVENT") == 0:
-                in_entry = False
-                duplicate_entry = { "SUMMARY": get_field(entry, "SUMMARY") ,
-                                    "DTSTART": get_field(entry, "DTSTART") }
-                if duplicate_entry in duplicate_match:
-                    print "Found a duplicate for the following entry:"
-                    print str(duplicate_entry)
-                    print ""
-                else:
-                    duplicate_match.append(duplicate_entry)
-                entry = []
-            else:
-                if in_entry:
-                    entry.append(line)
-                    # inside a VEVENT entry
+    if options.mmap:
+        position_name = "byte offset"
+    else:
+        position_name = "line"
+
+    try:
+        duplicates = find_duplicates(ical_file, options.mmap, stats)
+    except ParseError as exc:
+        logging.error("Parse error: %s" % (exc))
+        sys.exit(1)
 
+    for (key, positions) in duplicates:
+        print >>output_file, "Found %d duplicates for the following entry:" % (
+                len(positions))
+        print >>output_file, str({ "SUMMARY": key[0], "DTSTART": key[1] })
+        for position in positions:
+            print >>output_file, "    %s %d" % (position_name, position)
+        print >>output_file, ""
 
     ical_file.close()
+    stats.report()
 
 
 if __name__ == "__main__":
@@ -19,136 +19,17 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import datetime
 import logging
 import optparse
 import os
-import re
 import sys
 
-
-def getField(list, field):
-    '''Returns the contents of VEVENT field. Returns None if field is not found''' 
-    result = None
-    for line in list:
-        if line.find(field + ":") == 0:
-            # split returns an empty string if nothing comes after
-            # so its safe to access [1]
-            result = line.split(":")[1]
-            break
-    return result
-
-
-def setField(entry, fieldName, fieldValue):
-    '''Sets a VEVENT field. An already existing field is overwritten.'''
-    found = False
-    for i in range(len(entry)):
-        if entry[i].find(fieldName + ":" ) == 0:
-            found = True
-            break
-    
-    line = fieldName + ":" + fieldValue
-    if found:
-        entry[i] = line
-    else:
-        entry.append(line)
-
-
-def deleteField(entry, fieldName):
-    '''Completely removes the first occurence of the field from the entry'''
-    for i in range(len(entry)):
-	if entry[i].find(fieldName + ":") == 0:
-	    del entry[i]
-	    break
-
-def addOneDay(date):
-    '''Adds one day from a given date. date is expected to be in the form
-    "YYYYmmdd" like 20101221. In case of an error the given date is returned.'''
-    result = date
-    try:
-        timestamp = datetime.datetime.strptime(date,"%Y%m%d")
-        newTimeStamp = timestamp + datetime.timedelta(days=1)
-        result = newTimeStamp.strftime("%Y%m%d")
-    except:
-	logging.error("addOneDay(): Cannot parse date %s" % (date))
-    return result
-
-
-def subtractOneDay(date):
-    '''Substracts one day from a given date. date is expected to be in the form
-    "YYYYmmdd" like 20101221. In case of an error the given date is returned.'''
-    result = date
-    try:
-        timestamp = datetime.datetime.strptime(date,"%Y%m%d")
-        newTimeStamp = timestamp - datetime.timedelta(days=1)
-        result = newTimeStamp.strftime("%Y%m%d")
-    except:
-	logging.error("subtractOneDay(): Cannot parse date %s" % (date))
-    return result
-
-
-def parseUntilDate(rrule):
-    '''Parses the UNTIL date out of an rrule. Returns empty string on parse error'''
-    result = ""
-    m = re.match("FREQ=[A-Z]+;UNTIL=(?P<until>[a-zA-Z0-9]+)", rrule)
-    if m != None and m.groupdict().has_key("until"):
-	result = m.groupdict()["until"]
-    return result
-   
-
-def correctRrule(rrule):
-    '''Expects a date value in the UNTIL section of an recurrence event and
-    returns the corrected value. For some unknown reason jpilot exports these
-    dates with an additional day at the end, at least in version 1.6.2.9. In case
-    that it cannot be corrected this function returns the given rrule.'''
-    result = rrule
-    oldDate = parseUntilDate(rrule)
-    if len(oldDate) > 0:
-        newDate = subtractOneDay(oldDate)
-	result = rrule.replace("UNTIL=" + oldDate, "UNTIL=" + newDate)
-    return result
-
-
-def tweakEntry(entry, options):
-    '''Actually does the ical conversation of a single entry so that it can be imported into EGW'''
-    result = entry
-    if len(options.category) > 0:
-        setField(result, "CATEGORIES", options.category)
-
-    # Usually jpilot doubles the information in the summary field. The description
-    # field should contain more detailed information. So we just delete it if the
-    # information is the same
-    if getField(entry, "SUMMARY") != None and getField(entry, "SUMMARY") == getField(entry, "DESCRIPTION"):
-	deleteField(entry, "DESCRIPTION")
-
-    # jpilot has a day to much, at least in version 1.6.2.9
-    rrule = getField(result, "RRULE")
-    if rrule != None:
-        setField(result, "RRULE", correctRrule(rrule))
-
-    # EGW cannot handle non existing DTEND fields, even is a recurrence rule is given
-    # jpilot does not seem to set and end date in case that the event is the whole day
-    dateEnd = getField(result, "DTEND")
-    if dateEnd == None:
-	dateStart = getField(result, "DTSTART")
-	# Sometimes jpilot uses this format
-	dateStart = getField(result, "DTSTART;VALUE=DATE")
-	if dateStart == None:
-	    logging.error("Cannot distill end date")
-	else:
-	    newDate = addOneDay(dateStart)
-	    setField(result, "DTEND", newDate)
-
-    return result
-
-
-def writeEntryToFile(entry, file):
-    '''Writes an ical entry to an file handle. VEVENT begin and end tags are appended'''
-    file.write("BEGIN:VEVENT\n")
-    for line in entry:
-        file.write(line + "\n")
-    file.write("END:VEVENT\n")
-    file.write("\n")
+import pimtools.stats
+from pimtools.api import jpilot_to_egw
+from pimtools.compress import open_input, open_output
+from pimtools.parallel import get_jobs
+from pimtools.reader import ParseError
+from pimtools.watch import DEFAULT_INTERVAL, convert_on_change
 
 
 ########### MAIN PROGRAM #############
@@ -172,6 +53,20 @@ def main():
             type="string", default="", action="store",
             help="All entries will have this category assigned. Existing categories are overwritten. Usefull for testing.")
 
+    parser.add_option("-j", "--jobs", dest="jobs",
+            type="int", default=1, action="store",
+            help="Number of processes converting the entries in parallel. 0 starts one process per CPU. Default is 1.")
+
+    parser.add_option("-w", "--watch", dest="watch",
+            default=False, action="store_true",
+            help="After the conversion wait for changes of icalFile and convert it again, only the changed entries are tweaked again. The output file is replaced at once. Needs --outputfile. Runs until interrupted.")
+
+    parser.add_option("--interval", dest="interval",
+            type="float", default=DEFAULT_INTERVAL, action="store",
+            help="Seconds between two checks for changes with --watch if inotify is not available. Default is %s." % (DEFAULT_INTERVAL))
+
+    pimtools.stats.add_options(parser)
+
     (options, args) = parser.parse_args()
 
     logging.basicConfig(format="%(message)s", level=options.debuglevel)
@@ -185,8 +80,27 @@ def main():
         logging.error("icalFile not found")
         sys.exit(1)
 
+    if options.watch:
+        if len(options.outputfile) == 0:
+            logging.error("--watch needs --outputfile")
+            sys.exit(1)
+        jobs = get_jobs(options.jobs)
+
+        def convert(icalFile, outputFile, cache):
+            stats = pimtools.stats.Stats.from_options(options)
+            jpilot_to_egw(icalFile, stats.wrap_output(outputFile),
+                    options.category, jobs, stats, cache)
+            stats.report()
+
+        try:
+            convert_on_change(icalFileName, options.outputfile, convert,
+                    options.interval)
+        except KeyboardInterrupt:
+            pass
+        return
+
     try:
-        icalFile = open(icalFileName, "r")
+        icalFile = open_input(icalFileName, "r")
     except:
         logging.error("Cannot open ical file")
         sys.exit(2)
@@ -195,51 +109,24 @@ def main():
         outputFile = sys.stdout
     else:
         try:
-            outputFile = open(options.outputfile, "w")
+            outputFile = open_output(options.outputfile, "w")
         except:
             logging.error("Cannot open output file for writing")
             sys.exit(2)
 
-    line = icalFile.readline().replace("\n","").replace("\r","")
-
-    # An entry is an array reflecting one ical entry, without BEGIN and END tags
-    # Usually on each line reflects another field (execpt for multiline field)
-    entry = []
-    inEntry = False # flag if we are inside one ventry
-    inPreamble = True # Before first VEVENT entry
-    preamble = []
-    lineNr = 1
-    while line != "":
-
-        if line.find("BEGIN:VEVENT") == 0:
-            inEntry = True
-            if inPreamble:
-                for newLine in preamble:
-                    outputFile.write(newLine + "\n")
-                outputFile.write("\n")
-                inPreamble = False
-
-        else:
-            if inPreamble:
-                preamble.append(line)
-
-            if line.find("END:VEVENT") == 0:
-                inEntry = False
-                newEntry = tweakEntry(entry, options)
-                writeEntryToFile(newEntry, outputFile)
-                entry = []
-            else:
-                if inEntry:
-                    entry.append(line)
-                    # inside a vcalendar entry
-
-        line = icalFile.readline().replace("\n","").replace("\r","")
-        lineNr = lineNr + 1
-
-
-    outputFile.write("END:VCALENDAR\n")
+    stats = pimtools.stats.Stats.from_options(options)
+    outputFile = stats.wrap_output(outputFile)
+
+    try:
+        jpilot_to_egw(icalFile, outputFile, options.category,
+                get_jobs(options.jobs), stats)
+    except ParseError as exc:
+        logging.error("Parse error: %s" % (exc))
+        sys.exit(1)
+
     icalFile.close()
     outputFile.close()
+    stats.report()
 
 
 if __name__ == "__main__":
@@ -23,72 +23,15 @@ import optparse
 import os
 import sys
 
-
-def get_lineending(line):
-    '''Detects line ending of the given line and returns it.
-       Can be either \\n, \\r or \\r\\n.
-
-       Returns empty string if none of these is detected.
-    '''
-    # Take care to match the longest ones first:
-    possible_endings = [ "\r\n", "\r", "\n" ]
-    for ending in possible_endings:
-        if line.endswith(ending):
-            return ending
-    return ""
-
-
-def get_field(list_, field):
-    '''Returns the contents of the first occurence of a given ICAL field.
-       Returns None if field is not found''' 
-    result = None
-    for line in list_:
-        if line.find(field + ":") == 0:
-            # split returns an empty string if nothing comes after
-            # so its safe to access [1]
-            result = line.split(":")[1]
-            break
-    return result
-
-
-def write_entry_to_file(entry, component, file_name, lineending):
-    '''Writes an vcard entry to an file name.
-       VCARD begin and end tags are appended
-
-       entry: The whole entry as array without the BEGIN/END marker
-       component: RFC5545 component name like VEVENT, VTODO, VJOURNAL
-       lineending: Appended to all lines, e.g. "\\n" '''
-    file_ = open(file_name, "w")
-    file_.write("BEGIN:" + component + lineending)
-    for line in entry:
-        file_.write(line + lineending)
-    file_.write("END:" + component + lineending)
-    file_.close()
-
-
-def get_component_match(line):
-    """Get ical component name and limiter ("LIMITER:component",
-    e.g. "BEGIN:VEVENT")
-
-    line: The line to match
-
-    Returns dictionary e.g. {"limiter": "BEGIN", "component":"VEVENT"}
-    Returns None if no match
-
-    Example:
-         get_component_limiter("END:VTODO")
-
-    returns:
-        {"limiter": "END", "component": "VTODO"}"""
-    possible_components = [
-            "VEVENT", "VTODO", "VJOURNAL", "VFREEBUSY", "VTIMEZONE"]
-
-    for component in possible_components:
-        if line.startswith("BEGIN:" + component):
-            return {"limiter": "BEGIN", "component" : component}
-        if line.startswith("END:" + component):
-            return {"limiter": "END", "component" : component}
-    return None
+import pimtools.stats
+from pimtools.output import COLLISION_POLICIES, DEFAULT_QUEUE_DEPTH, \
+        MANIFEST_NAME, CompressingWriter, DirectoryWriter, ManifestWriter, \
+        NameCollisionError, NameRegistry, ThreadedWriter, get_archive_format, \
+        open_archive
+from pimtools.api import split_ical
+from pimtools.compress import COMPRESSIONS, can_append, is_compressed, \
+    open_input
+from pimtools.reader import ParseError
 
 
 def main():
@@ -108,6 +51,55 @@ Default is 30 (WARNING). Possible values are CRITICAL 50, ERROR 40, WARNING 30,
 INFO 20, DEBUG 10, NOTSET 0. All log messages with debuglevel or above are
 printed. So to disable all output set debuglevel e.g. to 100.""")
 
+    parser.add_option("-m", "--mmap", dest="mmap",
+            default=False, action="store_true",
+            help="""Map ical_file into memory and scan it for entries instead
+of reading it line by line. Faster for large files.""")
+
+    parser.add_option("-a", "--archive", dest="archive",
+            default=False, action="store_true",
+            help="""Write all entries into the tar or zip archive outdir
+instead of single files into the directory outdir. The format is chosen by the
+extension: .tar, .tar.gz, .tgz, .tar.bz2, .tar.xz or .zip.""")
+
+    parser.add_option("-z", "--compress", dest="compress",
+            type="choice", choices=COMPRESSIONS, default=None,
+            help="""Compress each file with gzip, bz2 or xz and append .gz,
+.bz2 or .xz to its name. Not supported with --archive, use a compressed archive
+instead.""")
+
+    parser.add_option("-t", "--threads", dest="threads",
+            type="int", default=1,
+            help="""Number of threads writing the single files in parallel.
+Helps on network file systems. Not supported with --archive. Default is 1.""")
+
+    parser.add_option("--queue-depth", dest="queue_depth",
+            type="int", default=DEFAULT_QUEUE_DEPTH,
+            help="""Maximum number of files waiting per thread with
+--threads. Default is %d.""" % (DEFAULT_QUEUE_DEPTH))
+
+    parser.add_option("-c", "--on-collision", dest="on_collision",
+            type="choice", choices=COLLISION_POLICIES, default="fail",
+            help="""What to do if two entries have the same UID or the file
+already exists: "fail" stops with an error, "suffix" appends a number to the
+file name and "group" writes all entries with the same UID into one file, e.g.
+for recurring events with exceptions. "group" is not supported with --archive.
+Default is fail.""")
+
+    parser.add_option("-i", "--incremental", dest="incremental",
+            default=False, action="store_true",
+            help="""Only write files whose content changed since the last
+run. A manifest with the hashes of all files is kept in outdir. Files of
+entries no longer in ical_file are deleted. Not supported with --archive and
+--on-collision group.""")
+
+    parser.add_option("--keep-removed", dest="keep_removed",
+            default=False, action="store_true",
+            help="""With --incremental do not delete the files of entries no
+longer in ical_file but print their names.""")
+
+    pimtools.stats.add_options(parser)
+
     (options, args) = parser.parse_args()
 
     logging.basicConfig(format="%(message)s", level=options.debuglevel)
@@ -122,78 +114,100 @@ printed. So to disable all output set debuglevel e.g. to 100.""")
         sys.exit(1)
 
     outdir = os.path.expanduser(args[1])
-    if not os.path.isdir(outdir):
+    if options.archive:
+        try:
+            get_archive_format(outdir)
+        except ValueError as exc:
+            logging.error(exc)
+            sys.exit(1)
+        if options.threads > 1:
+            logging.error("--threads is not supported with --archive")
+            sys.exit(1)
+        if options.compress:
+            logging.error("--compress is not supported with --archive")
+            sys.exit(1)
+        if options.on_collision == "group":
+            logging.error(
+                "--on-collision group is not supported with --archive")
+            sys.exit(1)
+    elif not os.path.isdir(outdir):
         logging.error("outdir not found")
         sys.exit(1)
 
+    if options.on_collision == "group" and options.compress and \
+            not can_append(options.compress):
+        logging.error("--on-collision group with --compress %s needs Python 3"
+                % (options.compress))
+        sys.exit(1)
+
+    if options.incremental and (options.archive or
+            options.on_collision == "group"):
+        logging.error("--incremental is not supported with --archive and "
+                "--on-collision group")
+        sys.exit(1)
+
     try:
-        ical_file = open(ical_file_name, "r")
-    except:
-        logging.error("Cannot open ical file")
+        # Keep CRLF line endings with python 3 like --mmap does
+        ical_file = open_input(ical_file_name, "r", newline="")
+    except (IOError, OSError) as exc:
+        logging.error("Cannot open ical file: %s" % (exc))
+        sys.exit(2)
+
+    if options.mmap and is_compressed(ical_file):
+        logging.info("ical_file is compressed, reading it line by line")
+        options.mmap = False
+
+    if options.archive:
+        try:
+            writer = open_archive(outdir)
+        except (IOError, OSError):
+            logging.error("Cannot open archive for writing")
+            sys.exit(2)
+    else:
+        writer = DirectoryWriter(outdir)
+        if options.compress:
+            writer = CompressingWriter(writer, options.compress)
+        if options.threads > 1:
+            writer = ThreadedWriter(writer, options.threads,
+                    options.queue_depth)
+        if options.incremental:
+            writer = ManifestWriter(writer,
+                    os.path.join(outdir, MANIFEST_NAME), options.keep_removed)
+
+    registry = NameRegistry(writer, options.on_collision)
+
+    stats = pimtools.stats.Stats.from_options(options)
+
+    try:
+        for (outfile_name, _, data) in split_ical(ical_file, options.mmap,
+                stats):
+            with stats.phase("write"):
+                used_name = registry.write(outfile_name, data)
+            if used_name != outfile_name:
+                logging.warning("UID collision, writing %s instead of %s" % (
+                    used_name, outfile_name))
+            stats.bytes_out += len(data)
+        with stats.phase("write"):
+            writer.close()
+    except NameCollisionError as exc:
+        logging.error("UID collision, file %s already exists. Exit." % (exc))
+        sys.exit(1)
+    except ParseError as exc:
+        logging.error("Parse error: %s" % (exc))
+        sys.exit(1)
+    except (IOError, OSError) as exc:
+        logging.error("Cannot write file: %s" % (exc))
         sys.exit(2)
 
-    # An entry is an array reflecting one vcard entry, without BEGIN and
-    # END tags.
-    # Usually on each line reflects another field (execpt for multiline field)
-    entry = []
-
-    current_component = ""
-    in_entry = False # flag if we are inside one vcard
-    no_uid_counter = 0 # vcard entries with no UID field
-    lineending = ""
-    line_number = 0
-    process_entry = False
-    for line in ical_file:
-        line_number = line_number + 1
-        if len(lineending) == 0:
-            lineending = get_lineending(line) # keep same line endings
-        line = line.replace("\n","").replace("\r","")
-
-        component_match = get_component_match(line)
-
-        if component_match is None:
-            if in_entry:
-                entry.append(line)
-        else:
-            if component_match["limiter"] == "BEGIN":
-                if len(current_component) > 0:
-                    msg = "Parse error at line %d" % (line_number)
-                    logging.error(msg)
-                    sys.exit(1)
-                current_component = component_match["component"]
-                in_entry = True
-            else:
-                if component_match["limiter"] == "END":
-                    if component_match["component"] != current_component:
-                        msg = "Parse error at line %d" % (line_number)
-                        logging.error(msg)
-                        sys.exit(1)
-                    in_entry = False
-                    process_entry = True
-
-
-        if process_entry:
-            outfile_name = get_field(entry, "UID")
-            if outfile_name is None:
-                no_uid_counter = no_uid_counter + 1
-                outfile_name = "nouid_%03d" % (no_uid_counter)
-            outfile_name = current_component + "_" + outfile_name + ".ics"
-            outfile_path = os.path.join(outdir, outfile_name)
-            # TODO: Having several entries with the UID is perfectly legal
-            # for recurring events with exceptions
-            if os.path.exists(outfile_path):
-                msg = "UID collision, file %s already exists." % (
-                        outfile_path)
-                msg += " Exit."
-                logging.error(msg)
-                sys.exit(1)
-            write_entry_to_file(
-                    entry, current_component, outfile_path, lineending)
-            entry = []
-            current_component = ""
-            process_entry = False
+    if options.incremental:
+        logging.info("%d files unchanged, %d removed" % (writer.unchanged,
+                len(writer.removed)))
+        if options.keep_removed:
+            for name in writer.removed:
+                sys.stdout.write(writer.path(name) + "\n")
 
     ical_file.close()
+    stats.report()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+""" pim_index.py
+    Builds an index of the entries of a large ical or vcard file and extracts
+    single entries using it"""
+#
+#    Copyright (C) 2014-2020 Georg Lutz <georg AT NOSPAM georglutz DOT de>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import logging
+import os
+import sys
+
+from pimtools.compress import detect_compression, open_output
+from pimtools.reader import ParseError
+from pimtools.sidecar import MappedIndex, StaleIndexError, build_index, \
+    get_index_file_name
+
+
+def build(args):
+    '''Builds the index of args.file_name'''
+    try:
+        if detect_compression(args.file_name) is not None:
+            logging.error("%s is compressed, the entries of compressed files "
+                          "cannot be indexed", args.file_name)
+            sys.exit(1)
+        with open(args.file_name, "rb") as file_:
+            index = build_index(file_)
+    except IOError:
+        logging.error("Cannot open %s", args.file_name)
+        sys.exit(2)
+    except ParseError as exc:
+        logging.error("Parse error: %s", exc)
+        sys.exit(1)
+
+    try:
+        index.write(args.index_file_name)
+    except IOError:
+        logging.error("Cannot write index file")
+        sys.exit(2)
+    logging.info("%d entries indexed", len(index.records))
+
+
+def extract(args):
+    '''Writes the entries with the UIDs args.uids to the output file'''
+    try:
+        index = MappedIndex(args.index_file_name)
+    except IOError:
+        logging.error("Cannot read index file, create it with build")
+        sys.exit(2)
+    except ValueError:
+        logging.error("Invalid index file %s, rebuild it with build",
+                      args.index_file_name)
+        sys.exit(1)
+
+    try:
+        file_ = open(args.file_name, "rb")
+    except IOError:
+        logging.error("Cannot open %s", args.file_name)
+        sys.exit(2)
+
+    try:
+        index.check(file_, args.verify)
+    except StaleIndexError as exc:
+        logging.error("Index is out of date (%s), rebuild it with build", exc)
+        sys.exit(1)
+
+    if not args.output_file:
+        output_file = sys.stdout.buffer
+    else:
+        try:
+            output_file = open_output(args.output_file, "wb")
+        except IOError:
+            logging.error("Cannot open output file for writing")
+            sys.exit(2)
+
+    not_found = 0
+    for uid in args.uids:
+        records = index.find(uid)
+        if not records:
+            logging.error("UID %s not found", uid)
+            not_found += 1
+        for (_, _, offset, length) in records:
+            file_.seek(offset)
+            output_file.write(file_.read(length))
+
+    file_.close()
+    index.close()
+    output_file.close()
+    if not_found:
+        sys.exit(1)
+
+
+def get_args():
+    '''Configures command line parser and returns parsed parameters'''
+    parser = argparse.ArgumentParser(
+        description="""Builds an index with the byte offsets of the entries of
+        an ical or vcard file and extracts entries by UID using this index""")
+    parser.add_argument(
+        "-d", "--debuglevel", dest="debuglevel", type=int, default=logging.WARNING,
+        help="""Sets numerical debug level, see library logging module.
+        Default is 30 (WARNING). Possible values are CRITICAL 50, ERROR 40
+        WARNING 30, INFO 20, DEBUG 10, NOTSET 0. All log messages with debuglevel
+        or above are printed. So to disable all output set debuglevel e.g. to 100.""")
+    parser.add_argument(
+        "-i", "--index_file", dest="index_file_name",
+        help="The index file. Default is the file name with .idx appended")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    build_parser = subparsers.add_parser(
+        "build", help="Builds or updates the index of an ical or vcard file")
+    build_parser.add_argument(
+        "file_name", help="The ical or vcard file to index")
+    build_parser.set_defaults(function=build)
+
+    extract_parser = subparsers.add_parser(
+        "extract", help="Writes the entries with the given UIDs")
+    extract_parser.add_argument(
+        "-o", "--output_file", dest="output_file",
+        help="The output file. Default output is sent to STDOUT")
+    extract_parser.add_argument(
+        "--verify", dest="verify", action="store_true",
+        help="""Compare the SHA-1 of the whole file with the index instead of
+        only the size and a checksum of some blocks of it""")
+    extract_parser.add_argument(
+        "file_name", help="The indexed ical or vcard file")
+    extract_parser.add_argument(
+        "uids", nargs="+", metavar="uid", help="UID of an entry to extract")
+    extract_parser.set_defaults(function=extract)
+
+    args = parser.parse_args()
+    if not args.index_file_name:
+        args.index_file_name = get_index_file_name(args.file_name)
+    return args
+
+
+def main():
+    '''main function, called when script file is executed directly'''
+
+    args = get_args()
+
+    logging.basicConfig(format="%(message)s", level=args.debuglevel)
+
+    if not os.path.isfile(args.file_name):
+        logging.error("%s not found", args.file_name)
+        sys.exit(1)
+
+    args.function(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+""" pim_server.py
+    Keeps the converters loaded in a server process and asks it for
+    conversions, avoiding the interpreter startup on each call"""
+#
+#    Copyright (C) 2014-2020 Georg Lutz <georg AT NOSPAM georglutz DOT de>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+
+from pimtools.compress import decompress, open_output
+from pimtools.server import CONVERTERS, ServerError, get_default_socket_name, \
+    request, serve
+
+
+def run_server(args):
+    '''Runs the server until it is interrupted or terminated'''
+    # Leave serve() by an exception on SIGTERM, so the socket is removed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        serve(args.socket_name, logging.getLogger())
+    except KeyboardInterrupt:
+        pass
+    except (IOError, OSError) as exc:
+        logging.error("Cannot start server: %s", exc)
+        sys.exit(2)
+
+
+def run_client(args):
+    '''Sends a conversion request and writes the result'''
+    options = {}
+    if args.category:
+        options["category"] = args.category
+
+    input_file_name = args.input_file_name
+    data = b""
+    if input_file_name == "-":
+        input_file_name = None
+        try:
+            data = decompress(sys.stdin.buffer.read())
+        except (IOError, OSError, EOFError) as exc:
+            logging.error("Cannot decompress input: %s", exc)
+            sys.exit(1)
+    elif not os.path.isfile(input_file_name):
+        logging.error("input_file not found")
+        sys.exit(1)
+
+    try:
+        output = request(args.socket_name, args.converter, options,
+                         input_file_name, data)
+    except ServerError as exc:
+        logging.error(exc)
+        sys.exit(1)
+    except socket.error as exc:
+        logging.error("Cannot connect to server on %s: %s",
+                      args.socket_name, exc)
+        sys.exit(2)
+
+    if not args.output_file:
+        output_file = sys.stdout.buffer
+    else:
+        try:
+            output_file = open_output(args.output_file, "wb")
+        except IOError:
+            logging.error("Cannot open output file for writing")
+            sys.exit(2)
+    output_file.write(output)
+    output_file.close()
+
+
+def get_args():
+    '''Configures command line parser and returns parsed parameters'''
+    parser = argparse.ArgumentParser(
+        description="""Runs the converters in a server process listening on a
+        Unix socket (serve) and sends conversion requests to it (convert)""")
+    parser.add_argument(
+        "-d", "--debuglevel", dest="debuglevel", type=int, default=logging.WARNING,
+        help="""Sets numerical debug level, see library logging module.
+        Default is 30 (WARNING). Possible values are CRITICAL 50, ERROR 40
+        WARNING 30, INFO 20, DEBUG 10, NOTSET 0. All log messages with debuglevel
+        or above are printed. So to disable all output set debuglevel e.g. to 100.""")
+    parser.add_argument(
+        "-s", "--socket", dest="socket_name", default=get_default_socket_name(),
+        help="The Unix socket of the server. Default is %(default)s")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    serve_parser = subparsers.add_parser(
+        "serve", help="Runs the server until it is terminated")
+    serve_parser.set_defaults(function=run_server)
+
+    convert_parser = subparsers.add_parser(
+        "convert", help="Converts a file using the server")
+    convert_parser.add_argument(
+        "-o", "--output_file", dest="output_file",
+        help="The output file. Default output is sent to STDOUT")
+    convert_parser.add_argument(
+        "-c", "--category", dest="category", default="",
+        help="Category assigned to all entries by jpilot_to_egw")
+    convert_parser.add_argument(
+        "converter", choices=sorted(CONVERTERS),
+        help="The conversion to run")
+    convert_parser.add_argument(
+        "input_file_name", metavar="input_file",
+        help="The ical or vcard file to convert, - for STDIN")
+    convert_parser.set_defaults(function=run_client)
+
+    return parser.parse_args()
+
+
+def main():
+    '''main function, called when script file is executed directly'''
+
+    args = get_args()
+
+    logging.basicConfig(format="%(message)s", level=args.debuglevel)
+
+    args.function(args)
+
+
+if __name__ == "__main__":
+    main()
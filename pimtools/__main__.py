@@ -0,0 +1,126 @@
+""" pimtools.__main__
+
+    Command line interface of pimtools.pipeline, run it with
+    "python -m pimtools" """
+#
+#    Copyright (C) 2014-2020 Georg Lutz <georg AT NOSPAM georglutz DOT de>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import logging
+import os
+import sys
+
+import pimtools.stats
+from pimtools.compress import open_input
+from pimtools.output import COLLISION_POLICIES, NameCollisionError
+from pimtools.pipeline import TRANSFORMS, Pipeline, open_sink, parse_output
+from pimtools.reader import ParseError
+
+
+def get_args():
+    '''Configures command line parser and returns parsed parameters'''
+    parser = argparse.ArgumentParser(
+        prog="python -m pimtools",
+        description="""Reads an ical or vcard file once and writes it to
+        several outputs, each after a chain of conversions""",
+        epilog="""An output is given as [TRANSFORM+...+][SINK]=TARGET.
+        Transforms: %s. Sinks: file (the default, writes the entries into the
+        file TARGET), split (writes each entry into a file in the directory
+        TARGET), mutt (writes mutt aliases to the file TARGET). TARGET "-" is
+        STDOUT. Example: owncloud=out.vcf split=outdir gammu=nokia.vcf
+        mutt=aliases""" % (", ".join(sorted(TRANSFORMS))))
+    parser.add_argument(
+        "-d", "--debuglevel", dest="debuglevel", type=int, default=logging.WARNING,
+        help="""Sets numerical debug level, see library logging module.
+        Default is 30 (WARNING). Possible values are CRITICAL 50, ERROR 40
+        WARNING 30, INFO 20, DEBUG 10, NOTSET 0. All log messages with debuglevel
+        or above are printed. So to disable all output set debuglevel e.g. to 100.""")
+    parser.add_argument(
+        "-c", "--category", dest="category", default="",
+        help="""Category assigned to all entries by the transform egw.
+        Existing categories are overwritten.""")
+    parser.add_argument(
+        "--on-collision", dest="on_collision", choices=COLLISION_POLICIES,
+        default="fail",
+        help="""What the sink split does if two entries have the same UID,
+        see ical_split.py. Default is fail.""")
+    pimtools.stats.add_options(parser)
+    parser.add_argument(
+        "input_file_name",
+        help="The ical or vcard file to read")
+    parser.add_argument(
+        "outputs", nargs="+", metavar="output",
+        help="[TRANSFORM+...+][SINK]=TARGET, see below")
+    return parser.parse_args()
+
+
+def main():
+    '''main function, called when the package is executed'''
+
+    args = get_args()
+
+    logging.basicConfig(format="%(message)s", level=args.debuglevel)
+
+    if not os.path.isfile(args.input_file_name):
+        logging.error("input_file not found")
+        sys.exit(1)
+
+    outputs = []
+    for spec in args.outputs:
+        try:
+            outputs.append(parse_output(spec))
+        except ValueError as exc:
+            logging.error(exc)
+            sys.exit(1)
+
+    try:
+        # Keep CRLF line endings with python 3 like the split scripts
+        input_file = open_input(args.input_file_name, "r", newline="")
+    except IOError:
+        logging.error("Cannot open input file")
+        sys.exit(2)
+
+    stats = pimtools.stats.Stats.from_options(args)
+    pipeline = Pipeline(args.category)
+    for (transforms, sink, target) in outputs:
+        if sink == "split" and not os.path.isdir(target):
+            logging.error("Directory %s not found", target)
+            sys.exit(1)
+        try:
+            sink_object = open_sink(sink, target, args.on_collision, stats)
+        except IOError:
+            logging.error("Cannot open %s for writing", target)
+            sys.exit(2)
+        pipeline.add_output(transforms, sink_object)
+
+    try:
+        pipeline.run(input_file, stats)
+    except NameCollisionError as exc:
+        logging.error("UID collision, file %s already exists. Exit.", exc)
+        sys.exit(1)
+    except ParseError as exc:
+        logging.error("Parse error: %s", exc)
+        sys.exit(1)
+    except (IOError, OSError) as exc:
+        logging.error("Cannot write file: %s", exc)
+        sys.exit(2)
+
+    input_file.close()
+    stats.report()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,738 @@
+""" pimtools.api
+
+    The conversions of the scripts as functions, for batch jobs converting
+    many files in one process"""
+#
+#    Copyright (C) 2014-2020 Georg Lutz <georg AT NOSPAM georglutz DOT de>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# The source of all functions is one of
+#
+#  - an open file or any other iterable over the lines of an ical or vcard
+#    file, with or without line endings,
+#  - the whole content of such a file as str or bytes (UTF-8),
+#  - a list of entries, each a list of lines without BEGIN/END tags and
+#    without line endings.
+#
+# The converters write to output, a file like object. If it is None, the
+# result is returned as str instead. The scripts are thin wrappers around
+# these functions, so the output is the same. Example:
+#
+#   import pimtools.api
+#   for name in file_names:
+#       with open(name) as in_file, open(name + ".gammu", "w") as out_file:
+#           pimtools.api.egw_to_gammu(in_file, out_file)
+
+import itertools
+import logging
+
+from .converters import convert_to_mutt_aliases, filter_phone_number, \
+    fix_continuation_lines, get_fields, parse_and_split_field, \
+    tweak_egw_to_gammu, tweak_jpilot_to_egw
+from .entry import Entry
+from .owncloud import FOLD_LENGTH, fold_line, refold_lines
+from .parallel import map_entries
+from .reader import Component, ComponentReader, ICAL_COMPONENTS, \
+    unfold as unfold_lines
+from .scanner import ComponentScanner, find_line, get_lineending, open_mmap
+from .stats import Stats
+
+# Types of a source given as whole content
+_TEXT_TYPES = (bytes, type(u""))
+
+# Which entry of a group of duplicates dedupe_ical() keeps
+KEEP_POLICIES = ("first", "newest")
+
+# Phone numbers with less digits (e.g. extensions) are no duplicate keys
+MIN_PHONE_DIGITS = 6
+
+
+class _StringOutput(object):
+    '''Output collecting everything written, used if output is None'''
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        '''Appends data'''
+        self.parts.append(data)
+
+    def getvalue(self):
+        '''Returns everything written so far as one string'''
+        return "".join(self.parts)
+
+
+def _split_lines(text):
+    '''Returns the lines of text, which is str or bytes'''
+    if str is not bytes and isinstance(text, bytes):
+        text = text.decode("utf-8")
+    return text.splitlines(True)
+
+
+def _open_components(source, names, outside, unfold, stats):
+    '''Returns the tuple (components, reader) for read_components(), reader
+       is the ComponentReader or None if source is a list of entries'''
+    if isinstance(source, _TEXT_TYPES):
+        source = _split_lines(source)
+    if not hasattr(source, "read"):
+        # Look at the first item to tell lines from entries. Files are not
+        # peeked at as python 2 does not allow to mix iteration and read.
+        iterator = iter(source)
+        for first in iterator:
+            break
+        else:
+            return (iter(()), None)
+        source = itertools.chain([first], iterator)
+        if not isinstance(first, _TEXT_TYPES):
+            return (stats.components(
+                Component(names[0], list(lines), None) for lines in source),
+                    None)
+    reader = ComponentReader(stats.wrap_input(source), names, unfold=unfold,
+                             outside=outside)
+    return (stats.components(reader), reader)
+
+
+def read_components(source, names, outside=None, unfold=False, stats=None):
+    '''Returns an iterable over the Component objects of source, see above.
+       names, outside and unfold are passed to ComponentReader. Entries
+       given as list of lines are taken as components names[0], outside is
+       not called for them. Raises ParseError if source cannot be parsed.'''
+    if stats is None:
+        stats = Stats()
+    return _open_components(source, names, outside, unfold, stats)[0]
+
+
+def _map(function, entries, jobs, args, cache):
+    '''Returns map_entries(function, entries, jobs, args), using cache (a
+       pimtools.watch.EntryCache) if given'''
+    if cache is None:
+        return map_entries(function, entries, jobs, args)
+    return cache.map(function, entries, jobs, args)
+
+
+########### converters #############
+
+def _jpilot_to_egw_entry(lines, category):
+    '''Converts the lines of a single VEVENT, picklable for map_entries()'''
+    return tweak_jpilot_to_egw(Entry(lines), category).lines()
+
+
+def jpilot_to_egw(source, output=None, category="", jobs=1, stats=None,
+                  cache=None):
+    '''Converts a jpilot ical export for import into egroupware, see
+       ical_jpilot_to_egw.py. Only VEVENT entries are written, the lines in
+       front of the first of them are kept. category replaces the categories
+       of all entries if given. With jobs > 1 the entries are converted in
+       that many worker processes. With cache, a pimtools.watch.EntryCache,
+       only entries changed since the previous call are converted. Raises
+       ParseError if source cannot be parsed.'''
+    if stats is None:
+        stats = Stats()
+    result = output
+    if result is None:
+        result = _StringOutput()
+
+    # Lines before the first VEVENT entry, written when it is read
+    preamble = []
+    started = []
+
+    def outside(line):
+        if not started:
+            preamble.append(line)
+
+    def entries():
+        for component in read_components(source, ("VEVENT",), outside,
+                                         stats=stats):
+            if not started:
+                for line in preamble:
+                    result.write(line + "\n")
+                result.write("\n")
+                started.append(True)
+            yield component.lines
+
+    new_entries = _map(_jpilot_to_egw_entry, entries(), jobs, (category,),
+                       cache)
+    for new_entry in stats.timed(new_entries, "transform"):
+        result.write("BEGIN:VEVENT\n")
+        for line in new_entry:
+            result.write(line + "\n")
+        result.write("END:VEVENT\n\n")
+    result.write("END:VCALENDAR\n")
+    if output is None:
+        return result.getvalue()
+    return None
+
+
+def _egw_to_gammu_entry(lines):
+    '''Converts the lines of a single VCARD, picklable for map_entries()'''
+    return tweak_egw_to_gammu(Entry(lines)).lines()
+
+
+def write_vcards(output, entries):
+    '''Writes vcard entries given as lists of lines to output, each
+       followed by an empty line like the gammu converters do'''
+    for entry in entries:
+        output.write("BEGIN:VCARD\n")
+        for line in entry:
+            output.write(line + "\n")
+        output.write("END:VCARD\n\n")
+
+
+def egw_to_gammu(source, output=None, jobs=1, stats=None, cache=None):
+    '''Converts an egroupware vcard export for import into gammu / nokia
+       2730, see vcf_egw_to_gammu_nokia_2730.py. jobs and cache as for
+       jpilot_to_egw(). Raises ParseError if source cannot be parsed.'''
+    if stats is None:
+        stats = Stats()
+    result = output
+    if result is None:
+        result = _StringOutput()
+    entries = (component.lines for component in
+               read_components(source, ("VCARD",), stats=stats))
+    new_entries = _map(_egw_to_gammu_entry, entries, jobs, (), cache)
+    write_vcards(result, stats.timed(new_entries, "transform"))
+    if output is None:
+        return result.getvalue()
+    return None
+
+
+def get_entry_key(lines):
+    '''Returns what identifies a contact in two exports: its UID or, if it
+       has none, its N and FN lines'''
+    uid = get_field(lines, "UID")
+    if uid:
+        return "UID:" + uid
+    return "\n".join([line for line in lines
+                      if line.split(":", 1)[0].split(";", 1)[0] in ("N", "FN")])
+
+
+def diff_entries(old_entries, new_entries):
+    '''Compares two lists of entries (lists of lines) by get_entry_key().
+       Returns the tuple (added, changed, deleted). added and deleted are
+       lists of entries, changed is a list of tuples (old entry, new entry).
+       added and changed are in the order of new_entries, deleted in the
+       order of old_entries. Entries with the same key are paired in
+       order.'''
+    def by_key(entries):
+        result = []
+        counts = {}
+        for lines in entries:
+            key = get_entry_key(lines)
+            counts[key] = counts.get(key, 0) + 1
+            result.append(((key, counts[key]), lines))
+        return result
+
+    old = by_key(old_entries)
+    new = by_key(new_entries)
+    old_lines = dict(old)
+    new_keys = set([key for (key, _) in new])
+    added = [lines for (key, lines) in new if key not in old_lines]
+    changed = [(old_lines[key], lines) for (key, lines) in new
+               if key in old_lines and old_lines[key] != lines]
+    deleted = [lines for (key, lines) in old if key not in new_keys]
+    return (added, changed, deleted)
+
+
+def egw_to_gammu_delta(source, snapshot=None, jobs=1, stats=None):
+    '''Converts source like egw_to_gammu() and compares the result with
+       snapshot, the output of a previous run (any source, None if there
+       is none). Returns the tuple (entries, added, changed, deleted) of
+       lists of converted entries, entries being all of them, see
+       diff_entries(). Raises ParseError if source or snapshot cannot be
+       parsed.'''
+    if stats is None:
+        stats = Stats()
+    lines = (component.lines for component in
+             read_components(source, ("VCARD",), stats=stats))
+    entries = list(stats.timed(map_entries(_egw_to_gammu_entry, lines, jobs),
+                               "transform"))
+    old_entries = []
+    if snapshot is not None:
+        old_entries = [component.lines for component in
+                       read_components(snapshot, ("VCARD",))]
+    return (entries,) + diff_entries(old_entries, entries)
+
+
+def _fold(line, fold_length):
+    '''fold_line() for str as well as bytes'''
+    if isinstance(line, bytes):
+        return fold_line(line, fold_length)
+    return fold_line(line.encode("utf-8"), fold_length).decode("utf-8")
+
+
+def _refold(lines, fold_length):
+    '''refold_lines() for str as well as bytes'''
+    if str is bytes:
+        return refold_lines(lines, fold_length)
+    return [line.decode("utf-8") for line in refold_lines(
+        [line.encode("utf-8") for line in lines], fold_length)]
+
+
+def egw_to_owncloud(source, output=None, stats=None,
+                    fold_length=FOLD_LENGTH):
+    '''Converts an egroupware vcard export for import into owncloud, see
+       vcf_egw_to_owncloud.py. The output has CRLF line endings, lines are
+       folded at fold_length octets (0 disables folding). Raises ParseError
+       if source cannot be parsed. For large files use
+       pimtools.owncloud.rewrite_owncloud(), which gives the same output.'''
+    if stats is None:
+        stats = Stats()
+    result = output
+    if result is None:
+        result = _StringOutput()
+
+    def write_outside(line):
+        result.write(_fold(line, fold_length) + "\r\n")
+
+    for component in read_components(source, ("VCARD",), write_outside,
+                                     stats=stats):
+        result.write("BEGIN:VCARD\r\n")
+        lines_out = _refold(fix_continuation_lines(component.lines),
+                            fold_length)
+        for line_out in stats.timed(lines_out, "transform"):
+            result.write(line_out + "\r\n")
+        result.write("END:VCARD\r\n")
+    if output is None:
+        return result.getvalue()
+    return None
+
+
+def mutt_aliases(source, output=None, jobs=1, stats=None, cache=None):
+    '''Writes mutt aliases for the email addresses of the vcard entries of
+       source, one per line, see vcf_egw_to_muttalias.py. A warning is
+       logged if different contacts get the same alias name. jobs and cache
+       as for jpilot_to_egw(). Raises ParseError if source cannot be
+       parsed.'''
+    if stats is None:
+        stats = Stats()
+    result = output
+    if result is None:
+        result = _StringOutput()
+    entries = (component.lines for component in
+               read_components(source, ("VCARD",), stats=stats))
+    all_aliases = _map(convert_to_mutt_aliases, entries, jobs, (), cache)
+    # Alias name -> number of the entry it was derived from
+    alias_entries = {}
+    for (number, aliases) in enumerate(stats.timed(all_aliases, "transform")):
+        for alias in aliases:
+            name = alias.split(" ", 2)[1]
+            if alias_entries.setdefault(name, number) != number:
+                logging.warning("Alias name %s is used by several contacts: "
+                                "%s", name, alias)
+            result.write(alias + "\n")
+    if output is None:
+        return result.getvalue()
+    return None
+
+
+########### split #############
+
+def get_field(list_, field):
+    '''Returns the contents of the first occurence of a given field.
+       Returns None if field is not found'''
+    result = None
+    for line in list_:
+        if line.find(field + ":") == 0:
+            # split returns an empty string if nothing comes after
+            # so its safe to access [1]
+            result = line.split(":")[1]
+            break
+    return result
+
+
+def format_entry(entry, component, lineending):
+    '''Returns an entry as string. BEGIN and END tags are added.
+
+       entry: The whole entry as array without the BEGIN/END marker
+       component: Component name like VEVENT or VCARD
+       lineending: Appended to all lines, e.g. "\\n" '''
+    lines = ["BEGIN:" + component] + entry + ["END:" + component]
+    return lineending.join(lines) + lineending
+
+
+def get_split_file_name(component, uid):
+    '''Returns the file name of an entry written by the split functions'''
+    if component == "VCARD":
+        return uid + ".vcf"
+    return component + "_" + uid + ".ics"
+
+
+def _to_bytes(data):
+    '''Returns data encoded as UTF-8 if it is not bytes already'''
+    if isinstance(data, bytes):
+        return data
+    return data.encode("utf-8")
+
+
+def _read_split(source, names, stats):
+    '''Generator returning (component, uid, data) for each entry of source'''
+    (components, reader) = _open_components(source, names, None, False, stats)
+    for component in components:
+        # Entries given as lines keep the line ending of the input
+        lineending = "\n"
+        if reader is not None and reader.lineending:
+            lineending = reader.lineending
+        data = format_entry(component.lines, component.name, lineending)
+        yield (component.name, get_field(component.lines, "UID"),
+               _to_bytes(data))
+
+
+def _scan_split(file_, names, stats):
+    '''Same as _read_split(), but the entries are located in the memory
+       mapped file_. Only the UID line is looked at, the entries are copied
+       as they are.'''
+    buf = open_mmap(file_)
+    stats.bytes_in += len(buf)
+    lineending = get_lineending(buf)
+    scanner = ComponentScanner(buf, names)
+    for (component, start, end) in stats.components(scanner):
+        uid_line = find_line(buf, start, end, (b"UID:",),
+                             newline=scanner.newline)
+        uid = None
+        if uid_line is not None:
+            if str is not bytes:
+                uid_line = uid_line.decode("utf-8")
+            uid = get_field([uid_line], "UID")
+        data = buf[start:end]
+        if not data.endswith((b"\n", b"\r")):
+            data += lineending
+        yield (component, uid, data)
+
+
+def _split(source, names, mmap, stats):
+    '''Implements split_ical() and split_vcard()'''
+    if stats is None:
+        stats = Stats()
+    if mmap:
+        entries = _scan_split(source, names, stats)
+    else:
+        entries = _read_split(source, names, stats)
+    no_uid_counter = 0 # entries with no UID field
+    for (component, uid, data) in entries:
+        name = uid
+        if name is None:
+            no_uid_counter += 1
+            name = "nouid_%03d" % (no_uid_counter)
+        yield (get_split_file_name(component, name), uid, data)
+
+
+def split_ical(source, mmap=False, stats=None):
+    '''Generator returning a tuple (file name, uid, data) for each entry of
+       an ical file, see ical_split.py. uid is None for entries without UID,
+       data are the bytes of the entry including BEGIN/END tags. With mmap
+       the open binary file source is mapped into memory and scanned, which
+       is faster for large files. Raises ParseError if source cannot be
+       parsed.'''
+    return _split(source, ICAL_COMPONENTS, mmap, stats)
+
+
+def split_vcard(source, mmap=False, stats=None):
+    '''Same as split_ical() for the entries of a vcard file, see
+       vcf_split.py'''
+    return _split(source, ("VCARD",), mmap, stats)
+
+
+########### duplicates #############
+
+def get_key_field(list_, field):
+    '''Returns the contents of the first occurence of a given field, which
+       may have parameters. Returns None if field is not found'''
+    result = None
+    for line in list_:
+        if line.find(field + ":") == 0 or line.find(field + ";") == 0:
+            # split returns an empty string if nothing comes after
+            # so its safe to access [1]
+            result = line.split(":")[1]
+            break
+    return result
+
+
+def _read_keys(source, stats):
+    '''Generator returning a tuple (key, line_number) for each VEVENT entry.
+       key is the tuple (SUMMARY, DTSTART).'''
+    for component in read_components(source, ("VEVENT",), unfold=True,
+                                     stats=stats):
+        entry = component.lines
+        key = (get_key_field(entry, "SUMMARY"),
+               get_key_field(entry, "DTSTART"))
+        yield (key, component.line_number)
+
+
+def _scan_keys(file_, stats):
+    '''Same as _read_keys(), but the entries are located in the memory
+       mapped file_ and instead of the line number the byte offset is
+       returned. Only the SUMMARY and DTSTART lines are looked at.'''
+    buf = open_mmap(file_)
+    stats.bytes_in += len(buf)
+    scanner = ComponentScanner(buf, ("VEVENT",))
+    for (_, start, end) in stats.components(scanner):
+        entry = []
+        for prefixes in ((b"SUMMARY:", b"SUMMARY;"),
+                         (b"DTSTART:", b"DTSTART;")):
+            line = find_line(buf, start, end, prefixes, unfold=True,
+                             newline=scanner.newline)
+            if line is not None:
+                if str is not bytes:
+                    line = line.decode("utf-8")
+                entry.append(line)
+        key = (get_key_field(entry, "SUMMARY"),
+               get_key_field(entry, "DTSTART"))
+        yield (key, start)
+
+
+def find_duplicates(source, mmap=False, stats=None):
+    '''Returns the VEVENT entries of an ical file with the same SUMMARY and
+       DTSTART, see ical_find_duplicates.py. The result is a list of tuples
+       (key, positions) in order of appearance, key is the tuple (SUMMARY,
+       DTSTART) and positions the line numbers of the entries, or their byte
+       offsets with mmap. With mmap the open binary file source is mapped
+       into memory and scanned. Raises ParseError if source cannot be
+       parsed.'''
+    if stats is None:
+        stats = Stats()
+    if mmap:
+        keys = _scan_keys(source, stats)
+    else:
+        keys = _read_keys(source, stats)
+
+    # Dictionary with ("SUMMARY", "DTSTART") tuples as key and the list of
+    # positions of the matching entries
+    duplicate_match = {}
+    # Keys having more than one entry, in order of appearance
+    duplicate_keys = []
+    for (key, position) in stats.timed(keys, "transform"):
+        positions = duplicate_match.get(key)
+        if positions is None:
+            duplicate_match[key] = [position]
+        else:
+            if len(positions) == 1:
+                duplicate_keys.append(key)
+            positions.append(position)
+    return [(key, duplicate_match[key]) for key in duplicate_keys]
+
+
+def get_revision(entry):
+    '''Returns what orders two versions of an entry, the tuple
+       (LAST-MODIFIED, SEQUENCE). Missing fields sort before all others.'''
+    last_modified = get_key_field(entry, "LAST-MODIFIED") or ""
+    try:
+        sequence = int(get_key_field(entry, "SEQUENCE"))
+    except (TypeError, ValueError):
+        sequence = -1
+    return (last_modified.strip(), sequence)
+
+
+def _get_event_key(component):
+    '''Returns the key of find_duplicates() for a VEVENT component and its
+       unfolded lines'''
+    entry = list(unfold_lines(component.lines))
+    return ((get_key_field(entry, "SUMMARY"), get_key_field(entry, "DTSTART")),
+            entry)
+
+
+def _find_newest(source):
+    '''First pass of dedupe_ical() with keep "newest": Returns a dictionary
+       key -> (revision, number, line number) of the newest VEVENT of each
+       key, number counting the VEVENT entries from 0'''
+    newest = {}
+    components = read_components(source, ("VEVENT",))
+    for (number, component) in enumerate(components):
+        (key, entry) = _get_event_key(component)
+        revision = get_revision(entry)
+        known = newest.get(key)
+        if known is None or revision > known[0]:
+            newest[key] = (revision, number, component.line_number)
+    return newest
+
+
+def dedupe_ical(source, output=None, keep="first", stats=None):
+    '''Writes source without the duplicate VEVENT entries found by
+       find_duplicates(), see ical_find_duplicates.py. All other components
+       (e.g. VTIMEZONE) and the lines outside of them are kept unchanged.
+       keep is one of KEEP_POLICIES: "first" keeps the first entry of each
+       group in a single pass, "newest" the one with the highest
+       get_revision() (the first of those if equal). "newest" reads source
+       twice, so it has to be a file which can be rewound or the whole
+       content.
+
+       Returns the list of dropped entries, each a dictionary with UID,
+       SUMMARY, DTSTART, its line number "line" and the line number
+       "kept_line" of the entry kept instead. If output is None, the tuple
+       (written str, dropped entries) is returned. Raises ParseError if
+       source cannot be parsed.'''
+    if keep not in KEEP_POLICIES:
+        raise ValueError("Unknown keep policy %s" % (keep))
+    if stats is None:
+        stats = Stats()
+    result = output
+    if result is None:
+        result = _StringOutput()
+
+    newest = None
+    if keep == "newest":
+        with stats.phase("parse"):
+            newest = _find_newest(source)
+        if hasattr(source, "seek"):
+            source.seek(0)
+
+    def outside(line):
+        result.write(line + reader.lineending)
+
+    (components, reader) = _open_components(source, ICAL_COMPONENTS, outside,
+                                            False, stats)
+    # key -> (VEVENT number, line number) of the kept entry for keep "first"
+    kept = {}
+    dropped = []
+    number = -1
+    for component in components:
+        if component.name == "VEVENT":
+            number += 1
+            (key, entry) = _get_event_key(component)
+            if newest is None:
+                (kept_number, kept_line) = kept.setdefault(
+                    key, (number, component.line_number))
+                is_kept = kept_number == number
+            else:
+                (_, kept_number, kept_line) = newest[key]
+                is_kept = kept_number == number
+            if not is_kept:
+                dropped.append({
+                    "UID": get_key_field(entry, "UID"),
+                    "SUMMARY": key[0],
+                    "DTSTART": key[1],
+                    "line": component.line_number,
+                    "kept_line": kept_line,
+                })
+                continue
+        # Entries given as lines keep the line ending of the input
+        lineending = "\n"
+        if reader is not None and reader.lineending:
+            lineending = reader.lineending
+        result.write(format_entry(component.lines, component.name,
+                                  lineending))
+    if output is None:
+        return (result.getvalue(), dropped)
+    return dropped
+
+
+########### contact duplicates #############
+
+class _UnionFind(object):
+    '''Disjoint sets of the numbers 0 .. n-1, with union by size and path
+       halving, so that a sequence of operations takes almost linear time'''
+
+    def __init__(self):
+        self.parent = []
+        self.size = []
+
+    def add(self):
+        '''Adds a new set with one member and returns its number'''
+        self.parent.append(len(self.parent))
+        self.size.append(1)
+        return len(self.parent) - 1
+
+    def find(self, number):
+        '''Returns the representative of the set of number'''
+        parent = self.parent
+        while parent[number] != number:
+            parent[number] = parent[parent[number]]
+            number = parent[number]
+        return number
+
+    def union(self, first, second):
+        '''Joins the sets of first and second'''
+        first = self.find(first)
+        second = self.find(second)
+        if first == second:
+            return
+        if self.size[first] < self.size[second]:
+            (first, second) = (second, first)
+        self.parent[second] = first
+        self.size[first] += self.size[second]
+
+
+def get_contact_keys(entry, min_phone_digits=MIN_PHONE_DIGITS):
+    '''Returns the set of keys by which possible duplicates of the vcard
+       entry (list of unfolded lines) are found: its lower case email
+       addresses and the digits of its phone numbers. Phone numbers with
+       less than min_phone_digits digits are ignored.'''
+    keys = set()
+    for (_, address) in get_fields(entry, "EMAIL"):
+        address = address.strip().lower()
+        if address:
+            keys.add("EMAIL:" + address)
+    for (_, number) in get_fields(entry, "TEL"):
+        number = filter_phone_number(number, "")
+        if len(number) >= min_phone_digits:
+            keys.add("TEL:" + number)
+    return keys
+
+
+def _get_contact_name(entry):
+    '''Returns the FN of a vcard entry, or else its N'''
+    name = get_key_field(entry, "FN")
+    if name:
+        return name
+    fields = get_fields(entry, "N")
+    if fields:
+        return " ".join([part for part in parse_and_split_field(fields[0])
+                         if part])
+    return ""
+
+
+def find_contact_duplicates(source, min_phone_digits=MIN_PHONE_DIGITS,
+                            stats=None):
+    '''Returns the possible duplicates among the VCARD entries of source,
+       see vcf_find_duplicates.py. Entries sharing an email address or
+       phone number (see get_contact_keys()) are duplicates, also
+       transitively. Each key is only compared with the first entry having
+       it, so the time grows linearly with the number of entries.
+
+       The result is a list of clusters in order of their first entry, each
+       a list of tuples (UID, line number, name) in order of appearance.
+       UID is None for entries without UID. Raises ParseError if source
+       cannot be parsed.'''
+    if stats is None:
+        stats = Stats()
+    sets = _UnionFind()
+    # key -> number of the first entry with that key
+    first = {}
+    contacts = []
+    for component in read_components(source, ("VCARD",), unfold=True,
+                                      stats=stats):
+        entry = component.lines
+        number = sets.add()
+        contacts.append((get_field(entry, "UID"), component.line_number,
+                         _get_contact_name(entry)))
+        for key in get_contact_keys(entry, min_phone_digits):
+            known = first.setdefault(key, number)
+            if known != number:
+                sets.union(known, number)
+    del first
+
+    with stats.phase("transform"):
+        clusters = {}
+        order = []
+        for number in range(len(contacts)):
+            if sets.size[sets.find(number)] < 2:
+                continue
+            root = sets.find(number)
+            cluster = clusters.get(root)
+            if cluster is None:
+                cluster = clusters[root] = []
+                order.append(root)
+            cluster.append(contacts[number])
+    return [clusters[root] for root in order]
+
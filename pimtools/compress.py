@@ -0,0 +1,197 @@
+""" pimtools.compress
+
+    Transparent reading and writing of gzip, bzip2 and xz compressed files"""
+#
+#    Copyright (C) 2014-2020 Georg Lutz <georg AT NOSPAM georglutz DOT de>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Compressed input files are recognized by their first bytes, so the name
+# does not matter. The compression of output files is chosen by the
+# extension of their name. The data is compressed and decompressed while it
+# is read or written, nothing is unpacked to a temporary file.
+#
+# xz needs the lzma module of Python 3.
+
+import bz2
+import gzip
+import io
+
+try:
+    import lzma
+except ImportError:
+    # python 2
+    lzma = None
+
+# Magic bytes at the start of a compressed file and the compression
+MAGIC = (
+    (b"\x1f\x8b", "gzip"),
+    (b"BZh", "bz2"),
+    (b"\xfd7zXZ\x00", "xz"),
+)
+
+# File name extensions and the compression to use for output files
+EXTENSIONS = (
+    (".gz", "gzip"),
+    (".bz2", "bz2"),
+    (".xz", "xz"),
+)
+
+# Supported compressions
+COMPRESSIONS = tuple([compression for (_, compression) in EXTENSIONS])
+
+
+def _get_types():
+    '''Returns the tuple of file classes returned for compressed files'''
+    types = [gzip.GzipFile, bz2.BZ2File]
+    if lzma is not None:
+        types.append(lzma.LZMAFile)
+    return tuple(types)
+
+
+_COMPRESSED_TYPES = _get_types()
+
+
+def get_data_compression(data):
+    '''Returns the compression of the bytes data from its first bytes,
+       None if it is not compressed'''
+    for (magic, compression) in MAGIC:
+        if data.startswith(magic):
+            return compression
+    return None
+
+
+def detect_compression(file_name):
+    '''Returns the compression of the file file_name from its first bytes,
+       None if it is not compressed'''
+    with open(file_name, "rb") as file_:
+        return get_data_compression(
+            file_.read(max([len(magic) for (magic, _) in MAGIC])))
+
+
+def get_compression(file_name):
+    '''Returns the compression for the extension of file_name, None if it
+       has no known extension'''
+    for (extension, compression) in EXTENSIONS:
+        if file_name.lower().endswith(extension):
+            return compression
+    return None
+
+
+def get_extension(compression):
+    '''Returns the file name extension of compression'''
+    for (extension, name) in EXTENSIONS:
+        if name == compression:
+            return extension
+    raise ValueError("Unknown compression %s" % (compression))
+
+
+def can_append(compression):
+    '''Returns True if data compressed separately with compression can be
+       appended to a file and is read back as one. Python 2 only reads the
+       first stream of a bz2 file.'''
+    return not (compression == "bz2" and str is bytes)
+
+
+def is_compressed(file_):
+    '''Returns True if the open file_ was opened by open_input() or
+       open_output() for a compressed file'''
+    return isinstance(getattr(file_, "buffer", file_), _COMPRESSED_TYPES)
+
+
+def _open_plain(file_name, mode, kwargs):
+    '''Opens the uncompressed file_name, see open_input()'''
+    if str is bytes:
+        # python 2: open() takes no encoding or newline
+        return open(file_name, mode)
+    return open(file_name, mode, **kwargs)
+
+
+def _open(file_name, mode, compression, kwargs):
+    '''Opens file_name with compression, see open_input()'''
+    if compression == "xz" and lzma is None:
+        raise IOError("%s: xz compression needs Python 3" % (file_name))
+    if str is bytes:
+        # python 2: only binary files, which are str anyway
+        mode = mode.replace("t", "").replace("b", "")
+        if compression == "gzip":
+            return gzip.GzipFile(file_name, mode + "b")
+        return bz2.BZ2File(file_name, mode)
+    if "b" not in mode and "t" not in mode:
+        mode += "t"
+    if compression == "gzip":
+        return gzip.open(file_name, mode, **kwargs)
+    if compression == "bz2":
+        return bz2.open(file_name, mode, **kwargs)
+    return lzma.open(file_name, mode, **kwargs)
+
+
+def open_input(file_name, mode="r", **kwargs):
+    '''Opens file_name for reading like open(). Compressed files are
+       recognized by their content and decompressed while read. kwargs are
+       passed to open() with Python 3, e.g. encoding or newline="" to keep
+       CRLF line endings, and ignored with Python 2. Raises IOError if the
+       file cannot be opened or the compression is not supported.'''
+    compression = detect_compression(file_name)
+    if compression is None:
+        return _open_plain(file_name, mode, kwargs)
+    return _open(file_name, mode, compression, kwargs)
+
+
+def open_output(file_name, mode="w", compression=None, **kwargs):
+    '''Opens file_name for writing like open(). The data is compressed if
+       compression or else the extension of file_name is one of EXTENSIONS.
+       Raises IOError if the file cannot be opened or the compression is
+       not supported.'''
+    if compression is None:
+        compression = get_compression(file_name)
+    if compression is None:
+        return _open_plain(file_name, mode, kwargs)
+    return _open(file_name, mode, compression, kwargs)
+
+
+def decompress(data):
+    '''Returns the bytes data decompressed if they start with the magic
+       bytes of a compression, else unchanged'''
+    compression = get_data_compression(data)
+    if compression is None:
+        return data
+    if compression == "gzip":
+        file_ = gzip.GzipFile(fileobj=io.BytesIO(data), mode="rb")
+        data = file_.read()
+        file_.close()
+        return data
+    if compression == "bz2":
+        return bz2.decompress(data)
+    if lzma is None:
+        raise IOError("xz compression needs Python 3")
+    return lzma.decompress(data)
+
+
+def compress(data, compression):
+    '''Returns the bytes data compressed with compression. gzip data does
+       not contain a timestamp, so the result only depends on data.'''
+    if compression == "gzip":
+        buf = io.BytesIO()
+        file_ = gzip.GzipFile(fileobj=buf, mode="wb", mtime=0)
+        file_.write(data)
+        file_.close()
+        return buf.getvalue()
+    if compression == "bz2":
+        return bz2.compress(data)
+    if compression == "xz":
+        if lzma is None:
+            raise IOError("xz compression needs Python 3")
+        return lzma.compress(data)
+    raise ValueError("Unknown compression %s" % (compression))
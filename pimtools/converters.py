@@ -0,0 +1,288 @@
+""" pimtools.converters
+
+    The per entry conversions of the scripts"""
+#
+#    Copyright (C) 2010-2020 Georg Lutz <georg AT NOSPAM georglutz DOT de>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import datetime
+import logging
+import quopri
+import re
+
+
+########### jpilot ical to egroupware #############
+
+def add_one_day(date):
+    '''Adds one day from a given date. date is expected to be in the form
+    "YYYYmmdd" like 20101221. In case of an error the given date is returned.'''
+    result = date
+    try:
+        timestamp = datetime.datetime.strptime(date, "%Y%m%d")
+        new_timestamp = timestamp + datetime.timedelta(days=1)
+        result = new_timestamp.strftime("%Y%m%d")
+    except ValueError:
+        logging.error("add_one_day(): Cannot parse date %s" % (date))
+    return result
+
+
+def subtract_one_day(date):
+    '''Substracts one day from a given date. date is expected to be in the form
+    "YYYYmmdd" like 20101221. In case of an error the given date is returned.'''
+    result = date
+    try:
+        timestamp = datetime.datetime.strptime(date, "%Y%m%d")
+        new_timestamp = timestamp - datetime.timedelta(days=1)
+        result = new_timestamp.strftime("%Y%m%d")
+    except ValueError:
+        logging.error("subtract_one_day(): Cannot parse date %s" % (date))
+    return result
+
+
+def parse_until_date(rrule):
+    '''Parses the UNTIL date out of an rrule. Returns empty string on parse error'''
+    result = ""
+    match = re.match("FREQ=[A-Z]+;UNTIL=(?P<until>[a-zA-Z0-9]+)", rrule)
+    if match is not None:
+        result = match.group("until")
+    return result
+
+
+def correct_rrule(rrule):
+    '''Expects a date value in the UNTIL section of an recurrence event and
+    returns the corrected value. For some unknown reason jpilot exports these
+    dates with an additional day at the end, at least in version 1.6.2.9. In case
+    that it cannot be corrected this function returns the given rrule.'''
+    result = rrule
+    old_date = parse_until_date(rrule)
+    if len(old_date) > 0:
+        new_date = subtract_one_day(old_date)
+        result = rrule.replace("UNTIL=" + old_date, "UNTIL=" + new_date)
+    return result
+
+
+def tweak_jpilot_to_egw(entry, category=""):
+    '''Actually does the ical conversation of a single entry so that it can be
+       imported into EGW. entry is a pimtools.entry.Entry which is modified in
+       place and returned. If category is given, it replaces the categories
+       of the entry.'''
+    if len(category) > 0:
+        entry.set("CATEGORIES", category)
+
+    # Usually jpilot doubles the information in the summary field. The description
+    # field should contain more detailed information. So we just delete it if the
+    # information is the same
+    summary = entry.get("SUMMARY")
+    if summary is not None and summary == entry.get("DESCRIPTION"):
+        entry.delete("DESCRIPTION")
+
+    # jpilot has a day to much, at least in version 1.6.2.9
+    rrule = entry.get("RRULE")
+    if rrule is not None:
+        entry.set("RRULE", correct_rrule(rrule))
+
+    # EGW cannot handle non existing DTEND fields, even is a recurrence rule is given
+    # jpilot does not seem to set and end date in case that the event is the whole day
+    if not entry.has("DTEND"):
+        # Sometimes jpilot uses this format
+        date_start = entry.get("DTSTART;VALUE=DATE")
+        if date_start is None:
+            logging.error("Cannot distill end date")
+        else:
+            entry.set("DTEND", add_one_day(date_start))
+
+    return entry
+
+
+########### egroupware vcard to gammu / nokia 2730 #############
+
+def filter_phone_number(number, extra="+"):
+    '''Returns number without all characters except digits and those in
+       extra'''
+    new_nr = ""
+    for char in number:
+        if ((char >= "0") and (char <= "9")) or (char in extra):
+            new_nr += char
+    return new_nr
+
+
+def tweak_egw_to_gammu(entry):
+    '''Actually does the vcard conversation of a single entry so that it can be
+       imported into gammu / nokia phone. entry is a pimtools.entry.Entry which
+       is modified in place and returned.'''
+    tel_nrs = entry.get_all("TEL")
+    for nr in tel_nrs:
+        # nokia / gammu doesn't accept work cellphones, but multiple CELL entries are OK
+        if nr[0] == "TEL;CELL;WORK":
+            nr[0] = "TEL;CELL"
+        # nokia / gammu doesn't accept anything else - except "+" in phone number
+        nr[1] = filter_phone_number(nr[1])
+
+    entry.delete_all("TEL")
+    for nr in tel_nrs:
+        entry.append(nr[0], nr[1])
+
+    # nokia / gammu supports multiple email addresses but ignores email
+    # addresses with specifiers like "EMAIL;WORK"
+    email_addrs = entry.get_all("EMAIL")
+    entry.delete_all("EMAIL")
+    for addr in email_addrs:
+        entry.append("EMAIL", addr[1])
+
+    # Same for "URL"
+    urls = entry.get_all("URL")
+    entry.delete_all("URL")
+    for url in urls:
+        entry.append("URL", url[1])
+
+    # Delete empty ORG field as nokia would display two semicolons
+    if entry.get("ORG") == ";;":
+        entry.delete("ORG")
+
+    # gammu/wammu/phone throws an error when reaching an entry with BDAY, so remove it
+    entry.delete("BDAY")
+
+    return entry
+
+
+########### egroupware vcard to owncloud #############
+
+def fix_continuation_lines(lines):
+    '''Generator returning the lines of a vcard entry with the egroupware
+       line continuation replaced by regular folding'''
+    # Deals mainly with the situation that imported egroupware contacts have
+    # the line contination / folding wrong (e.g. only the first line of a
+    # multiline note is shown).
+    # Egroupware encodes multiline fields with a "=0D=0A=" at the end of
+    # the to-be-continued line and the next line starts immedeately with
+    # the next byte:
+    #
+    # NOTE:;ENCODING=QUOTED-PRINTABLE:First line=0D=0A=
+    # Second line
+    #
+    # In contrast owncloud parses the last character of the line "=" as
+    # regular equal sign and expect the first character of the continued line
+    # to be a space:
+    #
+    # NOTE:;ENCODING=QUOTED-PRINTABLE:First line=0D=0A
+    #  Second line
+    is_cont = False
+    for line_in in lines:
+        if is_cont:
+            line_out = " " + line_in
+        else:
+            line_out = line_in
+
+        if line_out.endswith("="):
+            line_out = line_out[:-1]
+            is_cont = True
+        else:
+            is_cont = False
+
+        yield line_out
+
+
+########### vcard to mutt aliases #############
+
+def get_fields(list_, field):
+    '''Returns a list of tupels (fieldname, content) of all found VCARD fields.
+       Field can either be a complete field name or be followed by a specifier
+       (seperated by ";").'''
+    result = []
+    for line in list_:
+        if line.find(field + ":") == 0 or \
+        (line.find(field + ";") == 0 and line.find(":") > line.find(field + ";")):
+            entry = line.split(":", 1) # split only at the first occurence of ":"
+            # Make sure that tuple is returned in case of emtpy field
+            if len(entry) == 1:
+                entry.append("")
+            result.append(entry)
+    return result
+
+
+def parse_and_split_field(field):
+    '''Parses a VCARD field. field is a tuple consisting of the field name and the field content.
+       The content is decoded (if quoted printable) and de-splited by ";". The return value is a
+       list consisting of the splitted values.'''
+    result = []
+    if len(field) != 2:
+        return result
+    if field[0].find("ENCODING=QUOTED-PRINTABLE") > 0:
+        value = field[1]
+        if isinstance(value, bytes):
+            value = quopri.decodestring(value)
+        else:
+            # quopri only works on bytes in python 3
+            value = quopri.decodestring(value.encode("utf-8")).decode(
+                "utf-8", "replace")
+        result = value.split(";")
+    else:
+        result = field[1].split(";")
+    return result
+
+
+def get_mutt_aliases(entry):
+    '''Searches for email addresses in a VCARD entry. entry is the list of
+       lines of the entry. Returns a list of tuples (alias name, full name,
+       address), empty if there is no address or no name.'''
+    result = []
+
+    addresses = get_fields(entry, "EMAIL")
+    if not addresses:
+        return result
+
+    # The name of the entry. Will be used as base for alias name
+    entry_name = ""
+    full_name = ""
+
+    # First try: name (N) field
+    name = get_fields(entry, "N")
+    if name:
+        parsed_name = parse_and_split_field(name[0])
+        # First entry is the family name, second the given name
+        if len(parsed_name) >= 1:
+            entry_name += parsed_name[0].lower().replace(" ", "")
+            if len(parsed_name) > 1:
+                entry_name += parsed_name[1].lower().replace(" ", "")
+                full_name = parsed_name[1] + " " + parsed_name[0]
+
+    # We haven't found a valid name, try company (ORG) field:
+    if not entry_name:
+        org = get_fields(entry, "ORG")
+        if org:
+            parsed_name = parse_and_split_field(org[0])
+            if parsed_name:
+                entry_name = parsed_name[0].lower().replace(" ", "")
+                full_name = parsed_name[0]
+    if not entry_name:
+        logging.error("Cannot determine alias name. Ignore entry.")
+        return []
+
+    i = 1
+    for address in addresses:
+        if address[1]:
+            alias_name = entry_name
+            if i != 1:
+                alias_name += str(i)
+            result.append((alias_name, full_name, address[1]))
+            i += 1
+
+    return result
+
+
+def convert_to_mutt_aliases(entry):
+    '''Searches for email addresses in a VCARD entry and converts it to mutt aliases.
+       entry is the list of lines of the entry. Returns a list of mutt aliases'''
+    return ["alias %s %s <%s>" % alias for alias in get_mutt_aliases(entry)]
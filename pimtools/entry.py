@@ -0,0 +1,171 @@
+""" pimtools.entry
+
+    Property indexed representation of a single VCARD or VEVENT entry"""
+#
+#    Copyright (C) 2014-2020 Georg Lutz <georg AT NOSPAM georglutz DOT de>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+def split_key(line):
+    '''Returns the tuple (key, name) of a property line.
+
+       key is everything in front of the first ":", e.g. "TEL;CELL;WORK".
+       name is the property name without parameters, e.g. "TEL".
+       Returns (None, None) for lines without ":".'''
+    colon = line.find(":")
+    if colon < 0:
+        return (None, None)
+    key = line[:colon]
+    semicolon = key.find(";")
+    if semicolon < 0:
+        return (key, key)
+    return (key, key[:semicolon])
+
+
+def _unfold(prop):
+    '''Joins the physical lines of a stored property'''
+    if "\n" not in prop:
+        return prop
+    parts = prop.split("\n")
+    return parts[0] + "".join([part[1:] for part in parts[1:]])
+
+
+class Entry(object):
+    '''A VCARD or VEVENT entry (without BEGIN and END tags) with an index
+       from property keys and names to their positions.
+
+       Lookup, replacement, deletion and appending of properties do not
+       scan the whole entry. The original order of the properties and the
+       folding of unchanged properties is kept. Iterating over an entry
+       returns its lines.
+
+       The lookup functions come in two flavours:
+        - get(), set() and delete() take the complete key in front of the
+          ":", e.g. "DTSTART;VALUE=DATE" and only match exactly this key.
+        - get_all() and delete_all() take the property name, e.g. "TEL" and
+          match all properties regardless of their parameters.'''
+    __slots__ = ("_props", "_by_key", "_by_name")
+
+    def __init__(self, lines=()):
+        # Properties in order, folded properties are stored with their
+        # physical lines joined by "\n". Deleted properties are set to None.
+        self._props = []
+        self._by_key = {}
+        self._by_name = {}
+        for line in lines:
+            if line[:1] in (" ", "\t") and self._props:
+                self._props[-1] += "\n" + line
+            else:
+                self._add(line)
+
+    def _add(self, line):
+        '''Appends a property line and indexes it'''
+        pos = len(self._props)
+        self._props.append(line)
+        (key, name) = split_key(line)
+        if key is not None:
+            self._by_key.setdefault(key, []).append(pos)
+            self._by_name.setdefault(name, []).append(pos)
+
+    def _remove(self, pos):
+        '''Deletes the property at the given position from entry and index'''
+        (key, name) = split_key(self._props[pos])
+        self._props[pos] = None
+        positions = self._by_key[key]
+        positions.remove(pos)
+        if not positions:
+            del self._by_key[key]
+        positions = self._by_name[name]
+        positions.remove(pos)
+        if not positions:
+            del self._by_name[name]
+
+    def __getstate__(self):
+        return (self._props, self._by_key, self._by_name)
+
+    def __setstate__(self, state):
+        (self._props, self._by_key, self._by_name) = state
+
+    def __iter__(self):
+        for prop in self._props:
+            if prop is None:
+                continue
+            if "\n" in prop:
+                for line in prop.split("\n"):
+                    yield line
+            else:
+                yield prop
+
+    def lines(self):
+        '''Returns the lines of the entry as list'''
+        return list(self)
+
+    def has(self, key):
+        '''Returns True if a property with the given key exists'''
+        return key in self._by_key
+
+    def get(self, key):
+        '''Returns the (unfolded) value of the first property with the given
+           key. Returns None if the property is not found'''
+        positions = self._by_key.get(key)
+        if not positions:
+            return None
+        prop = _unfold(self._props[positions[0]])
+        return prop[len(key) + 1:]
+
+    def get_all(self, name):
+        '''Returns a list of [key, value] lists of all properties with the
+           given name, e.g. [["TEL;CELL", "+49..."], ["TEL;HOME", "089..."]]'''
+        result = []
+        for pos in self._by_name.get(name, ()):
+            prop = _unfold(self._props[pos])
+            result.append(prop.split(":", 1))
+        return result
+
+    def set(self, key, value):
+        '''Sets the first property with the given key. If it does not exist it
+           is appended.'''
+        positions = self._by_key.get(key)
+        if positions:
+            self._props[positions[0]] = key + ":" + value
+        else:
+            self._add(key + ":" + value)
+
+    def append(self, key, value):
+        '''Appends the property to the end of the entry'''
+        self._add(key + ":" + value)
+
+    def delete(self, key):
+        '''Removes the first property with the given key'''
+        positions = self._by_key.get(key)
+        if positions:
+            self._remove(positions[0])
+
+    def delete_all(self, name):
+        '''Removes all properties with the given name'''
+        positions = self._by_name.pop(name, None)
+        if not positions:
+            return
+        keys = set()
+        for pos in positions:
+            keys.add(split_key(self._props[pos])[0])
+            self._props[pos] = None
+        for key in keys:
+            remaining = [pos for pos in self._by_key[key]
+                         if self._props[pos] is not None]
+            if remaining:
+                self._by_key[key] = remaining
+            else:
+                del self._by_key[key]
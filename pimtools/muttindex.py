@@ -0,0 +1,210 @@
+""" pimtools.muttindex
+
+    Index of the mutt aliases of a vcard file, searched by mutt's
+    query_command without parsing the vcard file"""
+#
+#    Copyright (C) 2014-2020 Georg Lutz <georg AT NOSPAM georglutz DOT de>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# The index is a UTF-8 text file:
+#
+#   pimtools mutt index 1
+#   source <size> <mtime>      (of the vcard file when the index was built)
+#   tokens <offset>            (byte offset of the token section)
+#
+#   alias<TAB>full name<TAB>address       (one record per address)
+#   ...
+#   token<TAB>record offset               (sorted by token)
+#   ...
+#
+# The tokens are the lower case alias name, the words of the full name and
+# of ORG, the address, its domain and the parts of its local part. A query
+# looks up each of its words as prefix of the tokens by bisecting the memory
+# mapped token section, so only a few pages of the file are read.
+
+import os
+import re
+
+from .converters import get_fields, get_mutt_aliases, parse_and_split_field
+from .reader import ComponentReader
+from .scanner import open_mmap
+
+# First line of an index file
+INDEX_HEADER = "pimtools mutt index 1"
+
+# Splits names and the local part of addresses into tokens
+_TOKEN_SEPARATORS = re.compile(r"[\s.,;_+\-]+")
+
+
+def _clean(text):
+    '''Returns text without tabs and line breaks, which separate the fields
+       of the index'''
+    return " ".join(text.split())
+
+
+def get_tokens(alias_name, full_name, address, org=""):
+    '''Returns the set of lower case tokens a record is found by'''
+    tokens = set([alias_name.lower(), address.lower()])
+    parts = address.split("@", 1)
+    tokens.add(parts[-1].lower())
+    for text in (full_name, org, parts[0]):
+        tokens.update(_TOKEN_SEPARATORS.split(text.lower()))
+    tokens.discard("")
+    return tokens
+
+
+def _encode(text):
+    '''Returns text as UTF-8 bytes'''
+    if isinstance(text, bytes):
+        return text
+    return text.encode("utf-8")
+
+
+def build_mutt_index(vcard_file, index_file_name):
+    '''Reads the open vcard_file and writes the index of its mutt aliases
+       to index_file_name. A temporary file is renamed, so queries never see
+       a half written index. Returns the number of records. Raises
+       ParseError if vcard_file cannot be parsed.'''
+    records = []
+    tokens = []
+    offset = 0
+    for component in ComponentReader(vcard_file, ("VCARD",)):
+        org = ""
+        org_fields = get_fields(component.lines, "ORG")
+        if org_fields:
+            org = " ".join(parse_and_split_field(org_fields[0]))
+        for (alias_name, full_name, address) in get_mutt_aliases(
+                component.lines):
+            record = _encode("%s\t%s\t%s\n" % (
+                _clean(alias_name), _clean(full_name), _clean(address)))
+            for token in get_tokens(alias_name, full_name, address, org):
+                tokens.append((_encode(_clean(token)), offset))
+            records.append(record)
+            offset += len(record)
+    tokens.sort()
+
+    stat = os.fstat(vcard_file.fileno())
+    header = _encode("%s\nsource %d %d\n" % (
+        INDEX_HEADER, stat.st_size, int(stat.st_mtime)))
+    # The length of the tokens line depends on the offset it contains
+    token_offset = len(header) + offset + 1
+    while True:
+        tokens_line = _encode("tokens %d\n\n" % (token_offset))
+        if len(header) + len(tokens_line) + offset == token_offset:
+            break
+        token_offset = len(header) + len(tokens_line) + offset
+    records_start = len(header) + len(tokens_line)
+
+    temp_file_name = index_file_name + ".tmp"
+    index_file = open(temp_file_name, "wb")
+    index_file.write(header)
+    index_file.write(tokens_line)
+    index_file.writelines(records)
+    for (token, record_offset) in tokens:
+        index_file.write(token + b"\t" + _encode(
+            "%d\n" % (records_start + record_offset)))
+    index_file.close()
+    os.rename(temp_file_name, index_file_name)
+    return len(records)
+
+
+class MuttIndex(object):
+    '''An index written by build_mutt_index(). Raises ValueError if
+       file_name is no index file.'''
+
+    def __init__(self, file_name):
+        self.file_ = open(file_name, "rb")
+        try:
+            if self.file_.readline().rstrip(b"\n") != _encode(INDEX_HEADER):
+                raise ValueError("%s is no mutt index file" % (file_name))
+            header = {}
+            for line in self.file_:
+                line = line.rstrip(b"\n")
+                if not line:
+                    break
+                (key, value) = line.split(b" ", 1)
+                header[key] = value
+            (size, mtime) = header[b"source"].split()
+            self.source_size = int(size)
+            self.source_mtime = int(mtime)
+            self.token_offset = int(header[b"tokens"])
+        except (KeyError, ValueError):
+            self.file_.close()
+            raise ValueError("%s is no mutt index file" % (file_name))
+        self.buf = open_mmap(self.file_)
+
+    def is_stale(self, vcard_file_name):
+        '''Returns True if the vcard file changed since the index was
+           built'''
+        stat = os.stat(vcard_file_name)
+        return (stat.st_size, int(stat.st_mtime)) != (self.source_size,
+                                                      self.source_mtime)
+
+    def _lower_bound(self, prefix):
+        '''Returns the offset of the first token line not less than prefix'''
+        buf = self.buf
+        low = self.token_offset
+        high = len(buf)
+        while low < high:
+            middle = (low + high) // 2
+            begin = buf.rfind(b"\n", self.token_offset, middle) + 1
+            if begin == 0:
+                begin = self.token_offset
+            end = buf.find(b"\n", middle)
+            if buf[begin:buf.find(b"\t", begin, end)] < prefix:
+                low = end + 1
+            else:
+                high = begin
+        return low
+
+    def find(self, prefix):
+        '''Returns the set of record offsets with a token starting with the
+           lower case prefix'''
+        prefix = _encode(prefix)
+        buf = self.buf
+        result = set()
+        pos = self._lower_bound(prefix)
+        while pos < len(buf):
+            end = buf.find(b"\n", pos)
+            (token, record_offset) = buf[pos:end].split(b"\t")
+            if not token.startswith(prefix):
+                break
+            result.add(int(record_offset))
+            pos = end + 1
+        return result
+
+    def query(self, text):
+        '''Returns the sorted list of records (alias, full name, address) of
+           the records found by all words of text'''
+        offsets = None
+        for word in text.lower().split():
+            found = self.find(word)
+            offsets = found if offsets is None else offsets & found
+            if not offsets:
+                return []
+        if offsets is None:
+            return []
+        result = []
+        for offset in offsets:
+            line = self.buf[offset:self.buf.find(b"\n", offset)]
+            if str is not bytes:
+                line = line.decode("utf-8")
+            result.append(tuple(line.split("\t")))
+        return sorted(result)
+
+    def close(self):
+        '''Closes the index file'''
+        self.buf.close()
+        self.file_.close()
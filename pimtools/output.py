@@ -0,0 +1,533 @@
+""" pimtools.output
+
+    Destinations for the single files written by the split scripts"""
+#
+#    Copyright (C) 2014-2020 Georg Lutz <georg AT NOSPAM georglutz DOT de>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# All writers have the same interface: list_names(), path(name),
+# write(name, data) and close(). Writers which can extend files also have
+# append(name, data), writers which can delete files remove(name). name is
+# a plain file name without directory, data are the bytes of the file. Name
+# collisions are handled by NameRegistry, the writers themselves overwrite
+# existing files.
+
+import hashlib
+import io
+import os
+import tarfile
+import threading
+import time
+import zipfile
+
+from .compress import EXTENSIONS, can_append, compress, get_extension
+
+try:
+    import queue
+except ImportError:
+    # python 2
+    import Queue as queue
+
+# Archive file name extensions and the tarfile mode to use, None for zip
+ARCHIVE_FORMATS = (
+    (".tar", "w|"),
+    (".tar.gz", "w|gz"),
+    (".tgz", "w|gz"),
+    (".tar.bz2", "w|bz2"),
+    (".tar.xz", "w|xz"),
+    (".zip", None),
+)
+
+# Default number of files waiting per thread of a ThreadedWriter
+DEFAULT_QUEUE_DEPTH = 16
+
+# What NameRegistry does if a name is used twice: stop with an error, write
+# to a name with a number appended or append the data to the existing file
+COLLISION_POLICIES = ("fail", "suffix", "group")
+
+# File name of the manifest of ManifestWriter in the output directory
+MANIFEST_NAME = ".pimtools_manifest"
+
+# File name of the index written by write_index() in the output directory
+INDEX_NAME = "index.txt"
+
+
+class NameCollisionError(Exception):
+    '''Raised by NameRegistry if a name is already used. The message is the
+       location of the existing file.'''
+    pass
+
+
+class DirectoryWriter(object):
+    '''Writes each file into a directory'''
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, name):
+        '''Returns the location of name for messages'''
+        return os.path.join(self.directory, name)
+
+    def list_names(self):
+        '''Returns the names of the files already in the directory'''
+        return set(os.listdir(self.directory))
+
+    def write(self, name, data):
+        '''Writes data to the file name'''
+        file_ = open(self.path(name), "wb")
+        file_.write(data)
+        file_.close()
+
+    def append(self, name, data):
+        '''Appends data to the file name'''
+        file_ = open(self.path(name), "ab")
+        file_.write(data)
+        file_.close()
+
+    def remove(self, name):
+        '''Deletes the file name'''
+        os.remove(self.path(name))
+
+    def close(self):
+        '''Nothing to do for directories'''
+        pass
+
+
+class ShardedDirectoryWriter(DirectoryWriter):
+    '''Writes each file into a tree of subdirectories below directory, so
+       that no directory gets too many entries. The subdirectories are the
+       first depth pairs of hex digits of the SHA-1 of the name without
+       extension, e.g. "ab/cd/name.vcf" for depth 2. The extension of a
+       compression is removed as well, so "name.vcf.gz" goes to the same
+       subdirectories as "name.vcf".'''
+
+    def __init__(self, directory, depth):
+        DirectoryWriter.__init__(self, directory)
+        self.depth = depth
+        self.created = set()
+
+    def relative_path(self, name):
+        '''Returns the path of name relative to directory'''
+        key = name
+        for (extension, _) in EXTENSIONS:
+            if key.endswith(extension):
+                key = key[:-len(extension)]
+                break
+        key = os.path.splitext(key)[0]
+        if not isinstance(key, bytes):
+            key = key.encode("utf-8")
+        digest = hashlib.sha1(key).hexdigest()
+        parts = [digest[2 * level:2 * level + 2] for level in range(self.depth)]
+        return os.path.join(*(parts + [name]))
+
+    def path(self, name):
+        '''Returns the location of name'''
+        return os.path.join(self.directory, self.relative_path(name))
+
+    def list_names(self):
+        '''Returns the names of the files already in the subdirectories'''
+        names = set()
+        for (root, _, files) in os.walk(self.directory):
+            relative_root = os.path.relpath(root, self.directory)
+            if relative_root.count(os.sep) == self.depth - 1 and \
+                    relative_root != os.curdir:
+                names.update(files)
+        return names
+
+    def write(self, name, data):
+        '''Writes data to the file name, creates the subdirectories if
+           needed'''
+        subdirectory = os.path.dirname(self.path(name))
+        if subdirectory not in self.created:
+            try:
+                os.makedirs(subdirectory)
+            except OSError:
+                # Exists already or created by another thread
+                if not os.path.isdir(subdirectory):
+                    raise
+            self.created.add(subdirectory)
+        DirectoryWriter.write(self, name, data)
+
+
+class TarWriter(object):
+    '''Writes all files as members of a tar archive. The archive is written
+       as a stream, so nothing is kept in memory.'''
+
+    def __init__(self, file_name, mode="w|"):
+        self.file_name = file_name
+        self.mtime = int(time.time())
+        try:
+            self.tar = tarfile.open(file_name, mode)
+        except tarfile.CompressionError as exc:
+            # e.g. xz with python 2
+            raise IOError("%s: %s" % (file_name, exc))
+
+    def path(self, name):
+        '''Returns the location of name for messages'''
+        return "%s:%s" % (self.file_name, name)
+
+    def list_names(self):
+        '''Returns an empty set, the archive is created from scratch'''
+        return set()
+
+    def write(self, name, data):
+        '''Adds data as member name'''
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = self.mtime
+        info.mode = 0o644
+        self.tar.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        '''Finishes the archive'''
+        self.tar.close()
+
+
+class ZipWriter(object):
+    '''Writes all files as deflated members of a zip archive'''
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.date_time = time.localtime()[:6]
+        self.zip = zipfile.ZipFile(file_name, "w", zipfile.ZIP_DEFLATED)
+
+    def path(self, name):
+        '''Returns the location of name for messages'''
+        return "%s:%s" % (self.file_name, name)
+
+    def list_names(self):
+        '''Returns an empty set, the archive is created from scratch'''
+        return set()
+
+    def write(self, name, data):
+        '''Adds data as member name'''
+        info = zipfile.ZipInfo(name, self.date_time)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.external_attr = 0o644 << 16
+        self.zip.writestr(info, data)
+
+    def close(self):
+        '''Writes the central directory and closes the archive'''
+        self.zip.close()
+
+
+class CompressingWriter(object):
+    '''Compresses each file before it is written by another writer and
+       appends the extension of the compression to its name, e.g. "uid.vcf"
+       is written as "uid.vcf.gz". The names seen by the caller stay the
+       same. Appended data is compressed separately, the decompressors read
+       such concatenated data as one file. There is no append() for bz2 with
+       Python 2, see pimtools.compress.can_append().'''
+
+    def __init__(self, writer, compression):
+        self.writer = writer
+        self.compression = compression
+        self.extension = get_extension(compression)
+        if hasattr(writer, "append") and can_append(compression):
+            self.append = self._append
+        if hasattr(writer, "remove"):
+            self.remove = self._remove
+
+    def path(self, name):
+        '''Returns the location of name for messages'''
+        return self.writer.path(name + self.extension)
+
+    def list_names(self):
+        '''Returns the names of the existing compressed files without the
+           extension'''
+        length = len(self.extension)
+        return set([name[:-length] for name in self.writer.list_names()
+                    if name.endswith(self.extension)])
+
+    def write(self, name, data):
+        '''Writes the compressed data to name with extension'''
+        self.writer.write(name + self.extension,
+                          compress(data, self.compression))
+
+    def _append(self, name, data):
+        '''Appends the compressed data to name with extension'''
+        self.writer.append(name + self.extension,
+                           compress(data, self.compression))
+
+    def _remove(self, name):
+        '''Deletes the file name with extension'''
+        self.writer.remove(name + self.extension)
+
+    def close(self):
+        '''Closes the writer'''
+        self.writer.close()
+
+
+class ThreadedWriter(object):
+    '''Hands the writes of another writer (usually a DirectoryWriter) to a
+       pool of threads, so that the open/write/close calls of several files
+       overlap. This helps on network file systems with a high latency per
+       file.
+
+       All writes and appends of the same name go to the same thread and
+       keep their order. At most queue_depth files per thread are waiting,
+       write() blocks if the queue is full. If writes fail, the error of the
+       earliest failed write is raised by write() or close() after all queued
+       writes are done, so the reported error does not depend on the timing.'''
+
+    def __init__(self, writer, threads, queue_depth=DEFAULT_QUEUE_DEPTH):
+        self.writer = writer
+        self.sequence = 0
+        self.errors = []
+        self.lock = threading.Lock()
+        self.queues = []
+        self.threads = []
+        for _ in range(threads):
+            queue_ = queue.Queue(queue_depth)
+            thread = threading.Thread(target=self._work, args=(queue_,))
+            thread.daemon = True
+            thread.start()
+            self.queues.append(queue_)
+            self.threads.append(thread)
+
+    def path(self, name):
+        '''Returns the location of name for messages'''
+        return self.writer.path(name)
+
+    def list_names(self):
+        '''Returns the names of the files existing before the first write'''
+        return self.writer.list_names()
+
+    def write(self, name, data):
+        '''Queues data to be written to name'''
+        self._put(self.writer.write, name, data)
+
+    def append(self, name, data):
+        '''Queues data to be appended to name'''
+        self._put(self.writer.append, name, data)
+
+    def remove(self, name):
+        '''Queues the deletion of name'''
+        self._put(self._remove, name, None)
+
+    def close(self):
+        '''Waits until all queued files are written'''
+        self._join()
+        if self.errors:
+            self._raise_error()
+        self.writer.close()
+
+    def _put(self, function, name, data):
+        '''Queues a call of function(name, data) in the thread for name'''
+        if self.errors:
+            self._raise_error()
+        queue_ = self.queues[hash(name) % len(self.queues)]
+        queue_.put((self.sequence, function, name, data))
+        self.sequence += 1
+
+    def _remove(self, name, _):
+        '''Calls remove() of the writer, signature as expected by _put()'''
+        self.writer.remove(name)
+
+    def _work(self, queue_):
+        '''Thread function writing the files of a queue'''
+        while True:
+            item = queue_.get()
+            if item is None:
+                break
+            (sequence, function, name, data) = item
+            try:
+                function(name, data)
+            except Exception as exc: # pylint: disable=broad-except
+                # Keep emptying the queue, write() would block otherwise
+                with self.lock:
+                    self.errors.append((sequence, exc))
+
+    def _join(self):
+        '''Stops the threads after they wrote all queued files'''
+        for queue_ in self.queues:
+            queue_.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.queues = []
+        self.threads = []
+
+    def _raise_error(self):
+        '''Raises the error of the earliest failed write'''
+        self._join()
+        self.errors.sort(key=lambda error: error[0])
+        raise self.errors[0][1]
+
+
+def read_manifest(file_name):
+    '''Returns the manifest file_name as dictionary name -> hash. Returns
+       an empty dictionary if the file does not exist.'''
+    manifest = {}
+    if not os.path.exists(file_name):
+        return manifest
+    file_ = open(file_name, "r")
+    for line in file_:
+        (hash_, name) = line.rstrip("\n").split("  ", 1)
+        manifest[name] = hash_
+    file_.close()
+    return manifest
+
+
+def write_manifest(manifest, file_name):
+    '''Writes the dictionary manifest (name -> hash) to file_name, one line
+       "hash  name" per file like sha1sum. A temporary file is renamed, so an
+       interrupted run does not leave a truncated manifest.'''
+    temp_file_name = file_name + ".tmp"
+    file_ = open(temp_file_name, "w")
+    for name in sorted(manifest):
+        file_.write("%s  %s\n" % (manifest[name], name))
+    file_.close()
+    os.rename(temp_file_name, file_name)
+
+
+class ManifestWriter(object):
+    '''Writes only files whose content changed since the last run.
+
+       The manifest file lists the name and the SHA-1 of the content of all
+       files written. Files of the last run which are not written again are
+       deleted by close() with the writer's remove(). With keep_removed set
+       they are kept and stay in the manifest. In both cases their names
+       are in removed after close().
+
+       Without manifest file (the first run) the files already in the
+       directory are adopted: they are overwritten instead of being reported
+       as name collisions and are kept by close().'''
+
+    def __init__(self, writer, manifest_file_name, keep_removed=False):
+        self.writer = writer
+        self.manifest_file_name = manifest_file_name
+        self.keep_removed = keep_removed
+        self.adopt = not os.path.exists(manifest_file_name)
+        self.old = read_manifest(manifest_file_name)
+        self.new = {}
+        self.existing = writer.list_names()
+        self.unchanged = 0
+        self.removed = []
+
+    def path(self, name):
+        '''Returns the location of name for messages'''
+        return self.writer.path(name)
+
+    def list_names(self):
+        '''Returns the names of the files existing before the first write
+           which were not written by the last run'''
+        if self.adopt:
+            return set()
+        names = self.existing.difference(self.old)
+        names.discard(os.path.basename(self.manifest_file_name))
+        names.discard(os.path.basename(self.manifest_file_name) + ".tmp")
+        return names
+
+    def write(self, name, data):
+        '''Writes data to name unless the file exists with the same
+           content'''
+        hash_ = hashlib.sha1(data).hexdigest()
+        self.new[name] = hash_
+        if self.old.get(name) == hash_ and name in self.existing:
+            self.unchanged += 1
+            return
+        self.writer.write(name, data)
+
+    def close(self):
+        '''Removes the files of the last run not written again and writes
+           the manifest'''
+        for name in sorted(self.old):
+            if name in self.new:
+                continue
+            self.removed.append(name)
+            if self.keep_removed:
+                self.new[name] = self.old[name]
+            elif name in self.existing:
+                self.writer.remove(name)
+        self.writer.close()
+        write_manifest(self.new, self.manifest_file_name)
+
+
+def write_index(index, file_name):
+    '''Writes the list of tuples (key, path) sorted by key to file_name,
+       one line "key<TAB>path" per tuple. A temporary file is renamed, so an
+       interrupted run does not leave a truncated index.'''
+    temp_file_name = file_name + ".tmp"
+    file_ = open(temp_file_name, "w")
+    for (key, path) in sorted(index):
+        file_.write("%s\t%s\n" % (key, path))
+    file_.close()
+    os.rename(temp_file_name, file_name)
+
+
+class NameRegistry(object):
+    '''Writes files to a writer and handles names used more than once,
+       either in the same run or by files already existing in the output
+       directory. The existing names are listed once when the registry is
+       created, afterwards all names are kept in memory.
+
+       policy is one of COLLISION_POLICIES. "group" needs a writer with
+       append() and only groups files of the same run, files existing before
+       are never changed.'''
+
+    def __init__(self, writer, policy="fail"):
+        if policy == "group" and not hasattr(writer, "append"):
+            raise ValueError("Collision policy group is not supported here")
+        self.writer = writer
+        self.policy = policy
+        self.existing = writer.list_names()
+        self.written = set()
+
+    def is_used(self, name):
+        '''Returns True if name exists already or was written before'''
+        return name in self.written or name in self.existing
+
+    def write(self, name, data):
+        '''Writes data to name and returns the name actually used, which
+           differs from name for the policy "suffix". Raises
+           NameCollisionError for the policy "fail".'''
+        if not self.is_used(name):
+            self.writer.write(name, data)
+            self.written.add(name)
+            return name
+        if self.policy == "group" and name in self.written:
+            self.writer.append(name, data)
+            return name
+        if self.policy == "suffix":
+            (base, extension) = os.path.splitext(name)
+            number = 1
+            while True:
+                number += 1
+                new_name = "%s_%d%s" % (base, number, extension)
+                if not self.is_used(new_name):
+                    break
+            self.writer.write(new_name, data)
+            self.written.add(new_name)
+            return new_name
+        raise NameCollisionError(self.writer.path(name))
+
+
+def get_archive_format(file_name):
+    '''Returns the tarfile mode for the extension of file_name, None for zip
+       archives. Raises ValueError for unknown extensions.'''
+    for (extension, mode) in ARCHIVE_FORMATS:
+        if file_name.lower().endswith(extension):
+            return mode
+    raise ValueError("Unknown archive format, use one of %s" % (
+        ", ".join([extension for (extension, _) in ARCHIVE_FORMATS])))
+
+
+def open_archive(file_name):
+    '''Returns a TarWriter or ZipWriter depending on the extension of
+       file_name. Raises ValueError for unknown extensions.'''
+    mode = get_archive_format(file_name)
+    if mode is None:
+        return ZipWriter(file_name)
+    return TarWriter(file_name, mode)
@@ -0,0 +1,206 @@
+""" pimtools.owncloud
+
+    Byte level rewriter preparing egroupware vcard exports for owncloud"""
+#
+#    Copyright (C) 2014-2020 Georg Lutz <georg AT NOSPAM georglutz DOT de>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# The file is read and written in large blocks of bytes. The lines of a
+# block are converted like pimtools.converters.fix_continuation_lines()
+# does, the output of a block is joined and written at once. Only one block
+# and the incomplete line at its end are held in memory. Before folding, the
+# continuation lines of an entry are joined to the logical line, so lines
+# folded in the input are not folded twice.
+
+from .reader import DEFAULT_MAX_ENTRY_SIZE, EntryTooLargeError, ParseError
+from .stats import Stats
+
+# Maximum length of an output line in octets without line ending, see
+# RFC6350 3.2
+FOLD_LENGTH = 75
+
+# Number of bytes read at once
+BLOCK_SIZE = 1024 * 1024
+
+
+def fold_line(line, length=FOLD_LENGTH):
+    '''Returns the bytes line folded into lines of at most length octets,
+       joined by CRLF and a space (RFC6350 3.2). UTF-8 sequences and quoted
+       printable escapes "=XX" are not split. length 0 disables folding.'''
+    if length <= 0 or len(line) <= length:
+        return line
+    pieces = []
+    start = 0
+    limit = length
+    while len(line) - start > limit:
+        end = start + limit
+        # Do not leave a last continuation line with only whitespace
+        if len(line) - end <= length - 1:
+            while end > start + 1 and not line[end:].strip():
+                end -= 1
+        # Move back to the first byte of an UTF-8 sequence
+        while end > start + 1 and b"\x80" <= line[end:end + 1] <= b"\xbf":
+            end -= 1
+        # Move back to the "=" of an escape ending after end
+        equal = line.rfind(b"=", max(start + 1, end - 2), end)
+        if equal >= 0:
+            end = equal
+        pieces.append(line[start:end])
+        start = end
+        # Continuation lines start with a space
+        limit = length - 1
+    pieces.append(line[start:])
+    return b"\r\n ".join(pieces)
+
+
+def _is_continuation(line):
+    '''Returns True if the bytes line continues the previous one'''
+    return line[:1] in (b" ", b"\t")
+
+
+def refold_lines(lines, length=FOLD_LENGTH):
+    '''Generator returning the logical lines of the bytes lines of an entry
+       (without BEGIN and END tags), each folded with fold_line(). Lines
+       are returned unchanged if length is 0.'''
+    if length <= 0:
+        for line in lines:
+            yield line
+        return
+    logical = None
+    for line in lines:
+        if logical is not None and _is_continuation(line):
+            logical += line[1:]
+            continue
+        if logical is not None:
+            yield fold_line(logical, length)
+        logical = line
+    if logical is not None:
+        yield fold_line(logical, length)
+
+
+def _is_marker(line, marker):
+    '''Returns True if line is marker followed by optional whitespace'''
+    return line.startswith(marker) and not line[len(marker):].strip()
+
+
+class OwncloudRewriter(object):
+    '''Converts the lines of an egroupware vcard export, see
+       rewrite_owncloud()'''
+
+    def __init__(self, fold_length, stats):
+        self.fold_length = fold_length
+        self.stats = stats
+        self.in_entry = False
+        self.is_cont = False
+        self.line_number = 0
+        self.begin_line_number = 0
+        self.entry_size = 0
+        # Unfolded line of the entry not yet written
+        self.logical = None
+
+    def _flush(self, out):
+        '''Appends the folded logical line to out'''
+        if self.logical is not None:
+            out.append(fold_line(self.logical, self.fold_length))
+            self.logical = None
+
+    def convert(self, lines):
+        '''Returns the converted bytes of lines, a list of lines without
+           line feed'''
+        out = []
+        fold_length = self.fold_length
+        for line in lines:
+            self.line_number += 1
+            line = line.rstrip(b"\r")
+            if not self.in_entry:
+                if _is_marker(line, b"BEGIN:VCARD"):
+                    self.in_entry = True
+                    self.is_cont = False
+                    self.entry_size = 0
+                    self.begin_line_number = self.line_number
+                    line = b"BEGIN:VCARD"
+                elif _is_marker(line, b"END:VCARD"):
+                    raise ParseError("Unexpected END:VCARD", self.line_number)
+            elif _is_marker(line, b"END:VCARD"):
+                self.in_entry = False
+                self.stats.entries += 1
+                self._flush(out)
+                line = b"END:VCARD"
+            elif _is_marker(line, b"BEGIN:VCARD"):
+                raise ParseError("Unexpected BEGIN:VCARD", self.line_number)
+            else:
+                self.entry_size += len(line)
+                if self.entry_size > DEFAULT_MAX_ENTRY_SIZE:
+                    raise EntryTooLargeError(
+                        "VCARD exceeds %d characters" % (
+                            DEFAULT_MAX_ENTRY_SIZE), self.begin_line_number)
+                # Egroupware continues a line ending with "=" (quoted
+                # printable) in the next line without leading space
+                if self.is_cont:
+                    line = b" " + line
+                else:
+                    self.stats.properties += 1
+                self.is_cont = line.endswith(b"=")
+                if self.is_cont:
+                    line = line[:-1]
+                if fold_length > 0:
+                    if self.logical is not None and _is_continuation(line):
+                        self.logical += line[1:]
+                    else:
+                        self._flush(out)
+                        self.logical = line
+                    continue
+            out.append(fold_line(line, fold_length))
+        if out:
+            out.append(b"")
+        return b"\r\n".join(out)
+
+    def close(self):
+        '''Raises ParseError if the last entry is not terminated'''
+        if self.in_entry:
+            raise ParseError("Missing END:VCARD", self.begin_line_number)
+
+
+def rewrite_owncloud(input_file, output_file, fold_length=FOLD_LENGTH,
+                     stats=None, block_size=BLOCK_SIZE):
+    '''Converts the egroupware vcard export input_file for owncloud like
+       vcf_egw_to_owncloud.py and writes it to output_file, both opened in
+       binary mode. Output lines end with CRLF and are folded at
+       fold_length octets, 0 disables folding. Memory use does not depend
+       on the size of the file. Raises ParseError if the input is not
+       properly structured.'''
+    if stats is None:
+        stats = Stats()
+    rewriter = OwncloudRewriter(fold_length, stats)
+    pending = b""
+    while True:
+        with stats.phase("read"):
+            block = input_file.read(block_size)
+        if not block:
+            break
+        stats.bytes_in += len(block)
+        with stats.phase("transform"):
+            lines = (pending + block).split(b"\n")
+            pending = lines.pop()
+            if len(pending) > DEFAULT_MAX_ENTRY_SIZE:
+                raise EntryTooLargeError("Line exceeds %d characters" % (
+                    DEFAULT_MAX_ENTRY_SIZE), rewriter.line_number + 1)
+            data = rewriter.convert(lines)
+        output_file.write(data)
+    if pending:
+        with stats.phase("transform"):
+            data = rewriter.convert([pending])
+        output_file.write(data)
+    rewriter.close()
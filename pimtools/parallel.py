@@ -0,0 +1,93 @@
+""" pimtools.parallel
+
+    Runs the per entry conversion of the scripts in multiple processes"""
+#
+#    Copyright (C) 2014-2020 Georg Lutz <georg AT NOSPAM georglutz DOT de>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+import multiprocessing
+
+# Number of entries sent to a worker process at once
+DEFAULT_CHUNK_SIZE = 256
+
+# Number of chunks per worker process which are in flight at the same time.
+# Limits the memory used for entries read ahead of the output.
+CHUNKS_PER_JOB = 2
+
+
+class _ChunkWorker(object):
+    '''Applies a function to all entries of a chunk. Picklable as long as
+       the function is defined on module level.'''
+
+    def __init__(self, function, args):
+        self.function = function
+        self.args = args
+
+    def __call__(self, chunk):
+        return [self.function(entry, *self.args) for entry in chunk]
+
+
+def _chunks(entries, chunk_size):
+    '''Generator returning lists of up to chunk_size entries'''
+    chunk = []
+    for entry in entries:
+        chunk.append(entry)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def get_jobs(jobs):
+    '''Returns the number of worker processes for the --jobs option: 0 means
+       one per CPU.'''
+    if jobs == 0:
+        return multiprocessing.cpu_count()
+    return jobs
+
+
+def map_entries(function, entries, jobs=1, args=(),
+                chunk_size=DEFAULT_CHUNK_SIZE):
+    '''Generator returning function(entry, *args) for all entries in the
+       original order.
+
+       With jobs > 1 the entries are handed out in chunks to a pool of jobs
+       worker processes. function, the entries and the results have to be
+       picklable, so function must be defined on module level. Only a
+       limited number of chunks is read ahead, so memory usage does not
+       depend on the input size.'''
+    if jobs <= 1:
+        for entry in entries:
+            yield function(entry, *args)
+        return
+
+    worker = _ChunkWorker(function, args)
+    pool = multiprocessing.Pool(jobs)
+    try:
+        pending = collections.deque()
+        for chunk in _chunks(entries, chunk_size):
+            pending.append(pool.apply_async(worker, (chunk,)))
+            if len(pending) >= jobs * CHUNKS_PER_JOB:
+                for result in pending.popleft().get():
+                    yield result
+        while pending:
+            for result in pending.popleft().get():
+                yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
@@ -0,0 +1,274 @@
+""" pimtools.pipeline
+
+    Runs several conversions over a single read of an ical or vcard file"""
+#
+#    Copyright (C) 2014-2020 Georg Lutz <georg AT NOSPAM georglutz DOT de>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# A pipeline has one input and any number of outputs. Each output is a chain
+# of transforms followed by a sink writing the result. The input is read and
+# parsed once. Each transform chain is run once per entry, outputs with the
+# same chain (or the same start of a chain) share the results.
+
+import sys
+
+from .api import format_entry, get_field, get_split_file_name
+from .compress import open_output
+from .converters import convert_to_mutt_aliases, fix_continuation_lines, \
+    tweak_egw_to_gammu, tweak_jpilot_to_egw
+from .entry import Entry
+from .output import DirectoryWriter, NameRegistry
+from .reader import ComponentReader, ICAL_COMPONENTS
+from .stats import Stats
+
+# Components read from the input
+PIPELINE_COMPONENTS = ICAL_COMPONENTS + ("VCARD",)
+
+
+def _owncloud(lines, category):
+    '''Transform "owncloud", see vcf_egw_to_owncloud.py'''
+    return list(fix_continuation_lines(lines))
+
+
+def _egw(lines, category):
+    '''Transform "egw", see ical_jpilot_to_egw.py. Only the entries are
+       converted, unlike the script other components and lines are kept and
+       no blank lines are added between the entries.'''
+    return tweak_jpilot_to_egw(Entry(lines), category).lines()
+
+
+def _gammu(lines, category):
+    '''Transform "gammu", see vcf_egw_to_gammu_nokia_2730.py'''
+    return tweak_egw_to_gammu(Entry(lines)).lines()
+
+
+# Transforms: name -> (function, components, line ending, entries only).
+# function(lines, category) returns the converted lines of an entry. Entries
+# of other components are passed unchanged. If line ending is not None, the
+# outputs use it instead of the one of the input. With entries only set, the
+# lines outside of entries are dropped and file outputs write an empty line
+# after each entry, like the script does.
+TRANSFORMS = {
+    "owncloud": (_owncloud, ("VCARD",), "\r\n", False),
+    "egw": (_egw, ("VEVENT",), None, False),
+    "gammu": (_gammu, ("VCARD",), "\n", True),
+}
+
+
+def _to_bytes(data):
+    '''Returns data encoded as UTF-8 if it is not bytes already'''
+    if isinstance(data, bytes):
+        return data
+    return data.encode("utf-8")
+
+
+class FileSink(object):
+    '''Writes the entries and the lines between them to a file, so that
+       without transforms the output equals the input. The input has to be
+       opened with newline="" with python 3 to keep CRLF line endings.'''
+
+    def __init__(self, file_):
+        self.file_ = file_
+
+    def outside(self, lines, lineending):
+        '''Writes lines outside of entries'''
+        for line in lines:
+            self.file_.write(line + lineending)
+
+    def entry(self, component, lines, lineending, blank_line=False):
+        '''Writes an entry including the BEGIN and END tags, followed by an
+           empty line if blank_line is set'''
+        self.file_.write("BEGIN:" + component + lineending)
+        for line in lines:
+            self.file_.write(line + lineending)
+        self.file_.write("END:" + component + lineending)
+        if blank_line:
+            self.file_.write(lineending)
+
+    def close(self):
+        '''Closes the file'''
+        self.file_.close()
+
+
+class SplitSink(object):
+    '''Writes each entry into a single file named after its UID, see
+       ical_split.py and vcf_split.py'''
+
+    def __init__(self, directory, policy="fail"):
+        self.registry = NameRegistry(DirectoryWriter(directory), policy)
+        self.no_uid_counter = 0
+
+    def outside(self, lines, lineending):
+        '''Lines outside of entries are not written'''
+        pass
+
+    def entry(self, component, lines, lineending, blank_line=False):
+        '''Writes an entry into its own file'''
+        uid = get_field(lines, "UID")
+        if uid is None:
+            self.no_uid_counter += 1
+            uid = "nouid_%03d" % (self.no_uid_counter)
+        data = format_entry(lines, component, lineending)
+        self.registry.write(get_split_file_name(component, uid),
+                            _to_bytes(data))
+
+    def close(self):
+        '''Closes the writer'''
+        self.registry.writer.close()
+
+
+class MuttSink(object):
+    '''Writes mutt aliases for the email addresses of vcard entries, see
+       vcf_egw_to_muttalias.py'''
+
+    def __init__(self, file_):
+        self.file_ = file_
+
+    def outside(self, lines, lineending):
+        '''Lines outside of entries are not written'''
+        pass
+
+    def entry(self, component, lines, lineending, blank_line=False):
+        '''Writes the aliases of a vcard entry'''
+        if component != "VCARD":
+            return
+        for alias in convert_to_mutt_aliases(lines):
+            self.file_.write(alias + "\n")
+
+    def close(self):
+        '''Closes the file'''
+        self.file_.close()
+
+
+# Names of the sinks, see open_sink()
+SINKS = ("file", "split", "mutt")
+
+
+def open_sink(sink, target, policy="fail", stats=None):
+    '''Returns the sink object for a sink name and its target, a file name
+       ("-" for STDOUT) or the directory for "split". policy is the collision
+       policy of "split". Output files are compressed according to their
+       extension and wrapped by stats.wrap_output().
+       Raises IOError if the file cannot be opened.'''
+    if sink == "split":
+        return SplitSink(target, policy)
+    if target == "-":
+        file_ = sys.stdout
+    else:
+        file_ = open_output(target, "w", newline="")
+    if stats is not None:
+        file_ = stats.wrap_output(file_)
+    if sink == "mutt":
+        return MuttSink(file_)
+    return FileSink(file_)
+
+
+def parse_output(spec):
+    '''Parses an output specification "[TRANSFORM+...+][SINK]=TARGET", e.g.
+       "owncloud+mutt=aliases.txt" and returns the tuple (transforms, sink,
+       target). sink defaults to "file". Raises ValueError for invalid
+       specifications.'''
+    if "=" not in spec:
+        raise ValueError("Output %s has no target, use NAME=TARGET" % (spec))
+    (names, target) = spec.split("=", 1)
+    names = [name for name in names.split("+") if name]
+    sink = "file"
+    if names and names[-1] in SINKS:
+        sink = names.pop()
+    for name in names:
+        if name not in TRANSFORMS:
+            raise ValueError("Unknown transform %s in output %s" % (
+                name, spec))
+    if not target:
+        raise ValueError("Output %s has no target" % (spec))
+    return (tuple(names), sink, target)
+
+
+class Pipeline(object):
+    '''Reads an ical or vcard file once and writes it to all outputs.
+
+       category is used by the transform "egw".'''
+
+    def __init__(self, category=""):
+        self.category = category
+        self.outputs = []
+
+    def add_output(self, transforms, sink):
+        '''Adds an output, transforms is a sequence of names of TRANSFORMS,
+           sink an object like FileSink'''
+        self.outputs.append((tuple(transforms), sink))
+
+    def _transform(self, component, transforms, results):
+        '''Returns the lines of an entry after the chain transforms. results
+           maps already converted chains to their lines.'''
+        lines = results.get(transforms)
+        if lines is None:
+            lines = self._transform(component, transforms[:-1], results)
+            (function, components, _, _) = TRANSFORMS[transforms[-1]]
+            if component in components:
+                lines = function(lines, self.category)
+            results[transforms] = lines
+        return lines
+
+    def _get_lineending(self, transforms, default):
+        '''Returns the line ending of an output with the given transforms'''
+        result = default
+        for name in transforms:
+            if TRANSFORMS[name][2] is not None:
+                result = TRANSFORMS[name][2]
+        return result
+
+    def _is_entries_only(self, transforms):
+        '''Returns True if an output with the given transforms only contains
+           the entries, each followed by an empty line'''
+        for name in transforms:
+            if TRANSFORMS[name][3]:
+                return True
+        return False
+
+    def _write_outside(self, lines, lineending):
+        '''Writes the lines outside of entries to all outputs'''
+        for (transforms, sink) in self.outputs:
+            if not self._is_entries_only(transforms):
+                sink.outside(lines,
+                             self._get_lineending(transforms, lineending))
+        del lines[:]
+
+    def run(self, file_, stats=None):
+        '''Reads file_ and writes all outputs. The outputs are closed
+           afterwards. Raises ParseError if the input cannot be parsed.'''
+        if stats is None:
+            stats = Stats()
+        outside = []
+        reader = ComponentReader(stats.wrap_input(file_), PIPELINE_COMPONENTS,
+                                 outside=outside.append)
+        for component in stats.components(reader):
+            if outside:
+                with stats.phase("write"):
+                    self._write_outside(outside, reader.lineending)
+            results = {(): component.lines}
+            for (transforms, sink) in self.outputs:
+                with stats.phase("transform"):
+                    lines = self._transform(component.name, transforms, results)
+                with stats.phase("write"):
+                    sink.entry(component.name, lines,
+                               self._get_lineending(transforms,
+                                                    reader.lineending),
+                               self._is_entries_only(transforms))
+        with stats.phase("write"):
+            if outside:
+                self._write_outside(outside, reader.lineending)
+            for (_, sink) in self.outputs:
+                sink.close()
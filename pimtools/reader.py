@@ -0,0 +1,170 @@
+""" pimtools.reader
+
+    Streaming reader splitting ical and vcard files into components"""
+#
+#    Copyright (C) 2014-2020 Georg Lutz <georg AT NOSPAM georglutz DOT de>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# The reader has to work with both python 2 and python 3 as it is shared
+# by all scripts.
+
+# RFC5545 components which can be found on the top level of an VCALENDAR
+ICAL_COMPONENTS = ("VEVENT", "VTODO", "VJOURNAL", "VFREEBUSY", "VTIMEZONE")
+
+# Upper limit for the size of a single component (without line endings).
+# Protects against unterminated components eating up all memory.
+DEFAULT_MAX_ENTRY_SIZE = 16 * 1024 * 1024
+
+
+class ParseError(Exception):
+    '''Raised when the input is not properly structured into components'''
+
+    def __init__(self, msg, line_number=None):
+        if line_number is not None:
+            msg = "%s at line %d" % (msg, line_number)
+        Exception.__init__(self, msg)
+        self.line_number = line_number
+
+
+class EntryTooLargeError(ParseError):
+    '''Raised when a single component exceeds the configured size limit'''
+
+
+class Component(object):
+    '''One component like VEVENT or VCARD.
+
+       name: The component name, e.g. "VCARD"
+       lines: The lines of the component without BEGIN/END marker and
+              without line endings
+       line_number: The line number of the BEGIN marker, starting from 1'''
+    __slots__ = ("name", "lines", "line_number")
+
+    def __init__(self, name, lines, line_number):
+        self.name = name
+        self.lines = lines
+        self.line_number = line_number
+
+
+def get_lineending(line):
+    '''Detects line ending of the given line and returns it.
+       Can be either \\n, \\r or \\r\\n.
+
+       Returns empty string if none of these is detected.
+    '''
+    # Take care to match the longest ones first:
+    possible_endings = ["\r\n", "\r", "\n"]
+    for ending in possible_endings:
+        if line.endswith(ending):
+            return ending
+    return ""
+
+
+def unfold(lines):
+    '''Generator joining folded lines (RFC5545 3.1, RFC6350 3.2). A line
+       starting with a space or a horizontal tab continues the previous
+       line, the leading whitespace character is removed.'''
+    pieces = []
+    for line in lines:
+        if line[:1] in (" ", "\t") and pieces:
+            pieces.append(line[1:])
+        else:
+            if pieces:
+                yield "".join(pieces)
+            pieces = [line]
+    if pieces:
+        yield "".join(pieces)
+
+
+class ComponentReader(object):
+    '''Iterates over the components of an ical or vcard file.
+
+       Only one component is held in memory at a time. Components nested
+       into a requested one (e.g. VALARM inside of VEVENT) are kept as
+       regular lines.
+
+       file_: An iterable of lines, usually an open file
+       names: The component names to return, e.g. ("VCARD",)
+       unfold: Join folded lines of the components
+       max_entry_size: Raise EntryTooLargeError if a single component
+                       exceeds this number of characters
+       outside: Optional function called for each line outside of a
+                requested component (e.g. VCALENDAR properties), without
+                line ending. The attribute may be changed while iterating.
+
+       After the first line has been read the attribute lineending contains
+       the line ending found in the file.'''
+
+    def __init__(self, file_, names, unfold=False,
+                 max_entry_size=DEFAULT_MAX_ENTRY_SIZE, outside=None):
+        self.file_ = file_
+        self.names = frozenset(names)
+        self.unfold = unfold
+        self.max_entry_size = max_entry_size
+        self.outside = outside
+        self.lineending = ""
+        self.line_number = 0
+
+    def __iter__(self):
+        names = self.names
+        max_entry_size = self.max_entry_size
+        line_number = 0
+        name = None # Name of the component we are in, None if outside
+        end_marker = ""
+        lines = []
+        size = 0
+        begin_line_number = 0
+
+        for line in self.file_:
+            line_number += 1
+            if line_number == 1:
+                self.lineending = get_lineending(line)
+            line = line.rstrip("\r\n")
+
+            if name is not None:
+                if line.startswith(end_marker) and \
+                        line[len(end_marker):].rstrip() == "":
+                    self.line_number = line_number
+                    if self.unfold:
+                        lines = list(unfold(lines))
+                    yield Component(name, lines, begin_line_number)
+                    name = None
+                    lines = []
+                    size = 0
+                    continue
+                if line.startswith("BEGIN:") and line[6:].rstrip() in names:
+                    raise ParseError("Unexpected BEGIN:%s" % (
+                        line[6:].rstrip()), line_number)
+                if line.startswith("END:") and line[4:].rstrip() in names:
+                    raise ParseError("Unexpected END:%s" % (
+                        line[4:].rstrip()), line_number)
+                size += len(line)
+                if size > max_entry_size:
+                    raise EntryTooLargeError(
+                        "%s exceeds %d characters" % (name, max_entry_size),
+                        begin_line_number)
+                lines.append(line)
+            elif line.startswith("BEGIN:") and line[6:].rstrip() in names:
+                name = line[6:].rstrip()
+                end_marker = "END:" + name
+                begin_line_number = line_number
+            elif line.startswith("END:") and line[4:].rstrip() in names:
+                raise ParseError("Unexpected END:%s" % (
+                    line[4:].rstrip()), line_number)
+            elif self.outside is not None:
+                self.outside(line)
+
+        self.line_number = line_number
+        if name is not None:
+            raise ParseError("Missing END:%s" % (name), begin_line_number)
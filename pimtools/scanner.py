@@ -0,0 +1,143 @@
+""" pimtools.scanner
+
+    Locates components in memory mapped ical and vcard files"""
+#
+#    Copyright (C) 2014-2020 Georg Lutz <georg AT NOSPAM georglutz DOT de>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# In contrast to pimtools.reader nothing is decoded here: The scanner
+# searches the raw bytes for BEGIN:/END: markers and returns offsets only.
+# The caller picks the fields it needs with find_line() or slices the buffer.
+
+import mmap
+
+from .reader import ParseError
+
+
+def open_mmap(file_):
+    '''Maps the given open file read-only into memory. Returns an empty bytes
+       object for empty files as those cannot be mapped.'''
+    try:
+        return mmap.mmap(file_.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        # mmap refuses to map empty files
+        return b""
+
+
+def get_lineending(buf):
+    '''Returns the line ending of the first line in buf (as bytes)'''
+    eol = buf.find(b"\n")
+    if eol < 0:
+        if buf.find(b"\r") >= 0:
+            return b"\r"
+        return b""
+    if eol > 0 and buf[eol - 1:eol] == b"\r":
+        return b"\r\n"
+    return b"\n"
+
+
+def get_newline(buf):
+    '''Returns the byte ending the lines of buf: b"\\r" for old Mac files
+       with CR only line endings, else b"\\n"'''
+    if get_lineending(buf) == b"\r":
+        return b"\r"
+    return b"\n"
+
+
+def _line_end(buf, pos, limit, newline=b"\n"):
+    '''Returns the offset behind the line ending of the line containing pos'''
+    eol = buf.find(newline, pos, limit)
+    if eol < 0:
+        return limit
+    return eol + 1
+
+
+class ComponentScanner(object):
+    '''Iterates over the components of a buffer (usually a mmap object).
+
+       Returns tuples (name, start, end) where name is the component name
+       (str) and buf[start:end] is the whole component including the BEGIN
+       and END lines and the line ending of the END line.
+
+       buf: bytes like object supporting find(), e.g. mmap.mmap
+       names: The component names to return, e.g. ("VCARD",)
+
+       The attribute newline contains the byte ending the lines, see
+       get_newline(). Pass it to find_line().'''
+
+    def __init__(self, buf, names):
+        self.buf = buf
+        self.newline = get_newline(buf)
+        self.names = {}
+        for name in names:
+            self.names[name.encode("ascii")] = name
+
+    def __iter__(self):
+        buf = self.buf
+        newline = self.newline
+        size = len(buf)
+        pos = 0
+        while True:
+            begin = buf.find(b"BEGIN:", pos)
+            if begin < 0:
+                break
+            eol = _line_end(buf, begin, size, newline)
+            if begin > 0 and buf[begin - 1:begin] not in (b"\n", b"\r"):
+                pos = begin + 6
+                continue
+            name_bytes = buf[begin + 6:eol].rstrip()
+            name = self.names.get(name_bytes)
+            if name is None:
+                pos = eol
+                continue
+
+            end_marker = newline + b"END:" + name_bytes
+            search = eol - 1
+            while True:
+                marker = buf.find(end_marker, search)
+                if marker < 0:
+                    raise ParseError("Missing END:%s for BEGIN at offset %d"
+                                     % (name, begin))
+                end = _line_end(buf, marker + 1, size, newline)
+                if buf[marker + len(end_marker):end].strip() == b"":
+                    break
+                search = marker + 1
+            yield (name, begin, end)
+            pos = end
+
+
+def find_line(buf, start, end, prefixes, unfold=False, newline=b"\n"):
+    '''Returns the first line between the offsets start and end beginning
+       with one of the given prefixes (bytes), e.g. (b"UID:",). The line
+       ending is removed. With unfold set, continuation lines are appended.
+       newline is the byte ending the lines, see get_newline(). Returns None
+       if no such line exists.'''
+    result = None
+    for prefix in prefixes:
+        needle = newline + prefix
+        found = buf.find(needle, start, end)
+        if found >= 0 and (result is None or found < result):
+            result = found
+    if result is None:
+        return None
+    line_start = result + 1
+    line_end = _line_end(buf, line_start, end, newline)
+    lines = [buf[line_start:line_end].rstrip(b"\r\n")]
+    if unfold:
+        while line_end < end and buf[line_end:line_end + 1] in (b" ", b"\t"):
+            next_end = _line_end(buf, line_end, end, newline)
+            lines.append(buf[line_end + 1:next_end].rstrip(b"\r\n"))
+            line_end = next_end
+    return b"".join(lines)
@@ -0,0 +1,235 @@
+""" pimtools.server
+
+    Runs the conversions of pimtools.api in a long running process, which
+    is asked for conversions over a Unix socket"""
+#
+#    Copyright (C) 2014-2020 Georg Lutz <georg AT NOSPAM georglutz DOT de>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# One request per connection. The client sends a header line with a JSON
+# object, followed by the input if no input file is given:
+#
+#   {"converter": "muttalias", "options": {}, "input_file": null,
+#    "length": 1234}
+#
+# The server answers with a header line and the output:
+#
+#   {"status": "ok", "length": 567}
+#   {"status": "error", "message": "Parse error: ...", "length": 0}
+#
+# The client module only needs socket and json, so it starts quickly. The
+# converters are imported by the server.
+
+import json
+import os
+import socket
+import tempfile
+
+# Conversions the server offers: name -> (function name in pimtools.api,
+# names of the accepted options)
+CONVERTERS = {
+    "jpilot_to_egw": ("jpilot_to_egw", ("category",)),
+    "egw_to_gammu": ("egw_to_gammu", ()),
+    "egw_to_owncloud": ("egw_to_owncloud", ()),
+    "muttalias": ("mutt_aliases", ()),
+}
+
+# Maximum length of a header line
+MAX_HEADER_SIZE = 64 * 1024
+
+# Seconds the server waits for a client to send or receive data
+CONNECTION_TIMEOUT = 30
+
+# Types of option values, all options are strings
+_STRING_TYPES = (str, type(u""))
+
+
+class ServerError(Exception):
+    '''Raised by request() if the server answers with an error'''
+    pass
+
+
+def get_default_socket_name():
+    '''Returns the default socket name, private to the current user'''
+    directory = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(directory, "pimtools-%d.sock" % (os.getuid()))
+
+
+def _send(sock, header, data):
+    '''Sends the JSON header line and data'''
+    header["length"] = len(data)
+    sock.sendall(json.dumps(header).encode("utf-8") + b"\n" + data)
+
+
+def _receive(file_):
+    '''Reads a header line and the data following it from the socket file
+       file_. Returns the tuple (header, data). Raises EOFError if the
+       connection was closed without request and ValueError if the header
+       is invalid.'''
+    line = file_.readline(MAX_HEADER_SIZE)
+    if not line:
+        raise EOFError("Connection closed")
+    if not line.endswith(b"\n"):
+        raise ValueError("Incomplete header")
+    header = json.loads(line.decode("utf-8"))
+    if not isinstance(header, dict):
+        raise ValueError("Header is no JSON object")
+    length = int(header.get("length", 0))
+    data = file_.read(length)
+    if len(data) != length:
+        raise ValueError("Incomplete data")
+    return (header, data)
+
+
+def request(socket_name, converter, options=None, input_file_name=None,
+            data=b""):
+    '''Asks the server at socket_name to run converter with the dictionary
+       options on the file input_file_name or, if not given, on the bytes
+       data. Returns the output as bytes (UTF-8). Raises ServerError if the
+       conversion fails and socket.error if the server is not reachable.'''
+    if input_file_name is not None:
+        input_file_name = os.path.abspath(input_file_name)
+        data = b""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_name)
+        _send(sock, {"converter": converter, "options": options or {},
+                     "input_file": input_file_name}, data)
+        sock.shutdown(socket.SHUT_WR)
+        file_ = sock.makefile("rb")
+        try:
+            (header, output) = _receive(file_)
+        except (EOFError, ValueError) as exc:
+            raise ServerError("Invalid answer: %s" % (exc))
+        finally:
+            file_.close()
+    finally:
+        sock.close()
+    if header.get("status") != "ok":
+        raise ServerError(header.get("message", "Unknown error"))
+    return output
+
+
+def convert(header, data):
+    '''Runs the conversion of a request with the given header on data or
+       the input file named in the header. Returns the output as bytes.
+       Raises ValueError for invalid requests.'''
+    from . import api
+    from .compress import open_input
+
+    name = header.get("converter")
+    if name not in CONVERTERS:
+        raise ValueError("Unknown converter %s" % (name))
+    (function_name, option_names) = CONVERTERS[name]
+    options = header.get("options") or {}
+    if not isinstance(options, dict):
+        raise ValueError("Options are no JSON object")
+    for (option, value) in options.items():
+        if option not in option_names:
+            raise ValueError("Unknown option %s for %s" % (option, name))
+        if not isinstance(value, _STRING_TYPES):
+            raise ValueError("Option %s for %s is no string" % (option, name))
+    function = getattr(api, function_name)
+
+    input_file_name = header.get("input_file")
+    if input_file_name:
+        with open_input(input_file_name, "r") as input_file:
+            output = function(input_file, **options)
+    else:
+        output = function(data, **options)
+    if not isinstance(output, bytes):
+        output = output.encode("utf-8")
+    return output
+
+
+def _handle(connection, logger):
+    '''Answers the request on the accepted socket connection. Errors of
+       the conversion are answered, errors of the connection raised.'''
+    from .reader import ParseError
+
+    file_ = connection.makefile("rb")
+    try:
+        try:
+            (header, data) = _receive(file_)
+        except EOFError:
+            # e.g. _is_alive() of another server
+            return
+        output = convert(header, data)
+        answer = {"status": "ok"}
+    except (ValueError, ParseError) as exc:
+        (output, answer) = (b"", {"status": "error", "message": str(exc)})
+    except socket.error:
+        raise
+    except (IOError, OSError) as exc:
+        (output, answer) = (b"", {"status": "error",
+                                  "message": "Cannot read input: %s" % (exc)})
+    except Exception as exc: # pylint: disable=broad-except
+        # A bug in a converter must not stop the server
+        if logger is not None:
+            logger.exception("Conversion failed")
+        (output, answer) = (b"", {"status": "error",
+                                  "message": "Internal error: %s" % (exc)})
+    finally:
+        file_.close()
+    _send(connection, answer, output)
+
+
+def _is_alive(socket_name):
+    '''Returns True if a server accepts connections on socket_name'''
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_name)
+    except socket.error:
+        return False
+    finally:
+        sock.close()
+    return True
+
+
+def serve(socket_name, logger=None):
+    '''Answers requests on the Unix socket socket_name until interrupted.
+       The socket is only accessible by the current user. A stale socket
+       file is replaced, raises IOError if another server is running. Failed
+       requests are logged to logger, clients which do not send or receive
+       for CONNECTION_TIMEOUT seconds are disconnected.'''
+    # Import the converters once instead of on the first request
+    from . import api # pylint: disable=unused-import
+
+    if os.path.exists(socket_name):
+        if _is_alive(socket_name):
+            raise IOError("Server already running on %s" % (socket_name))
+        os.remove(socket_name)
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o077)
+    try:
+        sock.bind(socket_name)
+    finally:
+        os.umask(old_umask)
+    try:
+        sock.listen(16)
+        while True:
+            (connection, _) = sock.accept()
+            connection.settimeout(CONNECTION_TIMEOUT)
+            try:
+                _handle(connection, logger)
+            except Exception as exc: # pylint: disable=broad-except
+                if logger is not None:
+                    logger.warning("Request failed: %s", exc)
+            finally:
+                connection.close()
+    finally:
+        sock.close()
+        os.remove(socket_name)
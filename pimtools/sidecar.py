@@ -0,0 +1,270 @@
+""" pimtools.sidecar
+
+    Index files with the byte offsets of the entries of ical and vcard files"""
+#
+#    Copyright (C) 2014-2020 Georg Lutz <georg AT NOSPAM georglutz DOT de>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# An index file is a UTF-8 text file next to the indexed file. It starts
+# with a header, followed by an empty line and one line per entry:
+#
+#   pimtools index 2
+#   size 12345
+#   sample 0123...   (SHA-1 of some blocks of the file, see sample_checksum)
+#   sha1 4567...     (SHA-1 of the whole file)
+#
+#   UID<TAB>component<TAB>offset<TAB>length
+#
+# Entries without UID are not listed. The entry lines are sorted by UID (as
+# bytes) and offset, so MappedIndex finds a UID by bisecting the memory
+# mapped file and only reads a few pages of it.
+
+import hashlib
+import os
+
+from .reader import ICAL_COMPONENTS
+from .scanner import ComponentScanner, find_line, open_mmap
+
+# First line of an index file
+INDEX_HEADER = "pimtools index 2"
+
+# Extension of the index file appended to the name of the indexed file
+INDEX_EXTENSION = ".idx"
+
+# Components listed in the index
+INDEX_COMPONENTS = ICAL_COMPONENTS + ("VCARD",)
+
+# Number and size of the blocks hashed by sample_checksum()
+SAMPLE_COUNT = 16
+SAMPLE_SIZE = 4096
+
+# Block size for reading the whole file in full_checksum()
+READ_BLOCK_SIZE = 1024 * 1024
+
+
+class StaleIndexError(Exception):
+    '''Raised if an index does not match the indexed file'''
+    pass
+
+
+def _encode(text):
+    '''Returns text as UTF-8 bytes'''
+    if isinstance(text, bytes):
+        return text
+    return text.encode("utf-8")
+
+
+def _decode(data):
+    '''Returns the UTF-8 bytes data as str'''
+    if str is bytes:
+        return data
+    return data.decode("utf-8")
+
+
+def _read_header(file_, file_name):
+    '''Reads the header of the open binary index file_ up to the empty line
+       and returns it as dictionary. Raises ValueError if file_name is no
+       index file.'''
+    if file_.readline().rstrip(b"\n") != _encode(INDEX_HEADER):
+        raise ValueError("%s is no index file" % (file_name))
+    header = {}
+    while True:
+        line = file_.readline().rstrip(b"\n")
+        if not line:
+            break
+        (key, value) = _decode(line).split(" ", 1)
+        header[key] = value
+    return header
+
+
+def _parse_record(line):
+    '''Returns the record (uid, component, offset, length) of an entry
+       line without line feed'''
+    (uid, component, offset, length) = _decode(line).split("\t")
+    return (uid, component, int(offset), int(length))
+
+
+def get_index_file_name(file_name):
+    '''Returns the default index file name for file_name'''
+    return file_name + INDEX_EXTENSION
+
+
+def sample_checksum(file_, size):
+    '''Returns the SHA-1 (hex) of size and SAMPLE_COUNT blocks spread evenly
+       over the open binary file_, including its first and last block. Only
+       a few kB are read, so this is cheap even for huge files, but changes
+       between the blocks are not detected.'''
+    hash_ = hashlib.sha1(str(size).encode("ascii"))
+    if size <= SAMPLE_COUNT * SAMPLE_SIZE:
+        file_.seek(0)
+        hash_.update(file_.read(size))
+        return hash_.hexdigest()
+    step = (size - SAMPLE_SIZE) // (SAMPLE_COUNT - 1)
+    for sample in range(SAMPLE_COUNT):
+        file_.seek(sample * step)
+        hash_.update(file_.read(SAMPLE_SIZE))
+    return hash_.hexdigest()
+
+
+def full_checksum(file_):
+    '''Returns the SHA-1 (hex) of the whole content of the open binary
+       file_'''
+    hash_ = hashlib.sha1()
+    file_.seek(0)
+    while True:
+        block = file_.read(READ_BLOCK_SIZE)
+        if not block:
+            break
+        hash_.update(block)
+    return hash_.hexdigest()
+
+
+class SidecarIndex(object):
+    '''The index of an ical or vcard file.
+
+       records is a list of tuples (uid, component, offset, length), uid and
+       component are str. Create it with build_index() or read().'''
+
+    def __init__(self, size, sample, sha1, records):
+        self.size = size
+        self.sample = sample
+        self.sha1 = sha1
+        self.records = records
+        self._by_uid = None
+
+    @classmethod
+    def read(cls, file_name):
+        '''Reads a whole index file, see MappedIndex to look up single
+           UIDs. Raises ValueError if it is no index file.'''
+        file_ = open(file_name, "rb")
+        try:
+            header = _read_header(file_, file_name)
+            records = [_parse_record(line.rstrip(b"\n")) for line in file_]
+        finally:
+            file_.close()
+        return cls(int(header["size"]), header["sample"], header["sha1"],
+                   records)
+
+    def write(self, file_name):
+        '''Writes the index to file_name. A temporary file is renamed, so an
+           interrupted run does not leave a truncated index.'''
+        temp_file_name = file_name + ".tmp"
+        file_ = open(temp_file_name, "wb")
+        file_.write(_encode("%s\nsize %d\nsample %s\nsha1 %s\n\n" % (
+            INDEX_HEADER, self.size, self.sample, self.sha1)))
+        for record in sorted(self.records,
+                             key=lambda record: (_encode(record[0]),
+                                                 record[2])):
+            file_.write(_encode("%s\t%s\t%d\t%d\n" % record))
+        file_.close()
+        os.rename(temp_file_name, file_name)
+
+    def check(self, file_, full=False):
+        '''Raises StaleIndexError if the open binary file_ was changed since
+           the index was built. The size and the sampled checksum are
+           compared, with full set also the SHA-1 of the whole file.'''
+        size = os.fstat(file_.fileno()).st_size
+        if size != self.size:
+            raise StaleIndexError("File size changed from %d to %d bytes" % (
+                self.size, size))
+        if sample_checksum(file_, size) != self.sample:
+            raise StaleIndexError("Sampled checksum changed")
+        if full and full_checksum(file_) != self.sha1:
+            raise StaleIndexError("SHA-1 checksum changed")
+
+    def find(self, uid):
+        '''Returns the list of records with the given UID'''
+        if self._by_uid is None:
+            self._by_uid = {}
+            for record in self.records:
+                self._by_uid.setdefault(record[0], []).append(record)
+        return self._by_uid.get(uid, [])
+
+
+class MappedIndex(SidecarIndex):
+    '''An index file mapped into memory. Only the header is read, find()
+       bisects the sorted entry lines, records is None. Raises ValueError if
+       file_name is no index file.'''
+
+    def __init__(self, file_name):
+        self.file_ = open(file_name, "rb")
+        try:
+            header = _read_header(self.file_, file_name)
+            SidecarIndex.__init__(self, int(header["size"]), header["sample"],
+                                  header["sha1"], None)
+        except (KeyError, ValueError):
+            self.file_.close()
+            raise ValueError("%s is no index file" % (file_name))
+        self.records_offset = self.file_.tell()
+        self.buf = open_mmap(self.file_)
+
+    def _lower_bound(self, key):
+        '''Returns the offset of the first entry line whose UID is not less
+           than the bytes key'''
+        buf = self.buf
+        low = self.records_offset
+        high = len(buf)
+        while low < high:
+            middle = (low + high) // 2
+            begin = buf.rfind(b"\n", self.records_offset, middle) + 1
+            if begin == 0:
+                begin = self.records_offset
+            end = buf.find(b"\n", middle)
+            if buf[begin:buf.find(b"\t", begin, end)] < key:
+                low = end + 1
+            else:
+                high = begin
+        return low
+
+    def find(self, uid):
+        '''Returns the list of records with the given UID'''
+        key = _encode(uid)
+        buf = self.buf
+        result = []
+        pos = self._lower_bound(key)
+        while pos < len(buf):
+            end = buf.find(b"\n", pos)
+            line = buf[pos:end]
+            if line.split(b"\t", 1)[0] != key:
+                break
+            result.append(_parse_record(line))
+            pos = end + 1
+        return result
+
+    def close(self):
+        '''Closes the index file'''
+        if not isinstance(self.buf, bytes):
+            self.buf.close()
+        self.file_.close()
+
+
+def build_index(file_):
+    '''Returns the SidecarIndex of the open binary file_. Raises ParseError
+       if an entry is not terminated.'''
+    buf = open_mmap(file_)
+    records = []
+    scanner = ComponentScanner(buf, INDEX_COMPONENTS)
+    for (component, start, end) in scanner:
+        uid_line = find_line(buf, start, end, (b"UID:", b"UID;"), unfold=True,
+                             newline=scanner.newline)
+        if uid_line is None:
+            continue
+        uid = uid_line.split(b":", 1)[1].strip()
+        if str is not bytes:
+            uid = uid.decode("utf-8")
+        records.append((uid, component, start, end - start))
+    size = len(buf)
+    sha1 = hashlib.sha1(buf).hexdigest()
+    return SidecarIndex(size, sample_checksum(file_, size), sha1, records)
@@ -0,0 +1,269 @@
+""" pimtools.stats
+
+    Counters and per phase timings for the --stats option of the scripts"""
+#
+#    Copyright (C) 2014-2020 Georg Lutz <georg AT NOSPAM georglutz DOT de>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    # Not available on windows
+    resource = None
+
+# Phases the run time is split into. Time not spent in one of the phases,
+# e.g. startup, is accounted to "other".
+PHASES = ("read", "parse", "transform", "write", "other")
+
+# Number of bytes read at once from the input when collecting statistics
+READ_BLOCK_SIZE = 1024 * 1024
+
+_clock = getattr(time, "perf_counter", time.time)
+
+
+def add_options(parser):
+    '''Adds the --stats options to an optparse or argparse parser'''
+    if hasattr(parser, "add_argument"):
+        add = parser.add_argument
+    else:
+        add = parser.add_option
+    add("--stats", dest="stats", default=False, action="store_true",
+        help="""Print statistics (number of entries, bytes read and
+written, time spent for reading, parsing, transforming and writing, peak
+memory usage) to STDERR on exit.""")
+    add("--stats-json", dest="stats_json", default="", metavar="FILE",
+        help="""Write the statistics as JSON to FILE, "-" for STDERR.""")
+
+
+def _peak_rss_kb(who):
+    '''Returns the peak resident set size in kB or None if unknown'''
+    if resource is None:
+        return None
+    peak = resource.getrusage(who).ru_maxrss
+    if sys.platform == "darwin":
+        # Reported in bytes instead of kB
+        peak = peak // 1024
+    return peak
+
+
+class _Phase(object):
+    '''Context manager accounting the time of its block to a phase'''
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+        self.previous = None
+
+    def __enter__(self):
+        self.previous = self.stats.switch(self.name)
+
+    def __exit__(self, *exc_info):
+        self.stats.switch(self.previous)
+
+
+class _NoPhase(object):
+    '''Context manager doing nothing, used if statistics are disabled'''
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class _CountingInput(object):
+    '''Iterates over the lines of a file, counting the bytes and accounting
+       the time of the actual reads to the "read" phase'''
+
+    def __init__(self, stats, file_):
+        self.stats = stats
+        self.file_ = file_
+
+    def __iter__(self):
+        stats = self.stats
+        while True:
+            previous = stats.switch("read")
+            lines = self.file_.readlines(READ_BLOCK_SIZE)
+            stats.switch(previous)
+            if not lines:
+                break
+            stats.bytes_in += sum([len(line) for line in lines])
+            for line in lines:
+                yield line
+
+    def __getattr__(self, name):
+        return getattr(self.file_, name)
+
+
+class _CountingOutput(object):
+    '''File like object counting the written bytes and accounting the time
+       of the writes to the "write" phase'''
+
+    def __init__(self, stats, file_):
+        self.stats = stats
+        self.file_ = file_
+
+    def write(self, data):
+        previous = self.stats.switch("write")
+        self.file_.write(data)
+        self.stats.switch(previous)
+        self.stats.bytes_out += len(data)
+
+    def __getattr__(self, name):
+        return getattr(self.file_, name)
+
+
+class Stats(object):
+    '''Collects the statistics of a script run.
+
+       If disabled all wrapper functions return their argument unchanged and
+       report() does nothing, so the scripts can use the same code path in
+       both cases.'''
+
+    def __init__(self, enabled=False, text=False, json_file_name=""):
+        self.enabled = enabled
+        self.text = text
+        self.json_file_name = json_file_name
+        self.entries = 0
+        self.properties = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.times = dict([(phase, 0.0) for phase in PHASES])
+        self._start = _clock()
+        self._phase = "other"
+        self._since = self._start
+
+    @classmethod
+    def from_options(cls, options):
+        '''Creates the object according to the options of add_options()'''
+        return cls(options.stats or bool(options.stats_json), options.stats,
+                   options.stats_json)
+
+    def switch(self, phase):
+        '''Accounts the time since the last switch to the current phase and
+           makes phase the current one. Returns the previous phase.'''
+        now = _clock()
+        previous = self._phase
+        self.times[previous] += now - self._since
+        self._phase = phase
+        self._since = now
+        return previous
+
+    def phase(self, name):
+        '''Returns a context manager accounting its block to phase name'''
+        if not self.enabled:
+            return _NoPhase()
+        return _Phase(self, name)
+
+    def wrap_input(self, file_):
+        '''Returns an iterable over the lines of file_ counting bytes_in'''
+        if not self.enabled:
+            return file_
+        return _CountingInput(self, file_)
+
+    def wrap_output(self, file_):
+        '''Returns a file like object counting bytes_out'''
+        if not self.enabled:
+            return file_
+        return _CountingOutput(self, file_)
+
+    def components(self, iterable):
+        '''Returns an iterable over the items of iterable (e.g. a
+           ComponentReader), accounting the time to the "parse" phase and
+           counting them as entries. The properties are counted for items
+           with lines.'''
+        if not self.enabled:
+            return iterable
+        return self._timed(iterable, "parse", True)
+
+    def timed(self, iterable, phase):
+        '''Returns an iterable over the items of iterable, accounting the
+           time to produce them to the given phase'''
+        if not self.enabled:
+            return iterable
+        return self._timed(iterable, phase, False)
+
+    def _timed(self, iterable, phase, count):
+        '''Generator implementing components() and timed()'''
+        iterator = iter(iterable)
+        while True:
+            previous = self.switch(phase)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.switch(previous)
+            if count:
+                self.entries += 1
+                lines = getattr(item, "lines", None)
+                if lines is not None:
+                    self.properties += len(
+                        [line for line in lines if line[:1] not in (" ", "\t")])
+            yield item
+
+    def as_dict(self):
+        '''Returns the statistics as dictionary'''
+        self.switch(self._phase)
+        elapsed = _clock() - self._start
+        result = {
+            "entries": self.entries,
+            "properties": self.properties,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "seconds": elapsed,
+            "entries_per_second": self.entries / elapsed if elapsed else 0.0,
+            "phases": dict(self.times),
+            "peak_rss_kb": None,
+            "peak_rss_children_kb": None,
+        }
+        if resource is not None:
+            result["peak_rss_kb"] = _peak_rss_kb(resource.RUSAGE_SELF)
+            result["peak_rss_children_kb"] = _peak_rss_kb(
+                resource.RUSAGE_CHILDREN)
+        return result
+
+    def report(self):
+        '''Writes the statistics as requested by the options'''
+        if not self.enabled:
+            return
+        result = self.as_dict()
+        if self.text:
+            lines = [
+                "entries: %d" % (result["entries"]),
+                "properties: %d" % (result["properties"]),
+                "bytes in: %d" % (result["bytes_in"]),
+                "bytes out: %d" % (result["bytes_out"]),
+                "time: %.3f s" % (result["seconds"]),
+                "entries per second: %.1f" % (result["entries_per_second"]),
+            ]
+            for phase in PHASES:
+                lines.append("  %s: %.3f s" % (phase, result["phases"][phase]))
+            if result["peak_rss_kb"] is not None:
+                lines.append("peak RSS: %d kB" % (result["peak_rss_kb"]))
+                if result["peak_rss_children_kb"]:
+                    lines.append("peak RSS of worker processes: %d kB" % (
+                        result["peak_rss_children_kb"]))
+            sys.stderr.write("\n".join(lines) + "\n")
+        if self.json_file_name == "-":
+            sys.stderr.write(json.dumps(result, sort_keys=True) + "\n")
+        elif self.json_file_name:
+            json_file = open(self.json_file_name, "w")
+            json_file.write(json.dumps(result, sort_keys=True) + "\n")
+            json_file.close()
@@ -0,0 +1,288 @@
+""" pimtools.watch
+
+    Waits for changes of an input file and converts only the entries which
+    changed since the last run"""
+#
+#    Copyright (C) 2014-2020 Georg Lutz <georg AT NOSPAM georglutz DOT de>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Changes are detected with inotify on Linux. Elsewhere, or if inotify is
+# not available, the file is polled.
+
+import ctypes
+import ctypes.util
+import hashlib
+import json
+import logging
+import os
+import select
+import struct
+import sys
+import time
+
+from .compress import get_compression, open_input, open_output
+from .parallel import map_entries
+from .reader import ParseError
+
+# Seconds between two checks of PollingWatcher
+DEFAULT_INTERVAL = 2.0
+
+# Seconds to wait after a change for further changes, e.g. an export
+# written in several steps
+DEFAULT_SETTLE_TIME = 0.2
+
+# inotify constants, see <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CLOEXEC = 0o2000000
+
+# Format version of the files written by EntryCache.save()
+CACHE_VERSION = 1
+
+# struct inotify_event without the name
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _entry_key(lines):
+    '''Returns the hash of an entry given as list of lines'''
+    data = "\n".join(lines)
+    if not isinstance(data, bytes):
+        data = data.encode("utf-8")
+    return hashlib.sha1(data).hexdigest()
+
+
+class EntryCache(object):
+    '''Results of a conversion by entry, so that a run only converts the
+       entries which are new or changed since the previous run. The entries
+       are identified by the SHA-1 of their lines, which include the UID.
+       Use one cache per conversion and options.
+
+       converted and reused count the entries of the last run.'''
+
+    def __init__(self):
+        self.results = {}
+        self.converted = 0
+        self.reused = 0
+
+    @classmethod
+    def load(cls, file_name):
+        '''Returns the cache saved to file_name by save(), an empty one if
+           the file does not exist or is no cache file'''
+        cache = cls()
+        try:
+            with open_input(file_name, "r") as file_:
+                data = json.load(file_)
+            if data.get("version") == CACHE_VERSION:
+                cache.results = data["results"]
+        except (IOError, ValueError, KeyError, AttributeError):
+            pass
+        return cache
+
+    def save(self, file_name):
+        '''Writes the results of the last run to file_name. The results have
+           to be serializable as JSON.'''
+        rewrite_file(file_name, lambda file_: json.dump(
+            {"version": CACHE_VERSION, "results": self.results}, file_))
+
+    def map(self, function, entries, jobs=1, args=()):
+        '''Same as pimtools.parallel.map_entries(), but results of entries
+           converted in the previous run are reused. Results of entries not
+           in this run are dropped. Returns a list.'''
+        entries = list(entries)
+        keys = [_entry_key(lines) for lines in entries]
+        missing = [lines for (key, lines) in zip(keys, entries)
+                   if key not in self.results]
+        new_results = iter(map_entries(function, missing, jobs, args))
+        results = {}
+        output = []
+        for key in keys:
+            result = results.get(key)
+            if result is None:
+                result = self.results.get(key)
+                if result is None:
+                    result = next(new_results)
+                results[key] = result
+            output.append(result)
+        self.converted = len(missing)
+        self.reused = len(keys) - len(missing)
+        self.results = results
+        return output
+
+
+def rewrite_file(file_name, write, compression=None):
+    '''Calls write(file_) with a temporary file which then replaces
+       file_name, so readers never see a partially written file. The
+       temporary file is removed if write() raises an exception. The file is
+       compressed with compression, by default according to the extension
+       of file_name, see pimtools.compress.open_output().'''
+    if compression is None:
+        compression = get_compression(file_name)
+    temp_file_name = file_name + ".tmp"
+    file_ = open_output(temp_file_name, "w", compression)
+    try:
+        write(file_)
+        file_.close()
+    except:
+        file_.close()
+        os.remove(temp_file_name)
+        raise
+    os.rename(temp_file_name, file_name)
+
+
+def _file_state(file_name):
+    '''Returns what PollingWatcher compares, None if the file is missing'''
+    try:
+        stat = os.stat(file_name)
+    except OSError:
+        return None
+    return (stat.st_mtime, stat.st_size, stat.st_ino)
+
+
+class PollingWatcher(object):
+    '''Detects changes by comparing modification time, size and inode of
+       the file every interval seconds'''
+
+    def __init__(self, file_name, interval=DEFAULT_INTERVAL):
+        self.file_name = file_name
+        self.interval = interval
+        self.state = _file_state(file_name)
+
+    def wait(self):
+        '''Returns after the file changed'''
+        while True:
+            time.sleep(self.interval)
+            state = _file_state(self.file_name)
+            if state is not None and state != self.state:
+                self.state = state
+                return
+
+    def drain(self):
+        '''Forgets changes made since wait() returned'''
+        self.state = _file_state(self.file_name)
+
+    def close(self):
+        '''Nothing to release'''
+        pass
+
+
+class InotifyWatcher(object):
+    '''Detects changes with inotify. The directory is watched, so that
+       replacing the file by renaming another one is noticed as well.
+       Raises OSError if inotify is not available.'''
+
+    def __init__(self, file_name):
+        library_name = ctypes.util.find_library("c")
+        if library_name is None:
+            raise OSError("C library not found")
+        libc = ctypes.CDLL(library_name, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify not supported")
+        self.fd = libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        directory = os.path.dirname(os.path.abspath(file_name))
+        if not isinstance(directory, bytes):
+            directory = directory.encode(sys.getfilesystemencoding())
+        watch = libc.inotify_add_watch(
+            self.fd, directory, IN_CLOSE_WRITE | IN_MOVED_TO)
+        if watch < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, "inotify_add_watch failed")
+        self.name = os.path.basename(file_name)
+        if not isinstance(self.name, bytes):
+            self.name = self.name.encode(sys.getfilesystemencoding())
+
+    def _changed(self, data):
+        '''Returns True if the inotify events in data concern the file'''
+        pos = 0
+        while pos + _EVENT_HEADER.size <= len(data):
+            (_, _, _, length) = _EVENT_HEADER.unpack_from(data, pos)
+            pos += _EVENT_HEADER.size
+            name = data[pos:pos + length].rstrip(b"\0")
+            pos += length
+            if name == self.name:
+                return True
+        return False
+
+    def wait(self):
+        '''Returns after the file was written or replaced'''
+        while not self._changed(os.read(self.fd, 64 * 1024)):
+            pass
+
+    def drain(self):
+        '''Forgets changes made since wait() returned'''
+        while select.select([self.fd], [], [], 0)[0]:
+            os.read(self.fd, 64 * 1024)
+
+    def close(self):
+        '''Closes the inotify file descriptor'''
+        os.close(self.fd)
+
+
+def get_watcher(file_name, interval=DEFAULT_INTERVAL):
+    '''Returns an InotifyWatcher for file_name if possible, else a
+       PollingWatcher'''
+    try:
+        return InotifyWatcher(file_name)
+    except OSError:
+        return PollingWatcher(file_name, interval)
+
+
+def watch(file_name, run, interval=DEFAULT_INTERVAL,
+          settle_time=DEFAULT_SETTLE_TIME):
+    '''Calls run() every time file_name was changed, until interrupted.
+       interval is used if the file has to be polled.'''
+    watcher = get_watcher(file_name, interval)
+    try:
+        while True:
+            watcher.wait()
+            time.sleep(settle_time)
+            watcher.drain()
+            run()
+    finally:
+        watcher.close()
+
+
+def convert_on_change(input_file_name, output_file_name, convert,
+                      interval=DEFAULT_INTERVAL, cache=None):
+    '''Calls convert(input_file, output_file, cache) now and every time
+       input_file_name was changed, until interrupted. The output file is
+       replaced atomically, see rewrite_file(). cache is an EntryCache kept
+       between the runs, a new one if not given. Parse and IO errors are
+       logged and the next change is waited for, as the input may have been
+       caught while written.'''
+    if cache is None:
+        cache = EntryCache()
+
+    def run():
+        try:
+            input_file = open_input(input_file_name, "r")
+            try:
+                rewrite_file(output_file_name, lambda output_file: convert(
+                    input_file, output_file, cache))
+            finally:
+                input_file.close()
+        except ParseError as exc:
+            logging.error("Parse error: %s, output not updated", exc)
+            return
+        except (IOError, OSError) as exc:
+            logging.error("Conversion failed: %s", exc)
+            return
+        logging.info("%s: %d entries converted, %d unchanged",
+                     output_file_name, cache.converted, cache.reused)
+
+    run()
+    watch(input_file_name, run, interval)
@@ -26,126 +26,51 @@ import os
 import re
 import sys
 
+import pimtools.stats
+from pimtools.api import egw_to_gammu, egw_to_gammu_delta, write_vcards
+from pimtools.compress import get_compression, open_input, open_output
+from pimtools.parallel import get_jobs
+from pimtools.reader import ParseError
+from pimtools.watch import rewrite_file
+
+
+def writeDelta(vcardFile, outputFile, snapshotFileName, jobs, stats):
+    '''Writes the contacts added or changed since the snapshot to outputFile,
+       the new snapshot to snapshotFileName.new and the deleted contacts and
+       the old versions of the changed ones to snapshotFileName.deleted. Both
+       are compressed like snapshotFileName.'''
+    snapshotFile = None
+    if os.path.isfile(snapshotFileName):
+        try:
+            snapshotFile = open_input(snapshotFileName, "r")
+        except:
+            logging.error("Cannot open snapshot file")
+            sys.exit(2)
 
-def getField(list, field):
-    '''Returns the contents of the first occurence of a given VCARD field.
-       Returns None if field is not found''' 
-    result = None
-    for line in list:
-        if line.find(field + ":") == 0:
-            # split returns an empty string if nothing comes after
-            # so its safe to access [1]
-            result = line.split(":")[1]
-            break
-    return result
-
-
-def getFields(list, field):
-    '''Returns a list of tupels (fieldname, content) of all found VCARD fields.
-       Field can either be a complete field name or be followed by a specifier
-       (seperated by ";").'''
-    result = []
-    for line in list:
-        if line.find(field + ":") == 0 or ( line.find(field + ";") == 0 and line.find(":") > line.find(field + ";")) :
-            entry = line.split(":",1) # split only at the first occurence of ":"
-            # Make sure that tuple is returned in case of emtpy field
-            if len(entry) == 1:
-                entry.append("")
-            result.append(entry)
-    return result
-
-
-def setField(entry, fieldName, fieldValue):
-    '''Sets a VCARD field. An already existing field is overwritten.'''
-    found = False
-    for i in range(len(entry)):
-        if entry[i].find(fieldName + ":" ) == 0:
-            found = True
-            break
-    
-    line = fieldName + ":" + fieldValue
-    if found:
-        entry[i] = line
-    else:
-        entry.append(line)
-
-
-def appendField(entry, fieldName, fieldValue):
-    '''Appends the field to the end of the entry'''
-    entry.append(fieldName + ":" + fieldValue)
-
-
-def deleteField(entry, fieldName):
-    '''Completely removes the first occurence of the field from the entry'''
-    for i in range(len(entry)):
-	if entry[i].find(fieldName + ":") == 0:
-	    del entry[i]
-	    break
-
-
-def deleteFields(entry, fieldName):
-    '''Removes all occurences of the given field from the entry. Field can
-       either be a complete field name or be followed by a specifier
-       (seperated by ";").'''
-    i = 0
-    while i < len(entry):
-        if entry[i].find(fieldName + ":") == 0 or entry[i].find(fieldName + ";") == 0:
-            del entry[i]
-        else:
-            i += 1
-
-
-def tweakEntry(entry, options):
-    '''Actually does the vcard conversation of a single entry so that it can be
-       imported into gammu / nokia phone'''
-    result = entry
-
-    telNrs = getFields(result, "TEL")
-    for nr in telNrs:
-        # nokia / gammu doesn't accept work cellphones, but multiple CELL entries are OK
-        if nr[0] == "TEL;CELL;WORK":
-            nr[0] = "TEL;CELL"
-        # nokia / gammu doesn't accept anything else - except "+" in phone number
-        newNr = ""
-        for char in nr[1]:
-            if ((char >= "0") and (char <= "9")) or (char == "+"):
-                newNr += char
-        nr[1] = newNr
-    
-    deleteFields(result, "TEL")
-    for nr in telNrs:
-        appendField(result, nr[0], nr[1])
-
-    # nokia / gammu supports multiple email addresses but ignores email
-    # addresses with specifiers like "EMAIL;WORK"
-    emailAddrs = getFields(result, "EMAIL")
-    deleteFields(result, "EMAIL")
-    for addr in emailAddrs:
-        appendField(result, "EMAIL", addr[1])
-
-    # Same for "URL"
-    urls = getFields(result, "URL")
-    deleteFields(result, "URL")
-    for url in urls:
-        appendField(result, "URL", url[1])
-
-    # Delete empty ORG field as nokia would display two semicolons
-    if getField(result, "ORG") == ";;":
-        deleteField(result, "ORG")
-    
-    # gammu/wammu/phone throws an error when reaching an entry with BDAY, so remove it
-    deleteField(result,"BDAY")
-    
-    return result
-
+    try:
+        (entries, added, changed, deleted) = egw_to_gammu_delta(vcardFile,
+                snapshotFile, jobs, stats)
+    except ParseError as exc:
+        logging.error("Parse error: %s" % (exc))
+        sys.exit(1)
+    if snapshotFile is not None:
+        snapshotFile.close()
 
-def writeEntryToFile(entry, file):
-    '''Writes an vcard entry to an file handle. VCARD begin and end tags are appended'''
-    file.write("BEGIN:VCARD\n")
-    for line in entry:
-        file.write(line + "\n")
-    file.write("END:VCARD\n")
-    file.write("\n")
+    # gammu imports changed contacts as new ones, so their old versions have
+    # to be removed from the phone like deleted contacts
+    removed = deleted + [old for (old, _) in changed]
+    compression = get_compression(snapshotFileName)
+    try:
+        write_vcards(outputFile, added + [new for (_, new) in changed])
+        rewrite_file(snapshotFileName + ".new",
+                lambda file: write_vcards(file, entries), compression)
+        rewrite_file(snapshotFileName + ".deleted",
+                lambda file: write_vcards(file, removed), compression)
+    except (IOError, OSError) as exc:
+        logging.error("Cannot write file: %s" % (exc))
+        sys.exit(2)
+    logging.info("%d contacts added, %d changed, %d deleted" % (len(added),
+            len(changed), len(deleted)))
 
 
 ########### MAIN PROGRAM #############
@@ -164,6 +89,17 @@ def main():
     parser.add_option("-o", "--outputfile", dest="outputfile",
 	    type="string", default="", action="store",
 	    help="The output file. Default output is sent to STDOUT")
+
+    parser.add_option("-j", "--jobs", dest="jobs",
+            type="int", default=1, action="store",
+            help="Number of processes converting the entries in parallel. 0 starts one process per CPU. Default is 1.")
+
+    parser.add_option("-s", "--snapshot", dest="snapshot",
+            type="string", default="", action="store",
+            help="Only output the contacts added or changed since the snapshot file SNAPSHOT, the output of the last successful import. All converted contacts are written to SNAPSHOT.new, rename it to SNAPSHOT after the import worked. Deleted contacts and the old versions of changed contacts are written to SNAPSHOT.deleted.")
+
+    pimtools.stats.add_options(parser)
+
     (options, args) = parser.parse_args()
 
     logging.basicConfig(format="%(message)s", level=options.debuglevel)
@@ -178,7 +114,7 @@ def main():
         sys.exit(1)
 
     try:
-        vcardFile = open(vcardFileName, "r")
+        vcardFile = open_input(vcardFileName, "r")
     except:
         logging.error("Cannot open vcard file")
         sys.exit(2)
@@ -187,38 +123,28 @@ def main():
         outputFile = sys.stdout
     else:
         try:
-            outputFile = open(options.outputfile, "w")
+            outputFile = open_output(options.outputfile, "w")
         except:
             logging.error("Cannot open output file for writing")
             sys.exit(2)
 
 
-    # An entry is an array reflecting one vcard entry, without BEGIN and END tags
-    # Usually on each line reflects another field (execpt for multiline field)
-    entry = []
-    inEntry = False # flag if we are inside one vcard
-    lineNr = 1
-    for line in vcardFile:
-        line = line.replace("\n","").replace("\r","")
-
-        if line.find("BEGIN:VCARD") == 0:
-            inEntry = True
-        else:
-            if line.find("END:VCARD") == 0:
-                inEntry = False
-                newEntry = tweakEntry(entry, options)
-                writeEntryToFile(newEntry, outputFile)
-                entry = []
-            else:
-                if inEntry:
-                    entry.append(line)
-                    # inside a vcard entry
-
-        lineNr = lineNr + 1
+    stats = pimtools.stats.Stats.from_options(options)
+    outputFile = stats.wrap_output(outputFile)
 
+    if len(options.snapshot) > 0:
+        writeDelta(vcardFile, outputFile, options.snapshot,
+                get_jobs(options.jobs), stats)
+    else:
+        try:
+            egw_to_gammu(vcardFile, outputFile, get_jobs(options.jobs), stats)
+        except ParseError as exc:
+            logging.error("Parse error: %s" % (exc))
+            sys.exit(1)
 
     vcardFile.close()
     outputFile.close()
+    stats.report()
 
 
 if __name__ == "__main__":
@@ -21,87 +21,15 @@
 import argparse
 import logging
 import os
-import quopri
 import sys
 
-
-
-def get_fields(list_, field):
-    '''Returns a list of tupels (fieldname, content) of all found VCARD fields.
-       Field can either be a complete field name or be followed by a specifier
-       (seperated by ";").'''
-    result = []
-    for line in list_:
-        if line.find(field + ":") == 0 or \
-        (line.find(field + ";") == 0 and line.find(":") > line.find(field + ";")):
-            entry = line.split(":", 1) # split only at the first occurence of ":"
-            # Make sure that tuple is returned in case of emtpy field
-            if len(entry) == 1:
-                entry.append("")
-            result.append(entry)
-    return result
-
-
-def parse_and_split_field(field):
-    '''Parses a VCARD field. field is a tuple consisting of the field name and the field content.
-       The content is decoded (if quoted printable) and de-splited by ";". The return value is a
-       list consisting of the splitted values.'''
-    result = []
-    if len(field) != 2:
-        return result
-    if field[0].find("ENCODING=QUOTED-PRINTABLE") > 0:
-        result = quopri.decodestring(field[1]).split(";")
-    else:
-        result = field[1].split(";")
-    return result
-
-
-def convert_to_mutt_aliases(entry):
-    '''Searches for email addresses in a VCARD entry and converts it to mutt aliases.
-       Returns a list of mutt aliases'''
-    result = []
-
-    addresses = get_fields(entry, "EMAIL")
-    if not addresses:
-        return result
-
-    # The name of the entry. Will be used as base for alias name
-    entry_name = ""
-    full_name = ""
-
-    # First try: name (N) field
-    name = get_fields(entry, "N")
-    if name:
-        parsed_name = parse_and_split_field(name[0])
-        # First entry is the family name, second the given name
-        if len(parsed_name) >= 1:
-            entry_name += parsed_name[0].lower().replace(" ", "")
-            if len(parsed_name) > 1:
-                entry_name += parsed_name[1].lower().replace(" ", "")
-                full_name = parsed_name[1] + " " + parsed_name[0]
-
-    # We haven't found a valid name, try company (ORG) field:
-    if not entry_name:
-        org = get_fields(entry, "ORG")
-        if org:
-            parsed_name = parse_and_split_field(org[0])
-            if parsed_name:
-                entry_name = parsed_name[0].lower().replace(" ", "")
-                full_name = parsed_name[0]
-    if not entry_name:
-        logging.error("Cannot determine alias name. Ignore entry.")
-        return []
-
-    i = 1
-    for address in addresses:
-        if address[1]:
-            alias_name = entry_name
-            if i != 1:
-                alias_name += str(i)
-            result.append("alias %s %s <%s>" % (alias_name, full_name, address[1]))
-            i += 1
-
-    return result
+import pimtools.stats
+from pimtools.api import mutt_aliases
+from pimtools.compress import open_input, open_output
+from pimtools.parallel import get_jobs
+from pimtools.reader import ParseError
+from pimtools.watch import DEFAULT_INTERVAL, EntryCache, \
+    convert_on_change, rewrite_file
 
 
 def get_args():
@@ -117,6 +45,26 @@ def get_args():
     parser.add_argument(
         "-o", "--output_file", dest="output_file",
         help="The output file. Default output is sent to STDOUT")
+    parser.add_argument(
+        "-j", "--jobs", dest="jobs", type=int, default=1,
+        help="""Number of processes converting the entries in parallel.
+        0 starts one process per CPU. Default is 1.""")
+    parser.add_argument(
+        "-w", "--watch", dest="watch", action="store_true",
+        help="""After the conversion wait for changes of the vcard file and
+        convert it again, only the changed entries are converted again. The
+        output file is replaced at once. Needs --output_file. Runs until
+        interrupted.""")
+    parser.add_argument(
+        "--interval", dest="interval", type=float, default=DEFAULT_INTERVAL,
+        help="""Seconds between two checks for changes with --watch if
+        inotify is not available. Default is %(default)s.""")
+    parser.add_argument(
+        "--cache", dest="cache_file",
+        help="""Keeps the aliases of each contact in this file, so that the
+        next run only converts new or changed contacts. The output file is
+        replaced at once.""")
+    pimtools.stats.add_options(parser)
     parser.add_argument(
         "vcard_file_name",
         help="The vcard file to convert")
@@ -135,48 +83,69 @@ def main():
         logging.error("vcard_file not found")
         sys.exit(1)
 
+    if args.watch:
+        if not args.output_file:
+            logging.error("--watch needs --output_file")
+            sys.exit(1)
+        jobs = get_jobs(args.jobs)
+
+        def convert(vcard_file, output_file, cache):
+            stats = pimtools.stats.Stats.from_options(args)
+            mutt_aliases(vcard_file, stats.wrap_output(output_file), jobs,
+                         stats, cache)
+            if args.cache_file:
+                cache.save(args.cache_file)
+            stats.report()
+
+        cache = None
+        if args.cache_file:
+            cache = EntryCache.load(args.cache_file)
+        try:
+            convert_on_change(vcard_file_name, args.output_file, convert,
+                              args.interval, cache)
+        except KeyboardInterrupt:
+            pass
+        return
+
     try:
-        vcard_file = open(vcard_file_name, "r")
+        vcard_file = open_input(vcard_file_name, "r")
     except IOError:
         logging.error("Cannot open vcard file")
         sys.exit(2)
 
-    if not args.output_file:
-        output_file = sys.stdout
-    else:
-        try:
-            output_file = open(args.output_file, "w")
-        except IOError:
-            logging.error("Cannot open output file for writing")
-            sys.exit(2)
-
-    # An entry is an array reflecting one vcard entry, without BEGIN and END tags
-    # Usually on each line reflects another field (execpt for multiline field)
-    entry = []
-    in_entry = False # flag if we are inside one vcard
-    line_nr = 1
-    for line in vcard_file:
-        line = line.replace("\n", "").replace("\r", "")
-
-        if line.find("BEGIN:VCARD") == 0:
-            in_entry = True
-            entry = []
+    stats = pimtools.stats.Stats.from_options(args)
+    cache = None
+    if args.cache_file:
+        cache = EntryCache.load(args.cache_file)
+
+    def convert(output_file):
+        mutt_aliases(vcard_file, stats.wrap_output(output_file),
+                     get_jobs(args.jobs), stats, cache)
+
+    try:
+        if not args.output_file:
+            convert(sys.stdout)
+        elif cache is not None:
+            rewrite_file(args.output_file, convert)
         else:
-            if line.find("END:VCARD") == 0:
-                in_entry = False
-                mutt_aliases = convert_to_mutt_aliases(entry)
-                for alias in mutt_aliases:
-                    output_file.write(alias + "\n")
-            else:
-                if in_entry:
-                    entry.append(line)
-                    # inside a vcard entry
-
-        line_nr = line_nr + 1
+            try:
+                output_file = open_output(args.output_file, "w")
+            except IOError:
+                logging.error("Cannot open output file for writing")
+                sys.exit(2)
+            convert(output_file)
+            output_file.close()
+        if cache is not None:
+            cache.save(args.cache_file)
+    except ParseError as exc:
+        logging.error("Parse error: %s", exc)
+        sys.exit(1)
+    except (IOError, OSError) as exc:
+        logging.error("Cannot write file: %s", exc)
+        sys.exit(2)
 
     vcard_file.close()
-    output_file.close()
-
+    stats.report()
 
 if __name__ == "__main__":
     main()
@@ -23,6 +23,10 @@ import optparse
 import os
 import sys
 
+import pimtools.stats
+from pimtools.compress import open_input, open_output
+from pimtools.owncloud import FOLD_LENGTH, rewrite_owncloud
+from pimtools.reader import ParseError
 
 
 def main():
@@ -43,6 +47,14 @@ printed. So to disable all output set debuglevel e.g. to 100.""")
     parser.add_option("-o", "--outputfile", dest="outputfile",
 	    type="string", default="", action="store",
 	    help="The output file. Default output is sent to STDOUT")
+
+    parser.add_option("-f", "--fold-length", dest="fold_length",
+            type="int", default=FOLD_LENGTH,
+            help="""Fold output lines longer than this number of octets
+(RFC6350). 0 disables folding. Default is %d.""" % (FOLD_LENGTH))
+
+    pimtools.stats.add_options(parser)
+
     (options, args) = parser.parse_args()
 
     logging.basicConfig(format="%(message)s", level=options.debuglevel)
@@ -57,58 +69,32 @@ printed. So to disable all output set debuglevel e.g. to 100.""")
         sys.exit(1)
 
     try:
-        vcard_file = open(vcard_file_name, "r")
+        vcard_file = open_input(vcard_file_name, "rb")
     except:
         logging.error("Cannot open vcard_file")
         sys.exit(2)
 
     if len(options.outputfile) == 0:
-        outputfile = sys.stdout
+        outputfile = getattr(sys.stdout, "buffer", sys.stdout)
     else:
         try:
-            outputfile = open(options.outputfile, "w")
+            outputfile = open_output(options.outputfile, "wb")
         except:
             logging.error("Cannot open output file for writing")
             sys.exit(2)
 
-    # Deals mainly with the situation that imported egroupware contacts have
-    # the line contination / folding wrong (e.g. only the first line of a
-    # multiline note is shown).
-    # Egroupware encodes multiline fields with a "=0D=0A=" at the end of
-    # the to-be-continued line and the next line starts immedeately with
-    # the next byte:
-    #
-    # NOTE:;ENCODING=QUOTED-PRINTABLE:First line=0D=0A=
-    # Second line
-    #
-    # In contrast owncloud parses the last character of the line "=" as
-    # regular equal sign and expect the first character of the continued line
-    # to be a space:
-    #
-    # NOTE:;ENCODING=QUOTED-PRINTABLE:First line=0D=0A
-    #  Second line
- 
-    line_in = vcard_file.readline().replace("\n","").replace("\r","")
-    is_cont = False
-
-    while line_in != "":
-        if is_cont:
-            line_out = " " + line_in
-        else:
-            line_out = line_in
-
-        if line_out.endswith("="):
-            line_out = line_out[:-1]
-            is_cont = True
-        else:
-            is_cont = False
-
-        outputfile.write(line_out + "\r\n")
-        line_in = vcard_file.readline().replace("\n","").replace("\r","")
+    stats = pimtools.stats.Stats.from_options(options)
+    outputfile = stats.wrap_output(outputfile)
 
+    try:
+        rewrite_owncloud(vcard_file, outputfile, options.fold_length, stats)
+    except ParseError as exc:
+        logging.error("Parse error: %s" % (exc))
+        sys.exit(1)
 
     vcard_file.close()
     outputfile.close()
+    stats.report()
 
 
 if __name__ == "__main__":
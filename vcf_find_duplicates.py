@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+""" vcf_find_duplicates.py
+    Finds possible duplicate VCARD entries by looking at their email
+    addresses and phone numbers"""
+#
+#    Copyright (C) 2014-2020 Georg Lutz <georg AT NOSPAM georglutz DOT de>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import json
+import logging
+import os
+import sys
+
+import pimtools.stats
+from pimtools.api import MIN_PHONE_DIGITS, find_contact_duplicates
+from pimtools.compress import open_input
+from pimtools.reader import ParseError
+
+
+def write_text(clusters, output_file):
+    '''Writes the clusters readable for humans'''
+    for cluster in clusters:
+        output_file.write("Found %d possible duplicates:\n" % (len(cluster)))
+        for (uid, line_number, name) in cluster:
+            output_file.write("    line %d, UID %s: %s\n" % (
+                line_number, uid, name))
+        output_file.write("\n")
+
+
+def write_json(clusters, output_file):
+    '''Writes the clusters as JSON list of lists of objects'''
+    json.dump([[{"UID": uid, "line": line_number, "name": name}
+                for (uid, line_number, name) in cluster]
+               for cluster in clusters], output_file, indent=1)
+    output_file.write("\n")
+
+
+def get_args():
+    '''Configures command line parser and returns parsed parameters'''
+    parser = argparse.ArgumentParser(
+        description="""Finds possible duplicate VCARD entries. Entries with a
+        common email address (ignoring case) or phone number (digits only) are
+        listed together, also if they are only linked by a third entry.""")
+    parser.add_argument(
+        "-d", "--debuglevel", dest="debuglevel", type=int, default=logging.WARNING,
+        help="""Sets numerical debug level, see library logging module.
+        Default is 30 (WARNING). Possible values are CRITICAL 50, ERROR 40
+        WARNING 30, INFO 20, DEBUG 10, NOTSET 0. All log messages with debuglevel
+        or above are printed. So to disable all output set debuglevel e.g. to 100.""")
+    parser.add_argument(
+        "--json", dest="json", action="store_true",
+        help="Print the groups of duplicates as JSON")
+    parser.add_argument(
+        "--min-phone-digits", dest="min_phone_digits", type=int,
+        default=MIN_PHONE_DIGITS,
+        help="""Ignore phone numbers with less digits, e.g. extensions.
+        Default is %(default)s.""")
+    pimtools.stats.add_options(parser)
+    parser.add_argument(
+        "vcard_file_name",
+        help="The vcard file to analyze")
+    return parser.parse_args()
+
+
+def main():
+    '''main function, called when script file is executed directly'''
+
+    args = get_args()
+
+    logging.basicConfig(format="%(message)s", level=args.debuglevel)
+
+    if not os.path.isfile(args.vcard_file_name):
+        logging.error("vcard_file not found")
+        sys.exit(1)
+
+    try:
+        vcard_file = open_input(args.vcard_file_name, "r")
+    except IOError:
+        logging.error("Cannot open vcard file")
+        sys.exit(2)
+
+    stats = pimtools.stats.Stats.from_options(args)
+    output_file = stats.wrap_output(sys.stdout)
+
+    try:
+        clusters = find_contact_duplicates(vcard_file, args.min_phone_digits,
+                                           stats)
+    except ParseError as exc:
+        logging.error("Parse error: %s", exc)
+        sys.exit(1)
+    vcard_file.close()
+
+    if args.json:
+        write_json(clusters, output_file)
+    else:
+        write_text(clusters, output_file)
+    stats.report()
+
+
+if __name__ == "__main__":
+    main()
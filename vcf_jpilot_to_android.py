@@ -26,64 +26,42 @@ import os
 import re
 import sys
 
-
-def getField(list, field):
-    '''Returns the contents of VCARD field. Returns None if field is not found''' 
-    result = None
-    for line in list:
-        if line.find(field + ":") == 0:
-            # split returns an empty string if nothing comes after
-            # so its safe to access [1]
-            result = line.split(":")[1]
-            break
-    return result
-
-
-def setField(entry, fieldName, fieldValue):
-    '''Sets a VCARD field. An already existing field is overwritten.'''
-    found = False
-    for i in range(len(entry)):
-        if entry[i].find(fieldName + ":" ) == 0:
-            found = True
-            break
-    
-    line = fieldName + ":" + fieldValue
-    if found:
-        entry[i] = line
-    else:
-        entry.append(line)
-
-
-def deleteField(entry, fieldName):
-    '''Completely removes the first occurence of the field from the entry'''
-    for i in range(len(entry)):
-	if entry[i].find(fieldName + ":") == 0:
-	    del entry[i]
-	    break
+import pimtools.stats
+from pimtools.compress import open_input, open_output
+from pimtools.entry import Entry
+from pimtools.parallel import get_jobs, map_entries
+from pimtools.reader import ComponentReader, ParseError
 
 
 def tweakEntry(entry, options):
-    '''Actually does the vcf conversation of a single entry so that it can be imported into android contact app'''
+    '''Actually does the vcf conversation of a single entry so that it can be imported into android contact app.
+       entry is a pimtools.entry.Entry which is modified in place.'''
     result = entry
 
     if len(options.category) > 0:
-	setField(result, "CATEGORIES", options.category)
+        result.set("CATEGORIES", options.category)
 
     # android cannot handle email as telephone number
-    email = getField(result, "TEL;TYPE=email")
+    email = result.get("TEL;TYPE=email")
     if email != None:
-	setField(result, "EMAIL", email)
-	deleteField(result, "TEL;TYPE=email")
+        result.set("EMAIL", email)
+        result.delete("TEL;TYPE=email")
 
     # If the birthdayfield is a user specific field it is stored in something like "X-"
     if len(options.birthdayfieldname) > 0:
-	bday = getField(result, options.birthdayfieldname)
-	if bday != None:
-	    setField(result, "BDAY", bday)
-	    deleteField(result, options.birthdayfieldname)
+        bday = result.get(options.birthdayfieldname)
+        if bday != None:
+            result.set("BDAY", bday)
+            result.delete(options.birthdayfieldname)
     return result
 
 
+def convertEntry(lines, options):
+    '''Converts the lines of a single entry with tweakEntry() and returns the
+       resulting lines. Used to run the conversion in worker processes.'''
+    return tweakEntry(Entry(lines), options).lines()
+
+
 def writeEntryToFile(entry, file):
     '''Writes an vcf entry to an file handle. VCARD begin and end tags are appended'''
     file.write("BEGIN:VCARD\n")
@@ -118,6 +96,12 @@ def main():
             type="string", default="", action="store",
             help="All entries will have this category assigned. Existing categories are overwritten. Usefull for testing.")
 
+    parser.add_option("-j", "--jobs", dest="jobs",
+            type="int", default=1, action="store",
+            help="Number of processes converting the entries in parallel. 0 starts one process per CPU. Default is 1.")
+
+    pimtools.stats.add_options(parser)
+
     (options, args) = parser.parse_args()
 
     logging.basicConfig(format="%(message)s", level=options.debuglevel)
@@ -132,7 +116,7 @@ def main():
         sys.exit(1)
 
     try:
-        vcardFile = open(vcardFileName, "r")
+        vcardFile = open_input(vcardFileName, "r")
     except:
         logging.error("Cannot open vcf file")
         sys.exit(2)
@@ -141,39 +125,28 @@ def main():
         outputFile = sys.stdout
     else:
         try:
-            outputFile = open(options.outputfile, "w")
+            outputFile = open_output(options.outputfile, "w")
         except:
             logging.error("Cannot open output file for writing")
             sys.exit(2)
 
-    line = vcardFile.readline().replace("\n","").replace("\r","")
-
-    # An entry is an array reflecting one vcf entry, without BEGIN and END tags
-    # Usually on each line reflects another field (execpt for multiline field)
-    entry = []
-    inEntry = False # flag if we are inside one entry
-    lineNr = 1
-    while line != "":
-
-        if line.find("BEGIN:VCARD") == 0:
-            inEntry = True
-        else:
-            if line.find("END:VCARD") == 0:
-                inEntry = False
-                newEntry = tweakEntry(entry, options)
-                writeEntryToFile(newEntry, outputFile)
-                entry = []
-            else:
-                if inEntry:
-                    entry.append(line)
-                    # inside a vcalendar entry
-
-        line = vcardFile.readline().replace("\n","").replace("\r","")
-        lineNr = lineNr + 1
+    stats = pimtools.stats.Stats.from_options(options)
+    outputFile = stats.wrap_output(outputFile)
 
+    try:
+        reader = ComponentReader(stats.wrap_input(vcardFile), ("VCARD",))
+        entries = (component.lines for component in stats.components(reader))
+        newEntries = map_entries(convertEntry, entries,
+                get_jobs(options.jobs), (options,))
+        for newEntry in stats.timed(newEntries, "transform"):
+            writeEntryToFile(newEntry, outputFile)
+    except ParseError as exc:
+        logging.error("Parse error: %s" % (exc))
+        sys.exit(1)
 
     vcardFile.close()
     outputFile.close()
+    stats.report()
 
 
 if __name__ == "__main__":
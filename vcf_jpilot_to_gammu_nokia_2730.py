@@ -1,10 +1,8 @@
-#!/usr/bin/python
+#!/usr/bin/env python3
+""" vcf_jpilot_to_gammu_nokia_2730.py
+    Converts vcard file for import into Nokia 2730"""
 #
-#    vcf_jpilot_to_gammu_nokia_2730.py
-#
-#    Converts vcard file for import into Nokia 2730
-#
-#    Copyright (C) 2010 Georg Lutz <georg AT NOSPAM georglutz DOT de>
+#    Copyright (C) 2010-2020 Georg Lutz <georg AT NOSPAM georglutz DOT de>
 #
 #    This program is free software: you can redistribute it and/or modify
 #    it under the terms of the GNU General Public License as published by
@@ -19,155 +17,265 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-
+import argparse
+import codecs
 import logging
-import optparse
 import os
 import re
-import shutil
 import sys
-import types
 
-VERSIONSTRING = "0.1"
+import pimtools.stats
+from pimtools.compress import open_input
+from pimtools.parallel import get_jobs, map_entries
+from pimtools.reader import ComponentReader, ParseError
+
+VERSIONSTRING = "0.2"
+
+# jpilot output is UTF-8, nokia / gammu expect latin1
+INPUT_ENCODING = "utf-8"
+OUTPUT_ENCODING = "iso-8859-1"
+
+# Size of the output buffer in bytes
+OUTPUT_BUFFER_SIZE = 256 * 1024
+
+# Splits a property line into name, parameters and value. Continuation lines
+# do not match.
+_PROPERTY = re.compile(r"([A-Za-z0-9-]+)((?:;[^:]*)?):(.*)")
+
+# Parameters of the TEL lines jpilot writes, e.g. ";TYPE=cell,pref"
+_TEL_PARAMETERS = re.compile(r";TYPE=([a-zA-Z0-9]+)(?:,[a-zA-Z0-9]*)*$")
+
+# Parameters of NOTE lines converted
+_NOTE_PARAMETERS = re.compile(r"(?:;[a-zA-Z0-9]*)*$")
+
+# Characters nokia / gammu accept in a phone number
+_NOT_IN_NUMBER = re.compile(r"[^0-9+]")
+
 
+class _Replacements(object):
+    '''Error handler of the output codec, replaces characters which cannot
+       be encoded in latin1 by "?" and counts them'''
 
-def processNote(note, birthdayfieldname):
-    '''Processes JPilots vcard note. JPilot adds the user defined fields to the note field.
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, exc):
+        self.count += exc.end - exc.start
+        return ("?" * (exc.end - exc.start), exc.end)
+
+
+_replacements = _Replacements()
+codecs.register_error("vcf_jpilot_to_gammu_replace", _replacements)
+
+
+def process_note(note, birthday_pattern):
+    '''Processes JPilots vcard note. JPilot adds the user defined fields to
+       the note field. birthday_pattern is the compiled pattern of the
+       birthday field name (see get_birthday_pattern()) or None. Returns
+       [real_note, birthday].
        Example:
-       NOTE:Geburtstag:\n
-        1972-08-11\n
+       NOTE:Geburtstag:\\n
+        1972-08-11\\n
     '''
-    insideBirthday = False
+    if birthday_pattern is None:
+        return [note, None]
+    inside_birthday = False
     birthday = None
-    realNote = []
-    if len(birthdayfieldname) > 0:
-	for line in note:
-	    if insideBirthday:
-		insideBirthday = False
-		birthday = line.rstrip("\\n")
-	    else:
-		matchstr = "(?:^| )" + birthdayfieldname + ":\\\\n"
-		result = re.match(matchstr, line)
-		if type(result) != types.NoneType:
-		    insideBirthday = True # Next line contains birthday
-		else:
-		    realNote.append(line)
-    else:
-	realNote = note
-    return [realNote, birthday]
-
-
-########### MAIN PROGRAM #############
+    real_note = []
+    for line in note:
+        if inside_birthday:
+            inside_birthday = False
+            birthday = line.rstrip("\\n")
+        elif birthday_pattern.match(line):
+            inside_birthday = True # Next line contains birthday
+        else:
+            real_note.append(line)
+    return [real_note, birthday]
+
+
+def get_birthday_pattern(birthday_field_name):
+    '''Returns the compiled pattern matching the note line with the name of
+       the birthday user defined field, None if no name is given'''
+    if not birthday_field_name:
+        return None
+    return re.compile("(?:^| )" + birthday_field_name + ":\\\\n")
+
+
+def finish_note(note, birthday_pattern):
+    '''Returns the output lines for a complete jpilot note'''
+    result = []
+    [real_note, birthday] = process_note(note, birthday_pattern)
+    if birthday is not None:
+        result.append("BDAY:" + birthday)
+    if real_note:
+        result.append("NOTE:")
+    for line in real_note:
+        result.append(" " + line)
+    return result
+
+
+def convert_tel(parameters, value):
+    '''Returns the output line of a TEL property, None if it is kept'''
+    if parameters == ";TYPE=email":
+        return "EMAIL:" + value
+    match = _TEL_PARAMETERS.match(parameters)
+    if match is None:
+        return None
+    # nokia / gammu doesn't accept anything else - except "+" in phone number
+    return "TEL;" + match.group(1).upper() + ":" + _NOT_IN_NUMBER.sub(
+        "", value)
+
+
+def tweak_entry(entry, birthday_pattern):
+    '''Converts the lines of a single vcard entry (without BEGIN and END
+       tags) so that it can be imported into gammu / nokia phone. Returns the
+       list of output lines.'''
+    result = []
+    note = None # usually note is multiline, None outside of a note
+
+    for line in entry:
+        if note is not None:
+            if line.startswith(" "):
+                note.append(line[1:])
+                continue
+            # note ended, process note
+            result.extend(finish_note(note, birthday_pattern))
+            note = None
+
+        match = _PROPERTY.match(line)
+        if match is None:
+            result.append(line)
+            continue
+        (name, parameters, value) = match.groups()
+        if name == "VERSION":
+            if not parameters and value.startswith("3.0"):
+                line = "VERSION:2.1"
+        elif name == "TEL":
+            line = convert_tel(parameters, value) or line
+        elif name == "NOTE":
+            if _NOTE_PARAMETERS.match(parameters):
+                note = [value]
+                continue
+        result.append(line)
+
+    # A note at the end of the entry is ended by the END tag
+    if note is not None:
+        result.extend(finish_note(note, birthday_pattern))
+
+    return result
+
+
+def read_entries(jpilot_file, stats):
+    '''Generator returning a tuple (outside, lines) for each vcard entry.
+       outside are the lines in front of the entry, lines are the lines of
+       the entry without BEGIN and END tags. Lines after the last entry are
+       returned with lines set to None.'''
+    outside = []
+    reader = ComponentReader(stats.wrap_input(jpilot_file), ("VCARD",),
+                             outside=outside.append)
+    for component in stats.components(reader):
+        yield (outside[:], component.lines)
+        del outside[:]
+    if outside:
+        yield (outside, None)
+
+
+def convert_entry(entry, birthday_pattern):
+    '''Converts a tuple returned by read_entries() to the text written for
+       it. Used to run the conversion in worker processes.'''
+    (outside, lines) = entry
+    output = list(outside)
+    if lines is not None:
+        output.append("BEGIN:VCARD")
+        output.extend(tweak_entry(lines, birthday_pattern))
+        output.append("END:VCARD")
+    if not output:
+        return ""
+    return "\n".join(output) + "\n"
+
+
+def open_output(fd):
+    '''Returns a buffered text file writing latin1 to the file descriptor
+       fd, which is not closed with it. Characters which cannot be encoded
+       are replaced and counted.'''
+    return open(fd, "w", buffering=OUTPUT_BUFFER_SIZE,
+                encoding=OUTPUT_ENCODING,
+                errors="vcf_jpilot_to_gammu_replace", newline="\n",
+                closefd=False)
+
+
+def get_args():
+    '''Configures command line parser and returns parsed parameters'''
+    parser = argparse.ArgumentParser(
+        description="Converts the vcard file of jpilot for import into Nokia 2730 with gammu")
+    parser.add_argument(
+        "--version", action="version", version="%(prog)s " + VERSIONSTRING)
+    parser.add_argument(
+        "-b", "--birthday", dest="birthday", default="",
+        help="The name of the birthday user defined field (if available)")
+    parser.add_argument(
+        "-n", "--note", dest="note", default="",
+        help="The name jpilot uses for the real note, usually language dependend")
+    parser.add_argument(
+        "-d", "--debuglevel", dest="debuglevel", type=int, default=logging.WARNING,
+        help="""Sets numerical debug level, see library logging module.
+        Default is 30 (WARNING). Possible values are CRITICAL 50, ERROR 40
+        WARNING 30, INFO 20, DEBUG 10, NOTSET 0. All log messages with debuglevel
+        or above are printed. So to disable all output set debuglevel e.g. to 100.""")
+    parser.add_argument(
+        "-j", "--jobs", dest="jobs", type=int, default=1,
+        help="""Number of processes converting the entries in parallel.
+        0 starts one process per CPU. Default is 1.""")
+    pimtools.stats.add_options(parser)
+    parser.add_argument(
+        "jpilot_file_name",
+        help="The vcard file written by jpilot")
+    return parser.parse_args()
+
+
 def main():
+    '''main function, called when script file is executed directly'''
 
-    parser = optparse.OptionParser(
-	    usage="%prog [options] jpilotfile",
-	    version="%prog " + VERSIONSTRING + os.linesep +
-	    "Copyright (C) 2010 Georg Lutz <georg AT NOSPAM georglutz DOT de>",
-	    epilog = "directory: Where to store the single vcard files. vcardfile: The vcardfile to split")
-    parser.add_option("-b", "--birthday", dest="birthday",
-	    type="string", default = "",
-	    help="The name of the birthday user defined field (if available)")
-    parser.add_option("-n", "--note", dest="note",
-	    type="string", default = "",
-	    help="The name jpilot uses for the real note, usually language dependend")
-    parser.add_option("-d", "--debuglevel", dest="debuglevel",
-	    type="int", default=logging.WARNING,
-	    help="Sets numerical debug level, see library logging module. Default is 30 (WARNING). Possible values are CRITICAL 50, ERROR 40, WARNING 30, INFO 20, DEBUG 10, NOTSET 0. All log messages with debuglevel or above are printed. So to disable all output set debuglevel e.g. to 100.")
-
-    (options, args) = parser.parse_args()
-
-    logging.basicConfig(format="%(message)s", level=options.debuglevel)
-
-    if len(args) < 1:
-	parser.print_help()
-	sys.exit(2)
-
-    jpilotFileName = os.path.expanduser(args[0])
-    if not os.path.isfile(jpilotFileName):
-	logging.error("jpilotfile not found")
-	sys.exit(1)
+    args = get_args()
+
+    logging.basicConfig(format="%(message)s", level=args.debuglevel)
+
+    jpilot_file_name = os.path.expanduser(args.jpilot_file_name)
+    if not os.path.isfile(jpilot_file_name):
+        logging.error("jpilotfile not found")
+        sys.exit(1)
 
     try:
-	jpilotFile = open(jpilotFileName, "r")
-    except:
-	logging.error("Cannot open jpilotfile")
-	sys.exit(2)
-
-    inLine = jpilotFile.readline()
-
-    insideNote = True
-    note = [] # usually note is multiline
-
-    while inLine != "": # inLine contains at least \n
-	inLine = inLine.rstrip("\n\r")
-	# jpilot output is UTF-8, nokia / gammu expect latin1
-	inLine = unicode(inLine, "utf-8").encode("iso-8859-1")
-
-	complete = False
-	outLine = []
-	result = re.match("^VERSION:3.0", inLine)
-	if type(result) != types.NoneType:
-	    complete = True
-	    outLine.append("VERSION:2.1")
-	
-	# Do not check for complete here
-	if insideNote:
-	    result = re.match("^ (.*)", inLine)
-	    if type(result) != types.NoneType:
-		if len(result.groups()) == 1:
-		    note.append(result.groups()[0])
-		    complete = True
-	    else:
-		# note ended, process note
-		insideNote = False
-		[realNote, birthday] = processNote(note, options.birthday)
-		if type(birthday) != types.NoneType:
-		    outLine.append("BDAY:" + birthday)
-		if len(realNote) > 0:
-		    outLine.append("NOTE:")
-		for entry in realNote:
-		    outLine.append(" " + entry)
-		note = []
-
-	if not complete:
-	    result = re.match("^TEL;TYPE=email:(.*)", inLine)
-	    if type(result) != types.NoneType:
-	        complete = True
-		outLine.append("EMAIL:")
-		if len(result.groups()) == 1:
-		    outLine[-1] += result.groups()[0]
-	if not complete:
-	    result = re.match("^TEL;TYPE=([a-zA-Z0-9]+)(?:,[a-zA-Z0-9]*)*:(.*)", inLine)
-	    if type(result) != types.NoneType:
-		complete = True
-		outLine.append("TEL;")
-		if len(result.groups()) == 2:
-		    # nokia / gammu doesn't accept anything else - except "+" in phone number
-		    number = ""
-		    for char in result.groups()[1]:
-			if ( char >= "0" and char <= "9" ) or char == "+":
-			    number += char
-		    outLine[-1] += result.groups()[0].upper() + ":" + number
-	if not complete:
-	    result = re.match("^NOTE(?:;[a-zA-Z0-9]*)*:(.*)", inLine)
-	    if type(result) != types.NoneType:
-		complete = True
-		insideNote = True
-		if len(result.groups()) == 1:
-		    note.append(result.groups()[0])
-
-	if not complete:
-	    outLine.append(inLine)
-	for line in outLine:
-	    print line
-	inLine = jpilotFile.readline()
-
-    jpilotFile.close()
+        jpilot_file = open_input(jpilot_file_name, "r",
+                                 encoding=INPUT_ENCODING, errors="replace",
+                                 newline="")
+    except IOError:
+        logging.error("Cannot open jpilotfile")
+        sys.exit(2)
 
+    stats = pimtools.stats.Stats.from_options(args)
+    sys.stdout.flush()
+    output_file = open_output(sys.stdout.fileno())
+    counting_output = stats.wrap_output(output_file)
 
+    try:
+        entries = map_entries(convert_entry, read_entries(jpilot_file, stats),
+                              get_jobs(args.jobs),
+                              (get_birthday_pattern(args.birthday),))
+        for text in stats.timed(entries, "transform"):
+            counting_output.write(text)
+        output_file.close()
+    except ParseError as exc:
+        output_file.close()
+        logging.error("Parse error: %s", exc)
+        sys.exit(1)
+
+    jpilot_file.close()
+    if _replacements.count:
+        logging.warning("%d characters cannot be encoded in %s, replaced by ?",
+                        _replacements.count, OUTPUT_ENCODING)
+    stats.report()
 
 
 if __name__ == "__main__":
     main()
-
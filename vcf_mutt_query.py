@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+""" vcf_mutt_query.py
+    Builds an index of the mutt aliases of a vcard file and searches it,
+    to be used as mutt's query_command"""
+#
+#    Copyright (C) 2014-2020 Georg Lutz <georg AT NOSPAM georglutz DOT de>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import logging
+import os
+import sys
+
+from pimtools.compress import open_input
+from pimtools.muttindex import MuttIndex, build_mutt_index
+from pimtools.reader import ParseError
+
+
+def build(args):
+    '''Builds the index of args.vcard_file_name'''
+    if not os.path.isfile(args.vcard_file_name):
+        logging.error("vcard_file not found")
+        sys.exit(1)
+
+    try:
+        vcard_file = open_input(args.vcard_file_name, "r")
+    except IOError:
+        logging.error("Cannot open vcard file")
+        sys.exit(2)
+
+    try:
+        count = build_mutt_index(vcard_file, args.index_file_name)
+    except ParseError as exc:
+        logging.error("Parse error: %s", exc)
+        sys.exit(1)
+    except (IOError, OSError) as exc:
+        logging.error("Cannot write index file: %s", exc)
+        sys.exit(2)
+    vcard_file.close()
+    logging.info("%d addresses indexed", count)
+
+
+def query(args):
+    '''Prints the addresses found by args.query in the format expected by
+       mutt's query_command'''
+    try:
+        index = MuttIndex(args.index_file_name)
+    except IOError:
+        logging.error("Cannot read index file, create it with build")
+        sys.exit(2)
+    except ValueError as exc:
+        logging.error(exc)
+        sys.exit(1)
+
+    if args.vcard_file_name and index.is_stale(args.vcard_file_name):
+        logging.warning("%s changed, rebuild the index", args.vcard_file_name)
+
+    records = index.query(args.query)
+    index.close()
+
+    # mutt skips the first line
+    sys.stdout.write("%d addresses found\n" % (len(records)))
+    for (alias_name, full_name, address) in records:
+        sys.stdout.write("%s\t%s\t%s\n" % (address, full_name, alias_name))
+    if not records:
+        sys.exit(1)
+
+
+def get_args():
+    '''Configures command line parser and returns parsed parameters'''
+    parser = argparse.ArgumentParser(
+        description="""Builds an index of the mutt aliases of a vcard file (as
+        written by vcf_egw_to_muttalias.py) and searches it. Use query as
+        mutt's query_command.""",
+        epilog="""Example for .muttrc: set query_command =
+        "vcf_mutt_query.py -i ~/.mutt/contacts.idx query '%%s'" """)
+    parser.add_argument(
+        "-d", "--debuglevel", dest="debuglevel", type=int, default=logging.WARNING,
+        help="""Sets numerical debug level, see library logging module.
+        Default is 30 (WARNING). Possible values are CRITICAL 50, ERROR 40
+        WARNING 30, INFO 20, DEBUG 10, NOTSET 0. All log messages with debuglevel
+        or above are printed. So to disable all output set debuglevel e.g. to 100.""")
+    parser.add_argument(
+        "-i", "--index_file", dest="index_file_name", required=True,
+        help="The index file")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    build_parser = subparsers.add_parser(
+        "build", help="Builds or replaces the index of a vcard file")
+    build_parser.add_argument(
+        "vcard_file_name", help="The vcard file to index")
+    build_parser.set_defaults(function=build)
+
+    query_parser = subparsers.add_parser(
+        "query", help="""Prints the addresses with a name, organisation,
+        alias or address starting with each word of the query""")
+    query_parser.add_argument(
+        "-c", "--check", dest="vcard_file_name",
+        help="Warn if this vcard file changed since the index was built")
+    query_parser.add_argument(
+        "query", help="The words to search for")
+    query_parser.set_defaults(function=query)
+
+    return parser.parse_args()
+
+
+def main():
+    '''main function, called when script file is executed directly'''
+
+    args = get_args()
+
+    logging.basicConfig(format="%(message)s", level=args.debuglevel)
+
+    args.function(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -23,46 +23,15 @@ import optparse
 import os
 import sys
 
-
-def get_lineending(line):
-    '''Detects line ending of the given line and returns it.
-       Can be either \\n, \\r or \\r\\n.
-
-       Returns empty string if none of these is detected.
-    '''
-    # Take care to match the longest ones first:
-    possible_endings = ["\r\n", "\r", "\n"]
-    for ending in possible_endings:
-        if line.endswith(ending):
-            return ending
-    return ""
-
-
-def get_field(list_, field):
-    '''Returns the contents of the first occurence of a given VCARD field.
-       Returns None if field is not found'''
-    result = None
-    for line in list_:
-        if line.find(field + ":") == 0:
-            # split returns an empty string if nothing comes after
-            # so its safe to access [1]
-            result = line.split(":")[1]
-            break
-    return result
-
-
-def write_entry_to_file(entry, file_name, lineending):
-    '''Writes an vcard entry to an file name.
-       VCARD begin and end tags are appended
-
-       The provided line ending e.g. "\\n" is used.
-       '''
-    file_ = open(file_name, "w")
-    file_.write("BEGIN:VCARD" + lineending)
-    for line in entry:
-        file_.write(line + lineending)
-    file_.write("END:VCARD" + lineending)
-    file_.close()
+import pimtools.stats
+from pimtools.output import COLLISION_POLICIES, DEFAULT_QUEUE_DEPTH, \
+    INDEX_NAME, CompressingWriter, DirectoryWriter, NameCollisionError, \
+    NameRegistry, ShardedDirectoryWriter, ThreadedWriter, \
+    get_archive_format, open_archive, write_index
+from pimtools.api import split_vcard
+from pimtools.compress import COMPRESSIONS, can_append, get_extension, \
+    is_compressed, open_input
+from pimtools.reader import ParseError
 
 
 def main():
@@ -83,6 +52,57 @@ Default is 30 (WARNING). Possible values are CRITICAL 50, ERROR 40, WARNING 30,
 INFO 20, DEBUG 10, NOTSET 0. All log messages with debuglevel or above are
 printed. So to disable all output set debuglevel e.g. to 100.""")
 
+    parser.add_option(
+        "-m", "--mmap", dest="mmap",
+        default=False, action="store_true",
+        help="""Map vcardFile into memory and scan it for entries instead
+of reading it line by line. Faster for large files.""")
+
+    parser.add_option(
+        "-a", "--archive", dest="archive",
+        default=False, action="store_true",
+        help="""Write all entries into the tar or zip archive outdir
+instead of single files into the directory outdir. The format is chosen by the
+extension: .tar, .tar.gz, .tgz, .tar.bz2, .tar.xz or .zip.""")
+
+    parser.add_option(
+        "-z", "--compress", dest="compress",
+        type="choice", choices=COMPRESSIONS, default=None,
+        help="""Compress each file with gzip, bz2 or xz and append .gz,
+.bz2 or .xz to its name. Not supported with --archive, use a compressed archive
+instead.""")
+
+    parser.add_option(
+        "-t", "--threads", dest="threads",
+        type="int", default=1,
+        help="""Number of threads writing the single files in parallel.
+Helps on network file systems. Not supported with --archive. Default is 1.""")
+
+    parser.add_option(
+        "--queue-depth", dest="queue_depth",
+        type="int", default=DEFAULT_QUEUE_DEPTH,
+        help="""Maximum number of files waiting per thread with
+--threads. Default is %d.""" % (DEFAULT_QUEUE_DEPTH))
+
+    parser.add_option(
+        "-c", "--on-collision", dest="on_collision",
+        type="choice", choices=COLLISION_POLICIES, default="fail",
+        help="""What to do if two entries have the same UID or the file
+already exists: "fail" stops with an error, "suffix" appends a number to the
+file name and "group" writes all entries with the same UID into one file.
+"group" is not supported with --archive. Default is fail.""")
+
+    parser.add_option(
+        "-s", "--shard-depth", dest="shard_depth",
+        type="int", default=0,
+        help="""Write the files into SHARD_DEPTH levels of subdirectories
+named by the first hex digits of a hash of the UID, e.g. outdir/ab/cd/UID.vcf
+for 2, and an index file outdir/%s with the UID and path of each file. Not
+supported with --archive. Default is 0, all files are written into outdir."""
+        % (INDEX_NAME))
+
+    pimtools.stats.add_options(parser)
+
     (options, args) = parser.parse_args()
 
     logging.basicConfig(format="%(message)s", level=options.debuglevel)
@@ -97,55 +117,104 @@ printed. So to disable all output set debuglevel e.g. to 100.""")
         sys.exit(1)
 
     outdir = os.path.expanduser(args[1])
-    if not os.path.isdir(outdir):
+    if options.archive:
+        try:
+            get_archive_format(outdir)
+        except ValueError as exc:
+            logging.error(exc)
+            sys.exit(1)
+        if options.threads > 1:
+            logging.error("--threads is not supported with --archive")
+            sys.exit(1)
+        if options.shard_depth > 0:
+            logging.error("--shard-depth is not supported with --archive")
+            sys.exit(1)
+        if options.compress:
+            logging.error("--compress is not supported with --archive")
+            sys.exit(1)
+        if options.on_collision == "group":
+            logging.error(
+                "--on-collision group is not supported with --archive")
+            sys.exit(1)
+    elif not os.path.isdir(outdir):
         logging.error("outdir not found")
         sys.exit(1)
 
+    if options.on_collision == "group" and options.compress and \
+            not can_append(options.compress):
+        logging.error("--on-collision group with --compress %s needs Python 3"
+                % (options.compress))
+        sys.exit(1)
+
+    if options.shard_depth < 0 or options.shard_depth > 20:
+        logging.error("--shard-depth must be between 0 and 20")
+        sys.exit(1)
+
     try:
-        vcard_file = open(vcard_file_name, "r")
-    except:
-        logging.error("Cannot open vcard file")
+        # Keep CRLF line endings with python 3 like --mmap does
+        vcard_file = open_input(vcard_file_name, "r", newline="")
+    except (IOError, OSError) as exc:
+        logging.error("Cannot open vcard file: %s" % (exc))
         sys.exit(2)
 
-    # An entry is an array reflecting one vcard entry, without BEGIN and
-    # END tags.
-    # Usually on each line reflects another field (execpt for multiline field)
-    entry = []
-    in_entry = False # flag if we are inside one vcard
-    no_uid_counter = 0 # vcard entries with no UID field
-    lineending = ""
-    for line in vcard_file:
-        if len(lineending) == 0:
-            lineending = get_lineending(line) # keep same line endings
-        line = line.replace("\n", "").replace("\r", "")
-
-        if line.find("BEGIN:VCARD") == 0:
-            in_entry = True
-        else:
-            if line.find("END:VCARD") == 0:
-                in_entry = False
-                outfile_name = get_field(entry, "UID")
-                if outfile_name is None:
-                    no_uid_counter = no_uid_counter + 1
-                    outfile_name = "nouid_%03d" % (no_uid_counter)
-                outfile_name += ".vcf"
-                outfile_path = os.path.join(outdir, outfile_name)
-                if os.path.exists(outfile_path):
-                    msg = "UID collision, file %s already exists." % (
-                        outfile_path)
-                    msg += " Exit."
-                    logging.error(msg)
-                    sys.exit(1)
-
-                write_entry_to_file(entry, outfile_path, lineending)
-                entry = []
-            else:
-                if in_entry:
-                    entry.append(line)
-                    # inside a vcard entry
+    if options.mmap and is_compressed(vcard_file):
+        logging.info("vcardFile is compressed, reading it line by line")
+        options.mmap = False
+
+    if options.archive:
+        try:
+            writer = open_archive(outdir)
+        except (IOError, OSError):
+            logging.error("Cannot open archive for writing")
+            sys.exit(2)
+    elif options.shard_depth > 0:
+        sharded_writer = ShardedDirectoryWriter(outdir, options.shard_depth)
+        writer = sharded_writer
+    else:
+        writer = DirectoryWriter(outdir)
+
+    extension = ""
+    if options.compress:
+        writer = CompressingWriter(writer, options.compress)
+        extension = get_extension(options.compress)
 
+    if options.threads > 1:
+        writer = ThreadedWriter(writer, options.threads,
+                                options.queue_depth)
+
+    registry = NameRegistry(writer, options.on_collision)
+
+    stats = pimtools.stats.Stats.from_options(options)
+
+    index = set() # (UID, relative path) for --shard-depth
+    try:
+        for (outfile_name, uid, data) in split_vcard(vcard_file, options.mmap,
+                                                     stats):
+            with stats.phase("write"):
+                used_name = registry.write(outfile_name, data)
+            if used_name != outfile_name:
+                logging.warning("UID collision, writing %s instead of %s" % (
+                    used_name, outfile_name))
+            if options.shard_depth > 0 and uid is not None:
+                index.add((uid, sharded_writer.relative_path(
+                    used_name + extension)))
+            stats.bytes_out += len(data)
+        with stats.phase("write"):
+            writer.close()
+            if options.shard_depth > 0:
+                write_index(index, os.path.join(outdir, INDEX_NAME))
+    except NameCollisionError as exc:
+        logging.error("UID collision, file %s already exists. Exit." % (exc))
+        sys.exit(1)
+    except ParseError as exc:
+        logging.error("Parse error: %s" % (exc))
+        sys.exit(1)
+    except (IOError, OSError) as exc:
+        logging.error("Cannot write file: %s" % (exc))
+        sys.exit(2)
 
     vcard_file.close()
+    stats.report()
 
 
 if __name__ == "__main__":